@@ -90,6 +90,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Provisioning workers and bulk onboarding write concurrently. IMMEDIATE takes the write lock when a
+        # transaction starts, so writers wait (up to timeout seconds) instead of failing with 'database is locked'
+        # when a transaction that has read tries to write (tests/onboarding_benchmark.py: 169-199 of 300 jobs
+        # failed in the default DEFERRED mode, none with IMMEDIATE). Only transaction.atomic() blocks are
+        # affected; the other queries of a request run in autocommit mode as before.
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
     },
     # 'default': {
     #     'ENGINE': 'django.db.backends.postgresql',
@@ -101,6 +107,20 @@ DATABASES = {
     # }
 }
 
+# Shared by all gunicorn workers, so invalidating an entry in one worker is seen by the others
+# (the default local-memory cache is per process)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    }
+}
+# Seconds the measurement and tag lists of a bucket are cached (see InfluxDataManager)
+INFLUX_METADATA_CACHE_SECONDS = 120
+# Only offer the tags of series written within this window (e.g. '30d') in the tag select; None looks at all
+# data. A request can pass its own ?window= (see ajax_get_tags).
+INFLUX_TAG_PAIRS_WINDOW = None
+
 AUTH_USER_MODEL = 'users.CustomUser'
 
 AUTHENTICATION_BACKENDS = [  # first successful auth backend will authenticate the user
@@ -185,6 +205,14 @@ MEDIA_ROOT = '/var/www/biomed-iot/media/'
 MEDIA_DEVELOPMENT = BASE_DIR / 'media'
 MEDIA_URL = '/media/'
 
+# Background exports (see users/services/export_jobs.py). The files are not public: Django checks the user and
+# nginx sends the file (X-Accel-Redirect to the internal location EXPORT_JOBS_INTERNAL_URL -> EXPORT_JOBS_ROOT).
+EXPORT_JOBS_ROOT = os.path.join(MEDIA_ROOT, 'exports')
+EXPORT_JOBS_INTERNAL_URL = '/protected-exports/'
+EXPORT_JOBS_X_ACCEL = not DEBUG  # the development server sends the file itself
+EXPORT_JOBS_TTL_HOURS = 24
+EXPORT_JOBS_MAX_ACTIVE_PER_USER = 2
+
 LOGIN_REDIRECT_URL = 'core-home'
 LOGIN_URL = 'login'
 # LOGIN_URL='/admin/login/' # LOGIN_URL auf admin/login nur vorrübergehend für OAuth setup
@@ -50,6 +50,7 @@ urlpatterns = [
     path('manage-data/', user_views.manage_data, name='manage-data'),
     path('delete-data/', user_views.delete_data, name='delete-data'),
     path("download-data/", user_views.download_data, name="download-data"),
+    path("download-export/<int:job_id>/", user_views.download_export, name="download-export"),
 
     path('visualize/', user_views.visualize, name='visualize'),
     path('get-grafana/', user_views.get_grafana, name='get-grafana'),
@@ -100,6 +101,8 @@ urlpatterns = [
     path('', include('core.urls')),
 
     path("ajax/tags/", user_views.ajax_get_tags, name="ajax_get_tags"),
+    path("ajax/tags/search/", user_views.ajax_search_tags, name="ajax_search_tags"),
+    path("ajax/export-jobs/", user_views.ajax_export_jobs, name="ajax_export_jobs"),
 ]
 
 if settings.DEBUG:
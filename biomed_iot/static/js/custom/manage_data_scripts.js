@@ -3,27 +3,60 @@ $(function(){
     const $tags   = $("#id_tags");
     const $toggle = $("#toggle-tags");
   
-    const ajaxGetTagsUrl = $("#data-endpoints").data("ajax-get-tags-url");
+    const $search = $("#tag-search");
+    const $more   = $("#more-tags");
+    const $count  = $("#tag-count");
+  
+    const ajaxSearchTagsUrl = $("#data-endpoints").data("ajax-search-tags-url");
+    const pageSize = 100;
+    let nextOffset = null;
+    let searchTimer = null;
+    let request = null;
   
     $toggle.data("allSelected", false);
   
+    // Load one page of matching tags. A new search keeps the options already selected.
+    function loadTags(append){
+      const meas = $meas.val();
+      if (!meas) return;
+      if (request) request.abort();  // only the latest search may fill the list
+      const offset = append ? nextOffset : 0;
+  
+      request = $.get(ajaxSearchTagsUrl, {
+          measurement: meas, q: $search.val(), limit: pageSize, offset: offset
+        })
+       .done(function(data){
+         if (!append) $tags.find("option:not(:selected)").remove();
+         const present = new Set($tags.find("option").map(function(){ return this.value; }).get());
+         data.tags.forEach(function(tag){
+           if (!present.has(tag)) $("<option>").val(tag).text(tag).appendTo($tags);
+         });
+         nextOffset = data.next_offset;
+         $more.prop("hidden", nextOffset === null);
+         $count.text(data.total + " matching tag(s)");
+         $toggle.prop("disabled", false);
+       });
+    }
+  
     $meas.on("change", function(){
       $tags.empty();
+      $search.val("").prop("disabled", !$(this).val());
+      $more.prop("hidden", true);
+      $count.text("");
       $toggle
         .prop("disabled", true)
         .text("Select All Tags")
         .data("allSelected", false);
+      loadTags(false);
+    });
   
-      const meas = $(this).val();
-      if (!meas) return;
+    $search.on("input", function(){
+      clearTimeout(searchTimer);
+      searchTimer = setTimeout(function(){ loadTags(false); }, 250);
+    });
   
-      $.get(ajaxGetTagsUrl, { measurement: meas })
-       .done(function(data){
-         data.tags.forEach(function(tag){
-           $("<option>").val(tag).text(tag).appendTo($tags);
-         });
-         $toggle.prop("disabled", false);
-       });
+    $more.on("click", function(){
+      loadTags(true);
     });
   
     $toggle.on("click", function(){
@@ -48,5 +81,38 @@ $(function(){
       $opt.prop('selected', !$opt.prop('selected'));
       $tags.trigger('change');
     });
+
+    // Background exports: refresh the list while one is pending or running
+    const $exportJobs = $("#export-jobs");
+    const ajaxExportJobsUrl = $("#data-endpoints").data("ajax-export-jobs-url");
+
+    function formatBytes(bytes){
+      const units = ["bytes", "KB", "MB", "GB", "TB"];
+      let i = 0;
+      while (bytes >= 1024 && i < units.length - 1) { bytes /= 1024; i++; }
+      return (i ? bytes.toFixed(1) : bytes) + " " + units[i];
+    }
+
+    function exportsInProgress(){
+      return $exportJobs.find("tr[data-status='pending'], tr[data-status='running']").length > 0;
+    }
+
+    function refreshExportJobs(){
+      $.get(ajaxExportJobsUrl).done(function(data){
+        $exportJobs.empty();
+        data.jobs.forEach(function(job){
+          const $row = $("<tr>").attr("data-status", job.status);
+          $("<td>").text(job.created_at).appendTo($row);
+          $("<td>").text(job.status_display + (job.error ? " – " + job.error : "")).appendTo($row);
+          $("<td>").text(formatBytes(job.bytes_written)).appendTo($row);
+          const $file = $("<td>").appendTo($row);
+          if (job.download_url) $("<a>").attr("href", job.download_url).text("📥 " + job.filename).appendTo($file);
+          $row.appendTo($exportJobs);
+        });
+        if (exportsInProgress()) setTimeout(refreshExportJobs, 3000);
+      });
+    }
+
+    if (exportsInProgress()) setTimeout(refreshExportJobs, 3000);
   });
   
\ No newline at end of file
@@ -1,6 +1,12 @@
 from core.admin_site import admin_site
 from django.contrib import admin
-from .models import CustomUser, Profile, NodeRedUserData, MqttClient, MqttMetaData, InfluxUserData
+from .models import (
+    CustomUser, Profile, NodeRedUserData, MqttClient, MqttMetaData, InfluxUserData, ProvisioningJob, ExportJob
+)
+from .services.mosquitto_utils import get_dynsec_mirror
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class ProfileAdmin(admin.ModelAdmin):
@@ -10,7 +16,16 @@ class NodeRedUserDataAdmin(admin.ModelAdmin):
     list_display = ('user', 'container_name', 'container_port', 'username', 'password', 'access_token')
 
 class MqttClientAdmin(admin.ModelAdmin):
-    list_display = ('user', 'username', 'password', 'textname', 'rolename')
+    list_display = ('user', 'username', 'password', 'textname', 'rolename', 'on_broker')
+
+    @admin.display(boolean=True, description='On broker')
+    def on_broker(self, obj):
+        # served from the in-process mirror, so listing many clients costs no broker round trips
+        try:
+            return get_dynsec_mirror().get_client(obj.username) is not None
+        except Exception as e:
+            logger.error(f'Error reading DynSec mirror: {e}')
+            return None
 
 class MqttMetaDataAdmin(admin.ModelAdmin):
     list_display = ('user', 'user_topic_id', 'nodered_role_name', 'device_role_name')
@@ -18,6 +33,16 @@ class MqttMetaDataAdmin(admin.ModelAdmin):
 class InfluxUserDataAdmin(admin.ModelAdmin):
     list_display = ('user', 'bucket_name', 'bucket_id', 'bucket_token', 'bucket_token_id')
 
+class ProvisioningJobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'user', 'status', 'attempts', 'completed_steps', 'run_after', 'locked_by', 'updated_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('created_at', 'updated_at')
+
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('user', 'status', 'filename', 'bytes_written', 'created_at', 'finished_at', 'expires_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at',)
+
 # use custom admin_site instead of admin.site
 admin_site.register(CustomUser)
 admin_site.register(Profile, ProfileAdmin)
@@ -25,3 +50,5 @@ admin_site.register(NodeRedUserData, NodeRedUserDataAdmin)
 admin_site.register(MqttClient, MqttClientAdmin)
 admin_site.register(MqttMetaData, MqttMetaDataAdmin)
 admin_site.register(InfluxUserData, InfluxUserDataAdmin)
+admin_site.register(ProvisioningJob, ProvisioningJobAdmin)
+admin_site.register(ExportJob, ExportJobAdmin)
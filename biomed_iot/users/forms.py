@@ -7,6 +7,7 @@ from datetime import timezone as dt_tz
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from .models import Profile, CustomUser
 from .services.influx_data_utils import InfluxDataManager
+from .services.export_formats import format_available, compression_available
 from django.utils.translation import gettext_lazy as _
 
 
@@ -71,6 +72,53 @@ class SelectDataForm(forms.Form):
         widget=forms.SelectMultiple,
         help_text="Select one or more (key=value).",
     )
+    field_names = forms.CharField(
+        label="Fields (Download only. Leave empty to download all fields.)",
+        max_length=1000,
+        required=False,
+        help_text="Comma separated, e.g. temperature,humidity",
+    )
+    layout = forms.ChoiceField(
+        label="CSV Layout",
+        choices=[
+            ("long", "One row per value (time, field, value, tags)"),
+            ("wide", "One row per timestamp, a column per field"),
+        ],
+        initial="long",
+        required=False,
+        widget=forms.RadioSelect,
+    )
+    export_format = forms.ChoiceField(
+        label="File Format",
+        choices=[
+            ("csv", "CSV"),
+            ("parquet", "Parquet (typed columns, compressed, one row per timestamp)"),
+            ("arrow", "Arrow IPC stream (typed columns, compressed, one row per timestamp)"),
+            ("npz", "NumPy .npz (one array per column, one row per timestamp)"),
+        ],
+        initial="csv",
+        required=False,
+    )
+    compression = forms.ChoiceField(
+        label="Compression",
+        choices=[
+            ("none", "None"),
+            ("gzip", "gzip (.gz)"),
+            ("zstd", "zstd (.zst, fastest)"),
+            ("zip", "ZIP archive"),
+        ],
+        initial="none",
+        required=False,
+        help_text="CSV files become about 5-10 times smaller. Parquet and Arrow files are compressed already.",
+    )
+    parallel = forms.BooleanField(
+        label="Query time slices in parallel (faster for time ranges of days or more)",
+        required=False,
+    )
+    background = forms.BooleanField(
+        label="Export in the background (for large exports; download the file below when it is ready)",
+        required=False,
+    )
 
     def __init__(self, measurements_choices, *args, **kwargs):
         user = kwargs.pop("user")            # pass request.user into the form
@@ -80,6 +128,13 @@ class SelectDataForm(forms.Form):
         placeholder = [("", "-- Select Measurement --")]
         self.fields["measurement"].choices = placeholder + [(m, m) for m in measurements_choices]
         self.fields["measurement"].initial = ""
+        # only the formats whose optional library (pyarrow, numpy) is installed
+        self.fields["export_format"].choices = [
+            (value, label) for value, label in self.fields["export_format"].choices if format_available(value)
+        ]
+        self.fields["compression"].choices = [
+            (value, label) for value, label in self.fields["compression"].choices if compression_available(value)
+        ]
 
         # tags start empty; if form is bound with a measurement, pre-populate
         self.fields["tags"].choices = []
@@ -88,6 +143,10 @@ class SelectDataForm(forms.Form):
             mgr = InfluxDataManager(user)
             pairs = mgr.list_tag_pairs(meas)
             self.fields["tags"].choices = [(p, p) for p in pairs]
+            # validate against all pairs, but only render the selected ones (the rest is loaded by search)
+            known = set(pairs)
+            selected = self.data.getlist("tags") if hasattr(self.data, "getlist") else []
+            self.fields["tags"].widget.choices = [(p, p) for p in selected if p in known]
 
     def clean_measurement(self):
         val = self.cleaned_data["measurement"]
@@ -108,6 +167,22 @@ class SelectDataForm(forms.Form):
             out[k] = v
         return out
 
+    def clean_field_names(self):
+        """
+        Convert 'temperature, humidity' into ['temperature', 'humidity'].
+        """
+        raw = self.cleaned_data["field_names"]
+        return [name.strip() for name in raw.split(",") if name.strip()]
+
+    def clean_layout(self):
+        return self.cleaned_data["layout"] or "long"
+
+    def clean_export_format(self):
+        return self.cleaned_data["export_format"] or "csv"
+
+    def clean_compression(self):
+        return self.cleaned_data["compression"] or "none"
+
     def clean_start_time(self):
         # start_time = self.cleaned_data['start_time']
         # return start_time.strftime('%Y-%m-%dT%H:%M:%SZ')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from users.services.influx_data_utils import export_stats
+
+
+class Command(BaseCommand):
+    help = 'Show how many data exports completed, were cancelled (client disconnected), were empty or failed.'
+
+    def handle(self, *args, **options):
+        for outcome, count in export_stats().items():
+            self.stdout.write(f'{outcome}: {count}')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from users.services.export_jobs import ExportWorker
+
+
+class Command(BaseCommand):
+    help = 'Run the background worker that writes data exports to files and deletes expired ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process all pending exports, then exit.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds between polls when nothing is pending (default: 1).',
+        )
+        parser.add_argument('--worker-id', default=None, help='Name in locked_by (default: hostname-pid).')
+
+    def handle(self, *args, **options):
+        worker = ExportWorker(worker_id=options['worker_id'])
+        try:
+            worker.run(once=options['once'], poll_interval=options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Export worker stopped.')
@@ -0,0 +1,85 @@
+import csv
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from users.models import ProvisioningJob
+from users.services.onboarding import read_user_rows, bulk_create_users
+from users.services.provisioning import ProvisioningWorker
+
+
+class Command(BaseCommand):
+    help = (
+        'Create users from a CSV file (columns: username, email and optionally password, first_name, last_name) '
+        'and provision their MQTT, InfluxDB and Grafana accounts with bounded concurrency per backend.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='CSV file with a header row.')
+        parser.add_argument(
+            '--email-confirmed', action='store_true', help='Mark the email addresses as verified (no email is sent).'
+        )
+        parser.add_argument('--mqtt-concurrency', type=int, default=8, help='Parallel MQTT steps (default: 8).')
+        parser.add_argument('--influxdb-concurrency', type=int, default=4, help='Parallel InfluxDB steps (default: 4).')
+        parser.add_argument('--grafana-concurrency', type=int, default=4, help='Parallel Grafana steps (default: 4).')
+        parser.add_argument(
+            '--output', help='Write a CSV with username, email, password and result per user (contains passwords!).'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as csv_file:
+                rows = read_user_rows(csv_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {options["csv_file"]}: {e}')
+
+        step_limits = {
+            'mqtt': options['mqtt_concurrency'],
+            'influxdb': options['influxdb_concurrency'],
+            'grafana': options['grafana_concurrency'],
+        }
+        worker = ProvisioningWorker(step_limits=step_limits)
+        created = bulk_create_users(rows, email_confirmed=options['email_confirmed'], worker_id=worker.worker_id)
+        created_at = time.monotonic()
+        self.stdout.write(f'{len(created)} of {len(rows)} user(s) created ({created_at - started:.1f} s)')
+
+        results = worker.run_jobs([job for _, job in created], max_workers=sum(step_limits.values()))
+        for (row, _), (job, status) in zip(created, results):
+            if status == ProvisioningJob.STATUS_DONE:
+                row['result'] = 'provisioned'
+            else:
+                # left to the provisioning workers, which retry it with backoff
+                row['result'] = f'provisioning {status}'
+                row['error'] = f'{job.last_error} (steps done: {", ".join(job.completed_steps) or "none"})'
+
+        self._report_rows(rows, options['verbosity'])
+        if options['output']:
+            self._write_output(options['output'], rows)
+
+        elapsed = time.monotonic() - started
+        rate = len(created) / max(time.monotonic() - created_at, 1e-9)
+        counts = Counter(row['result'] for row in rows)
+        for result, count in sorted(counts.items()):
+            self.stdout.write(f'{result}: {count}')
+        summary = f'{counts["provisioned"]} of {len(rows)} user(s) onboarded in {elapsed:.1f} s ({rate:.1f} users/s).'
+        if counts['provisioned'] != len(rows):
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def _report_rows(self, rows, verbosity):
+        for row in rows:
+            if row['error'] and 'result' not in row:
+                row['result'] = 'rejected'  # invalid, duplicate or already existing
+            line = f'  line {row["line"]}: {row["username"]} <{row["email"]}>: {row["result"]}'
+            if row['error']:
+                self.stderr.write(f'{line} - {row["error"]}')
+            elif verbosity > 1:
+                self.stdout.write(line)
+
+    @staticmethod
+    def _write_output(path, rows):
+        with open(path, 'w', newline='', encoding='utf-8') as output_file:
+            writer = csv.writer(output_file)
+            writer.writerow(['username', 'email', 'password', 'result', 'error'])
+            for row in rows:
+                writer.writerow([row['username'], row['email'], row['password'], row['result'], row['error'] or ''])
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from users.services.provisioning import ProvisioningWorker
+
+
+class Command(BaseCommand):
+    help = 'Run the background worker that creates the MQTT, InfluxDB and Grafana accounts of new users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process all due jobs, then exit.')
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0, help='Seconds between polls when no job is due (default: 1).'
+        )
+        parser.add_argument('--worker-id', default=None, help='Name in locked_by (default: hostname-pid).')
+
+    def handle(self, *args, **options):
+        worker = ProvisioningWorker(worker_id=options['worker_id'])
+        try:
+            worker.run(once=options['once'], poll_interval=options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Provisioning worker stopped.')
@@ -0,0 +1,69 @@
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
+from users.services.mosquitto_reconcile import MqttReconciler
+
+
+class Command(BaseCommand):
+    help = 'Compare MQTT clients and roles in the database with the Mosquitto Dynamic Security Plugin and fix drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the differences, change nothing.')
+        parser.add_argument(
+            '--delete-orphans',
+            action='store_true',
+            help=(
+                'Also delete clients and Biomed IoT roles that exist on the broker but not in the database, and '
+                'control clients of processes that no longer run.'
+            ),
+        )
+        parser.add_argument('--batch-size', type=int, default=200, help='Commands sent per publish (default: 200).')
+        parser.add_argument('--page-size', type=int, default=500, help='Entries per broker listing (default: 500).')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        reconciler = MqttReconciler(
+            delete_orphans=options['delete_orphans'],
+            page_size=options['page_size'],
+            batch_size=options['batch_size'],
+        )
+        try:
+            actions = reconciler.plan()
+        except ConnectionError as e:
+            raise CommandError(f'Could not read the broker state: {e}')
+
+        self._report(reconciler, actions, options)
+
+        if not actions:
+            self.stdout.write(self.style.SUCCESS(f'Database and broker match ({time.monotonic() - started:.1f} s).'))
+            return
+        if options['dry_run']:
+            self.stdout.write(f'Dry run, {len(actions)} action(s) not applied.')
+            return
+
+        results = reconciler.apply(actions)
+        failed = [action for action, success in results if not success]
+        for kind, name, _ in failed:
+            self.stderr.write(f'  failed: {kind} {name}')
+        elapsed = time.monotonic() - started
+        summary = f'{len(results) - len(failed)} of {len(results)} action(s) applied ({elapsed:.1f} s).'
+        if failed:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def _report(self, reconciler, actions, options):
+        for kind, count in sorted(Counter(action[0] for action in actions).items()):
+            self.stdout.write(f'{kind}: {count}')
+        if options['verbosity'] > 1:
+            for kind, name, _ in actions:
+                self.stdout.write(f'  {kind} {name}')
+        if not options['delete_orphans']:
+            for label, orphans in (
+                ('client(s) only on the broker', reconciler.orphan_clients),
+                ('role(s) only on the broker', reconciler.orphan_roles),
+                ('control client(s) of processes that no longer run', reconciler.stale_control_clients),
+            ):
+                if orphans:
+                    self.stdout.write(f'{len(orphans)} {label} (use --delete-orphans):')
+                    for name in orphans:
+                        self.stdout.write(f'  {name}')
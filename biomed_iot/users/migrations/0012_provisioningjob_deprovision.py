@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 02:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_provisioningjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='provisioningjob',
+            name='kind',
+            field=models.CharField(choices=[('provision', 'Provision user'), ('deprovision', 'Deprovision user')], max_length=20),
+        ),
+    ]
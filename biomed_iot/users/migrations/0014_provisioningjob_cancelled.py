@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 02:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_exportjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='provisioningjob',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=10),
+        ),
+    ]
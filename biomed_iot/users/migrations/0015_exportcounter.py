@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-17 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_provisioningjob_cancelled'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('outcome', models.CharField(max_length=20, unique=True)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
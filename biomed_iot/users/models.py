@@ -7,6 +7,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils.translation import gettext_lazy as _  # for automatic translation in case if it is implemented later
 from django.conf import settings
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
@@ -185,3 +186,107 @@ class InfluxUserData(models.Model):
                 return new_name
         logger.error('Failed to generate unique bucket name after maximum attempts')
         return None
+
+
+class ProvisioningJob(models.Model):
+    """
+    Durable background job creating or deleting the external service accounts of a user.
+
+    Jobs are created by the user signals and run by 'manage.py provisioning_worker' (see services/provisioning.py).
+    Steps that succeeded are recorded in completed_steps, so a retry only runs the remaining ones.
+    """
+    KIND_PROVISION = 'provision'
+    KIND_DEPROVISION = 'deprovision'
+    KIND_CHOICES = [
+        (KIND_PROVISION, 'Provision user'),
+        (KIND_DEPROVISION, 'Deprovision user'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'  # its user was deleted before it finished
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+        (STATUS_CANCELLED, 'Cancelled'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # SET_NULL: the job (and its status) outlives the user. Deprovisioning jobs find everything in payload,
+    # provisioning jobs record there what their steps created (see services/provisioning.py).
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='provisioning_jobs'
+    )
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=8)
+    run_after = models.DateTimeField(default=timezone.now)
+    completed_steps = models.JSONField(default=list, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
+
+
+class ExportJob(models.Model):
+    """
+    Data export written to a file in the background, for exports too large to stream in a request.
+
+    Jobs are created by the manage-data page and run by 'manage.py export_worker' (see services/export_jobs.py).
+    The file is kept below settings.EXPORT_JOBS_ROOT until expires_at; then the worker deletes it and the job.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='export_jobs')
+    # keyword arguments of InfluxDataManager.export_stream
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    filename = models.CharField(max_length=255, blank=True, default='')  # download name
+    file_path = models.CharField(max_length=255, blank=True, default='')  # relative to EXPORT_JOBS_ROOT
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    bytes_written = models.PositiveBigIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)  # also the heartbeat of a running job
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+    def __str__(self):
+        return f'export #{self.pk} of {self.user} ({self.status})'
+
+
+class ExportCounter(models.Model):
+    """
+    Number of data exports per outcome, shared by all processes (see export_stats in services/influx_data_utils.py).
+    Incremented with an UPDATE ... SET count = count + 1, so concurrent exports don't lose counts.
+    """
+    outcome = models.CharField(max_length=20, unique=True)
+    count = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.outcome}: {self.count}'
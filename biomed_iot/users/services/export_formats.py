@@ -0,0 +1,378 @@
+"""
+Columnar export formats (Parquet, Arrow IPC stream, NumPy .npz), built batch by batch from pivoted
+(wide) Flux records, so memory stays bounded however long the time range is, and streaming
+compression (gzip, zstd, ZIP) of any export.
+
+pyarrow (Parquet, Arrow), numpy (.npz) and zstandard (zstd) are optional, imported on first use:
+    pip install pyarrow numpy zstandard
+Formats and compressions whose module is missing are not offered (see format_available).
+"""
+
+from __future__ import annotations
+
+import io
+import zlib
+import operator
+import zipfile
+import tempfile
+import importlib.util
+from typing import Any, Iterator
+
+# records per batch (one Parquet row group / Arrow record batch each)
+EXPORT_BATCH_ROWS = 50_000
+# export format -> (content type, file extension, optional module it needs)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv", None),
+    "parquet": ("application/vnd.apache.parquet", "parquet", "pyarrow"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows", "pyarrow"),
+    "npz": ("application/octet-stream", "npz", "numpy"),
+}
+# compression -> (content type, file extension appended, optional module it needs)
+EXPORT_COMPRESSIONS = {
+    "none": (None, None, None),
+    "gzip": ("application/gzip", "gz", None),
+    "zstd": ("application/zstd", "zst", "zstandard"),
+    "zip": ("application/zip", "zip", None),
+}
+# compressed output is passed on once this much has collected (and at the end)
+COMPRESSED_CHUNK_BYTES = 64 * 1024
+_COPY_BLOCK_BYTES = 1024 * 1024
+
+
+class NoDataError(Exception):
+    """Raised by the export writers (and the CSV generators of InfluxDataManager) when the query returned no rows."""
+
+
+def format_available(export_format: str) -> bool:
+    """True if the module the format needs is installed."""
+    module = EXPORT_FORMATS[export_format][2]
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def compression_available(compression: str) -> bool:
+    """True if the module the compression needs is installed."""
+    module = EXPORT_COMPRESSIONS[compression][2]
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable write-only file that keeps what is written until take() is called."""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.position = 0
+        self.taken = 0  # position at the last take()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        self.taken = self.position
+        return data
+
+
+# column kind -> the Python type of its values
+_KIND_TYPES = {"bool": bool, "int": int, "float": float, "string": str}
+
+
+def column_kind(values: list[Any]) -> str:
+    """'bool', 'int', 'float' (also for ints mixed with floats) or 'string' for the values, None is ignored."""
+    types = {value.__class__ for value in values if value is not None}
+    if types == {bool}:
+        return "bool"
+    if types == {int}:
+        return "int"
+    if types and types <= {int, float}:
+        return "float"
+    return "string"  # strings, mixed types or only nulls; strings can take any value
+
+
+def _batches(
+    record_stream: Iterator[Any], tag_keys: set[str], field_kinds: dict[str, str], keys: list[str] | None
+) -> Iterator[tuple[list[tuple[str, str]], list]]:
+    """
+    Group pivoted records into batches of EXPORT_BATCH_ROWS.
+    Yields (columns, values): columns is [(name, kind)] with time first, then the tags and then the fields
+    (each sorted), those of the first record or keys; values holds one list (tuple) per column.
+    The kind of a field comes from field_kinds, or else from its values in the first batch.
+    """
+    columns = None
+    row_values = None
+    rows: list[tuple] = []
+    for record in record_stream:
+        values = record.values
+        if row_values is None:
+            if keys is None:
+                keys = [key for key in values if key not in {"result", "table"} and not key.startswith("_")]
+            names = [
+                "_time",
+                *sorted(key for key in keys if key in tag_keys),
+                *sorted(key for key in keys if key not in tag_keys),
+            ]
+            row_values = operator.itemgetter(*names)
+        try:
+            rows.append(row_values(values))
+        except KeyError:  # a column this record's window doesn't have (parallel export)
+            rows.append(tuple(values.get(name) for name in names))
+        if len(rows) >= EXPORT_BATCH_ROWS:
+            batch = list(zip(*rows))
+            if columns is None:
+                columns = _batch_columns(names, tag_keys, field_kinds, batch)
+            yield columns, batch
+            rows.clear()
+    if row_values is None:
+        raise NoDataError("No matching points")
+    if rows:
+        batch = list(zip(*rows))
+        if columns is None:
+            columns = _batch_columns(names, tag_keys, field_kinds, batch)
+        yield columns, batch
+
+
+def _batch_columns(
+    names: list[str], tag_keys: set[str], field_kinds: dict[str, str], batch: list
+) -> list[tuple[str, str]]:
+    columns = [("time", "time")]
+    for name, values in zip(names[1:], batch[1:]):
+        if name in tag_keys:
+            columns.append((name, "string"))
+        else:
+            columns.append((name, field_kinds.get(name) or column_kind(values)))
+    return columns
+
+
+def _conform(kind: str, values) -> list:
+    """Return values with the type of the column kind. Values that can't be converted become None."""
+    kind_type = _KIND_TYPES[kind]
+    if all(value is None or value.__class__ is kind_type for value in values):
+        return values
+    # a field with another type in some shard, InfluxDB only rejects type conflicts within a shard
+    if kind == "string":
+        return [value if value is None or value.__class__ is str else str(value) for value in values]
+    if kind == "float":
+        return [float(value) if value.__class__ in (int, float) else None for value in values]
+    return [value if value.__class__ is kind_type else None for value in values]
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Parquet and Arrow export need pyarrow (pip install pyarrow)") from e
+    return pyarrow, pyarrow.parquet
+
+
+def _arrow_schema(pa, columns: list[tuple[str, str]]):
+    types = {
+        "time": pa.timestamp("us", tz="UTC"),
+        "bool": pa.bool_(),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "string": pa.string(),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _arrow_batch(pa, schema, columns: list[tuple[str, str]], batch: list):
+    arrays = [pa.array(batch[0], type=schema.field(0).type)]
+    for index, (_, kind) in enumerate(columns[1:], start=1):
+        arrays.append(pa.array(_conform(kind, batch[index]), type=schema.field(index).type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def parquet_chunks(
+    record_stream: Iterator[Any],
+    tag_keys: set[str],
+    field_kinds: dict[str, str] | None = None,
+    keys: list[str] | None = None,
+) -> Iterator[bytes]:
+    """Yield a zstd compressed Parquet file, one row group per batch."""
+    pa, pq = _import_pyarrow()
+    sink = _ChunkSink()
+    writer = None
+    for columns, batch in _batches(record_stream, tag_keys, field_kinds or {}, keys):
+        if writer is None:
+            schema = _arrow_schema(pa, columns)
+            writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        writer.write_batch(_arrow_batch(pa, schema, columns, batch))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def arrow_chunks(
+    record_stream: Iterator[Any],
+    tag_keys: set[str],
+    field_kinds: dict[str, str] | None = None,
+    keys: list[str] | None = None,
+) -> Iterator[bytes]:
+    """Yield an Arrow IPC stream (zstd compressed record batches), readable with pyarrow.ipc.open_stream."""
+    pa, _ = _import_pyarrow()
+    sink = _ChunkSink()
+    writer = None
+    for columns, batch in _batches(record_stream, tag_keys, field_kinds or {}, keys):
+        if writer is None:
+            schema = _arrow_schema(pa, columns)
+            writer = pa.ipc.new_stream(sink, schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+        writer.write_batch(_arrow_batch(pa, schema, columns, batch))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise RuntimeError("NumPy export needs numpy (pip install numpy)") from e
+    return numpy
+
+
+# Prefix of the category arrays in .npz exports. InfluxDB rejects tag and field keys starting with "_", so no
+# column can be named like this.
+NPZ_CATEGORIES_PREFIX = "__categories__/"
+
+
+def npz_chunks(
+    record_stream: Iterator[Any],
+    tag_keys: set[str],
+    field_kinds: dict[str, str] | None = None,
+    keys: list[str] | None = None,
+) -> Iterator[bytes]:
+    """
+    Yield a NumPy .npz archive with one 1-d array per column, load it with numpy.load. "time" is
+    datetime64[us] (UTC), numbers and booleans are float64 (NaN where missing) and strings are int32
+    codes into the array "__categories__/<column>" (-1 where missing).
+
+    A .npy header holds the array length, so the columns are spooled to temporary files first and
+    the archive is only streamed once all records are read.
+    """
+    np = _import_numpy()
+    spools: list = []
+    categories: list[dict[str, int] | None] = []
+    columns = None
+    count = 0
+    try:
+        for columns, batch in _batches(record_stream, tag_keys, field_kinds or {}, keys):
+            if not spools:
+                for _, kind in columns:
+                    spools.append(tempfile.TemporaryFile())
+                    categories.append({} if kind == "string" else None)
+            for spool, codes, (_, kind), values in zip(spools, categories, columns, batch):
+                spool.write(_npz_array(np, kind, codes, values).tobytes())
+            count += len(batch[0])
+        yield from _npz_archive(np, spools, categories, columns, count)
+    finally:
+        for spool in spools:
+            spool.close()
+
+
+def _npz_array(np, kind: str, codes: dict[str, int] | None, values: list):
+    """Convert one batch of a column; codes (string columns only) maps the values seen so far to their code."""
+    if kind == "time":
+        return np.array([value.replace(tzinfo=None) for value in values], dtype="datetime64[us]")
+    if codes is not None:
+        return np.array(
+            [-1 if value is None else codes.setdefault(str(value), len(codes)) for value in values],
+            dtype=np.int32,
+        )
+    numbers = _conform("bool" if kind == "bool" else "float", values)  # ints end up as float64
+    return np.array([np.nan if value is None else value for value in numbers], dtype=np.float64)
+
+
+def _npz_archive(np, spools: list, categories: list, columns: list[tuple[str, str]], count: int) -> Iterator[bytes]:
+    """Stream the archive of the spooled columns of npz_chunks()."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for spool, codes, (name, kind) in zip(spools, categories, columns):
+            if kind == "time":
+                dtype = np.dtype("datetime64[us]")
+            else:
+                dtype = np.dtype(np.int32 if codes is not None else np.float64)
+            with archive.open(f"{name}.npy", "w", force_zip64=True) as entry:
+                np.lib.format.write_array_header_1_0(entry, {
+                    "descr": np.lib.format.dtype_to_descr(dtype),
+                    "fortran_order": False,
+                    "shape": (count,),
+                })
+                spool.seek(0)
+                while block := spool.read(_COPY_BLOCK_BYTES):
+                    entry.write(block)
+                    yield sink.take()
+            if codes is not None:
+                with archive.open(f"{NPZ_CATEGORIES_PREFIX}{name}.npy", "w", force_zip64=True) as entry:
+                    np.lib.format.write_array(entry, np.array(list(codes), dtype=str))
+    yield sink.take()
+
+
+# export format -> generator of the file's bytes (pivoted records, tag keys, field kinds, tag and field columns)
+EXPORT_WRITERS = {
+    "parquet": parquet_chunks,
+    "arrow": arrow_chunks,
+    "npz": npz_chunks,
+}
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("zstd compression needs zstandard (pip install zstandard)") from e
+    return zstandard
+
+
+def compress_chunks(chunks: Iterator[bytes], compression: str, filename: str) -> Iterator[bytes]:
+    """
+    Compress an export on the fly, without temporary files: "gzip" (a .gz file), "zstd" (a .zst
+    frame) or "zip" (an archive with the single file filename). Only the compressor's window and
+    up to COMPRESSED_CHUNK_BYTES of output are held in memory. "none" returns chunks as they are.
+    """
+    if compression == "none":
+        return chunks
+    if compression == "zip":
+        return _zip_chunks(chunks, filename)
+    if compression == "zstd":
+        compressor = _import_zstandard().ZstdCompressor(level=3).compressobj()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 16 + 15: gzip header and trailer
+    return _compressor_chunks(chunks, compressor)
+
+
+def _compressor_chunks(chunks: Iterator[bytes], compressor) -> Iterator[bytes]:
+    output: list[bytes] = []
+    size = 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            output.append(data)
+            size += len(data)
+            if size >= COMPRESSED_CHUNK_BYTES:
+                yield b"".join(output)
+                output.clear()
+                size = 0
+    output.append(compressor.flush())
+    yield b"".join(output)
+
+
+def _zip_chunks(chunks: Iterator[bytes], filename: str) -> Iterator[bytes]:
+    # the sink isn't seekable, so zipfile writes sizes and CRC in a data descriptor after the entry
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(filename, "w", force_zip64=True) as entry:
+            for chunk in chunks:
+                entry.write(chunk)
+                if sink.position - sink.taken >= COMPRESSED_CHUNK_BYTES:
+                    yield sink.take()
+    yield sink.take()
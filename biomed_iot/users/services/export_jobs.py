@@ -0,0 +1,187 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from contextlib import closing
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+import users.models
+from .influx_data_utils import InfluxDataManager
+from .export_formats import EXPORT_FORMATS, EXPORT_COMPRESSIONS, NoDataError
+
+logger = logging.getLogger(__name__)
+
+# A running job updates locked_at (and bytes_written) this often, also while no data arrives
+HEARTBEAT_SECONDS = 2
+# A job whose heartbeat is older than this belongs to a worker that died; it is handed out again
+STALE_LOCK_SECONDS = 5 * 60
+# Files in EXPORT_JOBS_ROOT without a job (e.g. of deleted users) are deleted after this long
+ORPHAN_FILE_SECONDS = 60 * 60
+
+
+class ExportLimitReached(Exception):
+    """Raised when a user already has EXPORT_JOBS_MAX_ACTIVE_PER_USER pending or running exports."""
+
+
+def enqueue_export(user, params):
+    """
+    Queue a background export. params are the keyword arguments of InfluxDataManager.export_stream.
+    Returns the job; raises ExportLimitReached if the user has too many unfinished exports.
+    """
+    active = users.models.ExportJob.objects.filter(
+        user=user, status__in=[users.models.ExportJob.STATUS_PENDING, users.models.ExportJob.STATUS_RUNNING]
+    ).count()
+    if active >= settings.EXPORT_JOBS_MAX_ACTIVE_PER_USER:
+        raise ExportLimitReached(f'You already have {active} export(s) in progress.')
+    compression = params.get('compression', 'none')
+    content_type = EXPORT_COMPRESSIONS[compression][0] or EXPORT_FORMATS[params.get('export_format', 'csv')][0]
+    return users.models.ExportJob.objects.create(user=user, params=params, content_type=content_type)
+
+
+def export_file_path(job):
+    """Absolute path of the job's file."""
+    return os.path.join(settings.EXPORT_JOBS_ROOT, job.file_path)
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ExportWorker:
+    """
+    Claims pending ExportJobs from the database (with a conditional UPDATE, so several workers can run) and
+    writes their files. Between jobs it deletes expired exports. Failed exports are not retried; the user
+    starts a new one.
+    """
+
+    def __init__(self, worker_id=None):
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+
+    def requeue_stale_jobs(self):
+        stale_before = timezone.now() - timedelta(seconds=STALE_LOCK_SECONDS)
+        count = users.models.ExportJob.objects.filter(
+            status=users.models.ExportJob.STATUS_RUNNING, locked_at__lt=stale_before
+        ).update(status=users.models.ExportJob.STATUS_PENDING, locked_by='', locked_at=None, bytes_written=0)
+        if count:
+            logger.warning(f'Requeued {count} export job(s) of workers that stopped responding')
+
+    def claim_job(self):
+        """Claim the oldest pending job. Returns it, or None if there is none."""
+        pending = users.models.ExportJob.objects.filter(status=users.models.ExportJob.STATUS_PENDING)
+        for job_id in pending.order_by('created_at', 'pk').values_list('pk', flat=True)[:10]:
+            claimed = users.models.ExportJob.objects.filter(
+                pk=job_id, status=users.models.ExportJob.STATUS_PENDING
+            ).update(status=users.models.ExportJob.STATUS_RUNNING, locked_by=self.worker_id, locked_at=timezone.now())
+            if claimed:
+                return users.models.ExportJob.objects.select_related('user').get(pk=job_id)
+        return None
+
+    def run_job(self, job):
+        os.makedirs(settings.EXPORT_JOBS_ROOT, exist_ok=True)
+        # a random name, so the files can't be guessed; written as .part and renamed when complete.
+        # Saved right away, so delete_expired() of another worker leaves the .part file alone.
+        job.file_path = f'{uuid.uuid4().hex}.{job.pk}'
+        users.models.ExportJob.objects.filter(pk=job.pk, locked_by=self.worker_id).update(file_path=job.file_path)
+        path = export_file_path(job)
+        progress = [0]  # bytes written, read by the heartbeat thread
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, progress, stop_heartbeat), daemon=True)
+        heartbeat.start()
+        try:
+            stream, job.filename = InfluxDataManager(job.user).export_stream(**job.params)
+            # closing: if writing fails, the queries stop right away
+            with closing(stream), open(f'{path}.part', 'wb') as f:
+                for chunk in stream:
+                    f.write(chunk)
+                    progress[0] += len(chunk)
+            os.replace(f'{path}.part', path)
+        except Exception as e:
+            # file_path is kept: should the removal fail, delete_expired() removes the .part file with the job
+            _remove_file(f'{path}.part')
+            job.status = users.models.ExportJob.STATUS_FAILED
+            no_data = isinstance(e, NoDataError)
+            job.last_error = 'No data in this time range.' if no_data else f'{type(e).__name__}: {e}'
+            logger.error(f'Export job {job.pk} failed: {e}')
+        else:
+            job.status = users.models.ExportJob.STATUS_DONE
+            logger.info(f'Export job {job.pk} done, {progress[0]} bytes')
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+        # failed jobs expire as well, so they don't pile up in the user's list
+        job.expires_at = timezone.now() + timedelta(hours=settings.EXPORT_JOBS_TTL_HOURS)
+        job.bytes_written = progress[0]
+        job.finished_at = timezone.now()
+        job.locked_by = ''
+        job.locked_at = None
+        # Only while this worker still holds the job: if its heartbeat stalled, the job may have been requeued
+        # and claimed by another worker, or the user may have been deleted meanwhile
+        finished = users.models.ExportJob.objects.filter(pk=job.pk, locked_by=self.worker_id).update(
+            status=job.status,
+            filename=job.filename,
+            file_path=job.file_path,
+            last_error=job.last_error,
+            expires_at=job.expires_at,
+            bytes_written=job.bytes_written,
+            finished_at=job.finished_at,
+            locked_by='',
+            locked_at=None,
+        )
+        if not finished:
+            logger.warning(f'Export job {job.pk} was taken over or deleted while it ran, discarding its file')
+            _remove_file(path)
+        return job.status
+
+    def _heartbeat(self, job, progress, stop):
+        try:
+            while not stop.wait(HEARTBEAT_SECONDS):
+                users.models.ExportJob.objects.filter(pk=job.pk, locked_by=self.worker_id).update(
+                    bytes_written=progress[0], locked_at=timezone.now()
+                )
+        finally:
+            connection.close()  # the thread's own database connection
+
+    def delete_expired(self):
+        """Delete expired jobs with their files, and files no job refers to."""
+        expired = users.models.ExportJob.objects.filter(expires_at__lt=timezone.now())
+        for job in expired:
+            if job.file_path:
+                _remove_file(export_file_path(job))
+                _remove_file(f'{export_file_path(job)}.part')  # left by a failed job
+        count, _ = expired.delete()
+        if count:
+            logger.info(f'Deleted {count} expired export(s)')
+
+        if not os.path.isdir(settings.EXPORT_JOBS_ROOT):
+            return
+        known = set(users.models.ExportJob.objects.exclude(file_path='').values_list('file_path', flat=True))
+        orphaned_before = time.time() - ORPHAN_FILE_SECONDS
+        with os.scandir(settings.EXPORT_JOBS_ROOT) as entries:
+            for entry in entries:
+                name = entry.name.removesuffix('.part')
+                if entry.is_file() and name not in known and entry.stat().st_mtime < orphaned_before:
+                    _remove_file(entry.path)
+
+    def run(self, once=False, poll_interval=1.0):
+        """Process jobs until stopped. With once=True, return as soon as no job is pending."""
+        logger.info(f'Export worker {self.worker_id} started')
+        last_maintenance = None
+        while True:
+            if last_maintenance is None or time.monotonic() - last_maintenance > 60:
+                self.requeue_stale_jobs()
+                self.delete_expired()
+                last_maintenance = time.monotonic()
+            job = self.claim_job()
+            if job is not None:
+                self.run_job(job)
+                continue
+            if once:
+                return
+            time.sleep(poll_interval)
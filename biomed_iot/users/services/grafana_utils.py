@@ -16,6 +16,17 @@ class GrafanaUserManager:
         self.influx_org_name = config.influxdb.INFLUX_ORG_NAME
         self.influx_host = config.influxdb.INFLUX_HOST
         self.influx_port = config.influxdb.INFLUX_PORT
+        self._set_grafana_origin()
+
+    @classmethod
+    def for_username(cls, username):
+        # Only for delete_user(), e.g. after the Django user is gone
+        manager = cls.__new__(cls)
+        manager.username = username
+        manager._set_grafana_origin()
+        return manager
+
+    def _set_grafana_origin(self):
         self.hostname = config.grafana.GRAFANA_HOST
         self.port = config.grafana.GRAFANA_PORT
         self.admin_username = config.grafana.GRAFANA_ADMIN_USERNAME
@@ -33,6 +44,8 @@ class GrafanaUserManager:
         url = f"{self.grafana_origin}/api/orgs/name/{self.username}"
         headers = {'content-type': 'application/json'}
         r = requests.get(url, headers=headers)
+        if r.status_code != 404:
+            r.raise_for_status()  # only 'not found' may be taken for a missing org
         try:
             content = r.json()
             return content.get("id")
@@ -130,8 +143,11 @@ class GrafanaUserManager:
                 return content.get('id')
             except Exception as e:
                 logger.error(f"Error parsing user ID: {e}")
+        elif response.status_code == 404:
+            logger.info(f"Grafana user {self.username} not found")
         else:
             logger.error(f"Error getting user ID: {response.status_code} {response.text}")
+            response.raise_for_status()
         return None
 
     def _del_user(self, userid):
@@ -145,9 +161,10 @@ class GrafanaUserManager:
         return requests.delete(url, headers=headers)
 
     def create_user(self):
+        # Safe to call again after a partial failure (provisioning retries): 'already exists' answers are accepted.
         # Create the custom organization for the user.
         org_resp = self._make_org()
-        if org_resp.status_code not in [200, 204]:
+        if org_resp.status_code not in [200, 204, 409]:
             logger.error(f"Failed to create org: {org_resp.status_code} {org_resp.text}")
             return False
 
@@ -164,13 +181,13 @@ class GrafanaUserManager:
 
         # Create the custom user account.
         user_resp = self._make_user()
-        if user_resp.status_code not in [200, 204]:
+        if user_resp.status_code not in [200, 204, 412]:
             logger.error(f"Failed to create user: {user_resp.status_code} {user_resp.text}")
             return False
 
         # Add the user to their own organization.
         add_resp = self._add_user_to_org(orgid)
-        if add_resp.status_code not in [200, 204]:
+        if add_resp.status_code not in [200, 204, 409]:
             logger.error(f"Failed to add user to org: {add_resp.status_code} {add_resp.text}")
             return False
 
@@ -189,22 +206,20 @@ class GrafanaUserManager:
             return False
 
     def delete_user(self):
+        # A user or org that is already gone counts as deleted, so a retry after a partial failure succeeds.
         try:
             userid = self._get_user_id()
-            if userid is None:
-                logger.error("Grafana delete_user: _get_user_id returned None")
-                return False
-
             orgid = self._get_org_id()
-            if orgid is None:
-                logger.error("Grafana delete_user: _get_org_id returned None")
-                return False
 
             # Delete the custom user from Grafana.
-            r1 = self._del_user(userid)
-            if r1.status_code not in [200, 204]:
-                logger.error(f"Failed to delete Grafana user: status code {r1.status_code} {r1.text}")
-                return False
+            if userid is not None:
+                r1 = self._del_user(userid)
+                if r1.status_code not in [200, 204, 404]:
+                    logger.error(f"Failed to delete Grafana user: status code {r1.status_code} {r1.text}")
+                    return False
+
+            if orgid is None:
+                return True
 
             # IMPORTANT:
             # The default admin user cannot be removed from an organization when using its own credentials.
@@ -216,7 +231,7 @@ class GrafanaUserManager:
 
             # Now delete the user's custom organization.
             r2 = self._del_org(orgid)
-            if r2.status_code not in [200, 204]:
+            if r2.status_code not in [200, 204, 404]:
                 logger.error(f"Failed to delete Grafana org: status code {r2.status_code} {r2.text}")
                 return False
 
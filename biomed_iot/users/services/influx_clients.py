@@ -0,0 +1,93 @@
+"""
+Process-wide registry of long-lived InfluxDB clients and one pooled HTTP session for the raw v2 API calls.
+
+Creating an InfluxDBClient per call sets up a new urllib3 pool (and TCP connection) every time, and clients
+that are never closed leak their sockets. Clients handed out here are shared by all threads of the process and
+keep their connections alive between requests. Callers must not close them.
+"""
+
+import os
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from influxdb_client import InfluxDBClient
+
+logger = logging.getLogger(__name__)
+
+# Every user bucket has its own token, so there is one client per active user. Beyond this, the least recently
+# used client is closed.
+MAX_CLIENTS = 64
+DEFAULT_TIMEOUT_MS = 10_000
+SESSION_POOL_SIZE = 20
+
+_clients = OrderedDict()  # (url, token, org, timeout) -> InfluxDBClient, least recently used first
+_session = None
+_registry_pid = None
+_registry_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # A forked child (gunicorn worker) must not share the parent's sockets
+    global _session, _registry_pid
+    if _registry_pid != os.getpid():
+        _clients.clear()
+        _session = None
+        _registry_pid = os.getpid()
+
+
+def get_influx_client(url, token, org, timeout=DEFAULT_TIMEOUT_MS):
+    """
+    Return the shared InfluxDBClient for url and token (and org and timeout in ms), creating it on first use.
+
+    :return: InfluxDBClient. Don't close it, and don't use it in a 'with' block.
+    """
+    key = (url, token, org, timeout)
+    with _registry_lock:
+        _reset_after_fork()
+        client = _clients.get(key)
+        if client is not None:
+            _clients.move_to_end(key)
+            return client
+        client = InfluxDBClient(url=url, token=token, org=org, timeout=timeout)
+        _clients[key] = client
+        if len(_clients) > MAX_CLIENTS:
+            _, evicted = _clients.popitem(last=False)
+            # closing only drops idle connections, a query still streaming from it finishes normally
+            evicted.close()
+        return client
+
+
+def get_influx_session():
+    """Return the process-wide requests.Session (keep-alive, pooled) for InfluxDB v2 API calls without client."""
+    global _session
+    with _registry_lock:
+        _reset_after_fork()
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=SESSION_POOL_SIZE)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+        return _session
+
+
+def close_influx_clients():
+    """Close all registered clients and the session. The next get_* call creates new ones."""
+    global _session
+    with _registry_lock:
+        if _registry_pid != os.getpid():
+            return  # inherited from the parent, closing would affect its sockets
+        while _clients:
+            _, client = _clients.popitem()
+            try:
+                client.close()
+            except Exception as e:
+                logger.error(f'Error closing InfluxDB client: {e}')
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+atexit.register(close_influx_clients)
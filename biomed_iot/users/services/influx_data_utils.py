@@ -4,15 +4,37 @@ High-level data operations (read / delete / export) for a single user bucket/mea
 
 from __future__ import annotations
 
-import csv
-import io
-import requests
-from datetime import datetime
+import math
+import time
+import queue
+import logging
+import bisect
+import hashlib
+import itertools
+import operator
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
 from django.utils import timezone
 from typing import Iterator, Dict, Any, Tuple, List
 from influxdb_client import InfluxDBClient
 from influxdb_client.client.flux_table import FluxTable
 from biomed_iot.config_loader import config
+import users.models
+from .influx_clients import get_influx_client, get_influx_session
+from . import export_formats
+from .export_formats import NoDataError
+
+logger = logging.getLogger(__name__)
+
+
+def _flux_string(value: str) -> str:
+    """Return value as a quoted Flux string literal."""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
 
 
 def to_rfc3339(value) -> str:
@@ -24,6 +46,298 @@ def to_rfc3339(value) -> str:
     raise TypeError(f"Unsupported timestamp type: {type(value)}")
 
 
+# export_stream yields the CSV in chunks of at least this many bytes (one WSGI write each)
+EXPORT_CHUNK_BYTES = 64 * 1024
+# formatter caches are cleared when they reach this size, so long exports don't grow them without bound
+_EXPORT_CACHE_SIZE = 10_000
+_SECONDS = [f"{second:02d}" for second in range(60)]
+_MINUTE = timedelta(minutes=1)
+
+# Parallel exports split the time range into up to EXPORT_MAX_WINDOWS windows (none shorter than
+# EXPORT_MIN_WINDOW_SECONDS) and query up to EXPORT_PARALLEL_QUERIES of them at a time. Each window
+# reads ahead at most EXPORT_PREFETCH_BATCHES batches of EXPORT_PREFETCH_BATCH_RECORDS records.
+EXPORT_MAX_WINDOWS = 16
+EXPORT_MIN_WINDOW_SECONDS = 3600
+EXPORT_PARALLEL_QUERIES = 4
+EXPORT_PREFETCH_BATCHES = 8
+EXPORT_PREFETCH_BATCH_RECORDS = 1000
+_WINDOW_END = object()
+
+
+def _time_windows(start: datetime, stop: datetime) -> list[tuple[str, str]]:
+    """Split [start, stop) into consecutive windows on whole seconds, as (start, stop) RFC-3339 pairs."""
+    first, last = math.floor(start.timestamp()), math.ceil(stop.timestamp())
+    if last <= first:
+        return []
+    count = max(1, min(EXPORT_MAX_WINDOWS, (last - first) // EXPORT_MIN_WINDOW_SECONDS))
+    bounds = [
+        datetime.fromtimestamp(first + (last - first) * index // count, dt_timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        for index in range(count + 1)
+    ]
+    return list(zip(bounds, bounds[1:]))
+
+
+def _export_windows(start_iso: str, stop_iso: str, first_time: datetime | None) -> list[tuple[str, str]]:
+    """
+    Plan the windows of a parallel export of [start_iso, stop_iso). Only the time with data (from the first
+    point up to now) is split; the outer windows still reach start and stop. No windows without data.
+    """
+    if first_time is None:
+        return []
+    start = max(datetime.fromisoformat(start_iso), first_time)
+    stop = min(datetime.fromisoformat(stop_iso), datetime.now(dt_timezone.utc))
+    windows = _time_windows(start, stop) or [(start_iso, stop_iso)]
+    windows[0] = (start_iso, windows[0][1])
+    windows[-1] = (windows[-1][0], stop_iso)
+    return windows
+
+
+def _put_until_stopped(buffer: queue.Queue, item, stop: threading.Event) -> bool:
+    """Put item into the bounded buffer, waiting while it is full. Returns False if stop was set first."""
+    while not stop.is_set():
+        try:
+            buffer.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _record_batches(records: Iterator[Any], stop: threading.Event) -> Iterator[list]:
+    """Group records into lists of EXPORT_PREFETCH_BATCH_RECORDS. Ends early (without the rest) once stop is set."""
+    batch = []
+    for record in records:
+        if stop.is_set():  # the export was closed, don't wait for a full batch
+            return
+        batch.append(record)
+        if len(batch) >= EXPORT_PREFETCH_BATCH_RECORDS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _fetch_window(client_factory, flux: str, buffer: queue.Queue, stop: threading.Event) -> None:
+    """
+    Run one window query of a parallel export (in a worker thread): put its records into buffer in batches,
+    then _WINDOW_END, or the exception the query raised.
+    """
+    records = None
+    try:
+        records = client_factory().query_api().query_stream(flux)
+        for batch in _record_batches(records, stop):
+            if not _put_until_stopped(buffer, batch, stop):
+                return
+        _put_until_stopped(buffer, _WINDOW_END, stop)
+    except Exception as e:
+        _put_until_stopped(buffer, e, stop)
+    finally:
+        if records is not None:
+            records.close()
+
+
+def _ordered_records(buffers: list[queue.Queue]) -> Iterator[Any]:
+    """Yield the records of the window buffers, one window after the other. Raises a window's exception."""
+    for buffer in buffers:
+        while (item := buffer.get()) is not _WINDOW_END:
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+
+
+class _LocalTimeFormatter:
+    """
+    Formats UTC datetimes like timezone.localtime(value, tz).isoformat(), several times faster.
+
+    Time zone offsets only change on whole minutes, so the local "YYYY-MM-DDThh:mm:" prefix and the
+    "+hh:mm" suffix are computed once per UTC minute; per value only seconds and microseconds are added.
+    """
+
+    def __init__(self, tz):
+        self.tz = tz
+        self.minutes: dict[tuple, tuple[str, str] | None] = {}
+        self.fractions = _Fractions()
+
+    def __call__(self, value: datetime) -> str:
+        parts = self.minute_parts(value)
+        if parts is None:
+            return timezone.localtime(value, self.tz).isoformat()
+        return f"{parts[0]}{_SECONDS[value.second]}{self.fractions[value.microsecond]}{parts[1]}"
+
+    def minute_of(self, value: datetime) -> tuple[datetime, datetime, tuple[str, str] | None]:
+        """Return the start and end of the minute of value and its minute_parts()."""
+        start = value.replace(second=0, microsecond=0)
+        return start, start + _MINUTE, self.minute_parts(value)
+
+    def minute_parts(self, value: datetime) -> tuple[str, str] | None:
+        """Return (prefix, suffix) for the minute of value, None if the offset has seconds (local mean time)."""
+        key = (value.year, value.month, value.day, value.hour, value.minute)
+        parts = self.minutes.get(key, False)
+        if parts is False:
+            local = timezone.localtime(value.replace(second=0, microsecond=0), self.tz)
+            if local.utcoffset().seconds % 60:
+                parts = None
+            else:
+                iso = local.isoformat()  # YYYY-MM-DDThh:mm:00+hh:mm
+                parts = iso[:17], iso[19:]
+            if len(self.minutes) >= _EXPORT_CACHE_SIZE:
+                self.minutes.clear()
+            self.minutes[key] = parts
+        return parts
+
+
+class _Fractions(dict):
+    """The ".ffffff" part of isoformat() per microsecond ("" for 0), built on first use."""
+
+    def __missing__(self, microsecond: int) -> str:
+        fraction = f".{microsecond:06d}" if microsecond else ""
+        if len(self) >= _EXPORT_CACHE_SIZE:
+            self.clear()
+        self[microsecond] = fraction
+        return fraction
+
+
+class _SeriesLineParts(dict):
+    """
+    The parts of a CSV line before the time, between time and value and after the value, per series key
+    ((field, *tag values), or only the field without tags). Built on first use from the sorted header fields.
+    """
+
+    def __init__(self, header_fields: list[str], tag_keys: list[str], csv_field):
+        super().__init__()
+        self.width = len(header_fields)
+        self.time_index, self.value_index = header_fields.index("time"), header_fields.index("value")
+        # positions of field and the tags (in series key order) in the header
+        self.series_columns = [header_fields.index(name) for name in ("field", *tag_keys)]
+        self.has_tags = bool(tag_keys)
+        self.csv_field = csv_field
+
+    def __missing__(self, key) -> tuple[str, str, str]:
+        time_index, value_index = self.time_index, self.value_index
+        cells = [""] * self.width
+        for column, cell in zip(self.series_columns, key if self.has_tags else (key,)):
+            cells[column] = self.csv_field(cell)
+        parts = (
+            ",".join(cells[:time_index]) + ("," if time_index else ""),
+            "," + ",".join(cells[time_index + 1:value_index]) + ("," if value_index - time_index > 1 else ""),
+            ("," if value_index + 1 < len(cells) else "") + ",".join(cells[value_index + 1:]) + "\r\n",
+        )
+        if len(self) >= _EXPORT_CACHE_SIZE:
+            self.clear()
+        self[key] = parts
+        return parts
+
+
+class _CsvFieldFormatter:
+    """
+    Formats a value like csv.writer does (excel dialect). Strings repeat a lot in exports (tag values,
+    field names), so their quoted form is cached.
+    """
+
+    def __init__(self):
+        self.strings: dict[str, str] = {}
+
+    def __call__(self, value: Any) -> str:
+        if value.__class__ is str:
+            text = self.strings.get(value)
+            if text is None:
+                text = value
+                if "," in value or '"' in value or "\r" in value or "\n" in value:
+                    text = '"' + value.replace('"', '""') + '"'
+                if len(self.strings) >= _EXPORT_CACHE_SIZE:
+                    self.strings.clear()
+                self.strings[value] = text
+            return text
+        if value is None:
+            return ""
+        return self(str(value))  # numbers and booleans, quoted like csv does if needed
+
+
+# Finished exports are counted per outcome in the database (ExportCounter), so the numbers cover all processes
+EXPORT_OUTCOMES = ("completed", "cancelled", "empty", "failed")
+
+
+def _count_export(outcome: str) -> None:
+    counters = users.models.ExportCounter.objects.filter(outcome=outcome)
+    if not counters.update(count=F("count") + 1):
+        # first export with this outcome; get_or_create copes with a concurrent first one
+        users.models.ExportCounter.objects.get_or_create(outcome=outcome)
+        counters.update(count=F("count") + 1)
+
+
+def export_stats() -> Dict[str, int]:
+    """Number of exports per outcome (see ExportStream)."""
+    counts = dict(users.models.ExportCounter.objects.values_list("outcome", "count"))
+    return {outcome: counts.get(outcome, 0) for outcome in EXPORT_OUTCOMES}
+
+
+class ExportStream:
+    """
+    The byte iterator export_stream returns. close() (called by Django when the response ends, also if
+    the client disconnected) closes the generators right away, which closes the HTTP responses of the
+    InfluxDB queries, so InfluxDB stops them; otherwise they would read on until garbage collection.
+
+    The outcome is counted once: "completed", "empty" (no matching points, NoDataError), "failed" or
+    "cancelled" (closed before the end).
+    """
+
+    def __init__(self, chunks: Iterator[bytes], generators: List[Iterator[Any]], filename: str):
+        self.chunks = chunks
+        self.generators = generators  # outermost first
+        self.filename = filename
+        self.bytes_sent = 0
+        self.started = time.monotonic()
+        self.peeked: bytes | None = None
+        self.outcome: str | None = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if self.peeked is not None:
+            chunk, self.peeked = self.peeked, None
+        else:
+            try:
+                chunk = next(self.chunks)
+            except StopIteration:
+                self._finish("completed")
+                raise
+            except NoDataError:
+                self._finish("empty")
+                raise
+            except Exception:
+                self._finish("failed")
+                raise
+        self.bytes_sent += len(chunk)
+        return chunk
+
+    def peek(self) -> bytes:
+        """Read the first chunk ahead, e.g. to catch NoDataError before the response starts."""
+        if self.peeked is None:
+            self.peeked = next(self)
+            self.bytes_sent -= len(self.peeked)
+        return self.peeked
+
+    def close(self) -> None:
+        self._finish("cancelled")
+
+    def _finish(self, outcome: str) -> None:
+        if self.outcome is not None:
+            return
+        self.outcome = outcome
+        for generator in self.generators:
+            try:
+                generator.close()
+            except Exception as e:
+                logger.error(f"Error closing export {self.filename}: {e}")
+        _count_export(outcome)
+        if outcome == "cancelled":
+            logger.info(
+                f"Export {self.filename} cancelled after {self.bytes_sent} bytes "
+                f"and {time.monotonic() - self.started:.1f} s"
+            )
+
+
 class InfluxDataManager:
     """
     Encapsulates InfluxDB calls for a user’s personal bucket
@@ -39,14 +353,34 @@ class InfluxDataManager:
 
     # ─────────────────────────── Private helpers ────────────────────────────
     def _client(self) -> InfluxDBClient:
-        return InfluxDBClient(
-            url=self.url,
-            token=self.token,
-            org=self.org_id,
+        # shared per (url, token) and process, don't close it
+        return get_influx_client(
+            self.url,
+            self.token,
+            self.org_id,
             timeout=300_000  # e.g. 5 minutes = 300_000 ms
         )
 
-    # services/influx_data_utils.py  (replace the helper)
+    # Metadata cache: keys include a per-bucket version token, so replacing it invalidates all of them at once.
+    # A new random token instead of cache.incr(): FileBasedCache increments with a separate get and set, so two
+    # concurrent invalidations could write the same number; two random tokens never collide.
+    def _cache_version(self) -> str:
+        return cache.get_or_set(f"influx-meta:{self.bucket}:version", lambda: uuid.uuid4().hex, timeout=None)
+
+    def _cached(self, name: str, compute):
+        # hashed, measurement and tag names may contain characters some cache backends reject in keys
+        name_hash = hashlib.sha1(name.encode("utf-8")).hexdigest()
+        key = f"influx-meta:{self.bucket}:{self._cache_version()}:{name_hash}"
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache.set(key, value, timeout=settings.INFLUX_METADATA_CACHE_SECONDS)
+        return value
+
+    def invalidate_metadata_cache(self) -> None:
+        """Forget the cached measurements and tags of this bucket (e.g. after deleting data)."""
+        cache.set(f"influx-meta:{self.bucket}:version", uuid.uuid4().hex, timeout=None)
+
 
     @staticmethod
     def _flatten_tables(flux_tables) -> List[Dict[str, Any]]:
@@ -76,65 +410,140 @@ class InfluxDataManager:
 
         return flat_rows
 
+    @staticmethod
+    def _csv_header(values: Dict[str, Any], csv_field) -> tuple[list[str], list[str], str]:
+        """Return the tag keys, the sorted header fields and the header lines for the first record's values."""
+        tag_keys = [key for key in values if key not in {"result", "table"} and not key.startswith("_")]
+        header_fields = sorted(["time", "field", "value", *tag_keys])
+        header = ",".join(
+            csv_field(key if key in ("time", "field", "value") else f"{key} (tag)") for key in header_fields
+        )
+        # Excel separator hint and the header ("(tag)" marks non-core columns)
+        return tag_keys, header_fields, f"sep=,\n{header}\r\n"
+
     def _row_generator(self, record_stream: Iterator[Any]) -> Iterator[bytes]:
         """
-        Take an iterator of FluxRecord, flatten each to a dict,
-        write CSV header on first row, then yield each row as UTF-8 bytes.
-        """
-        buffer = io.StringIO()
-        csv_writer: csv.DictWriter | None = None
-        header_fields: list[str] | None = None
+        Take an iterator of FluxRecord and yield CSV as UTF-8 bytes in chunks of about
+        EXPORT_CHUNK_BYTES. The column order (time, field, value and the tags, sorted) is
+        fixed by the first record; tags a later record lacks stay empty, extra ones are left out.
 
-        # pick once outside the loop – respects TIME_ZONE or per-request activate()
-        local_tz = timezone.get_current_timezone()
+        Output is the same as csv.writer's (excel dialect). The header is sorted, so "time" always
+        comes before "value": every line is <before>time<between>value<after>, where the three
+        parts only depend on the series (field and tag values) and are built once per series.
+        """
+        records = iter(record_stream)
+        first = next(records, None)
+        if first is None:
+            raise NoDataError("No matching points")
+        local_time = _LocalTimeFormatter(timezone.get_current_timezone())
+        csv_field = _CsvFieldFormatter()
+        tag_keys, header_fields, header = self._csv_header(first.values, csv_field)
+        series_parts = _SeriesLineParts(header_fields, tag_keys, csv_field)
+        series_key = operator.itemgetter("_field", *tag_keys)
+        fractions, seconds = local_time.fractions, _SECONDS
+        lines = [header]
+        append = lines.append
+        size = 0
+        minute_start = minute_end = first.values["_time"]  # empty range, set by the first record
+        time_parts = None
+
+        for record in itertools.chain((first,), records):
+            values = record.values
+            try:
+                parts = series_parts[series_key(values)]
+            except KeyError:  # a tag missing in this table
+                parts = series_parts[(values.get("_field"), *[values.get(tag, "") for tag in tag_keys])]
+
+            value = values["_value"]
+            if value.__class__ is str:
+                value = csv_field(value)
+            elif value is None:
+                value = ""
+            # other values (numbers, booleans) go into the f-string as they are: str() without a call, no quoting
+
+            # the time formatting of local_time(), inlined: most records are in the minute of the previous one
+            time = values["_time"]
+            if not minute_start <= time < minute_end:
+                minute_start, minute_end, time_parts = local_time.minute_of(time)
+            if time_parts is None:
+                line = f"{parts[0]}{local_time(time)}{parts[1]}{value}{parts[2]}"
+            else:
+                line = (
+                    f"{parts[0]}{time_parts[0]}{seconds[time.second]}{fractions[time.microsecond]}{time_parts[1]}"
+                    f"{parts[1]}{value}{parts[2]}"
+                )
+            append(line)
+            size += len(line)
+
+            if size >= EXPORT_CHUNK_BYTES:
+                yield "".join(lines).encode("utf-8")
+                lines.clear()
+                size = 0
+
+        yield "".join(lines).encode("utf-8")
+
+    def _wide_row_generator(
+        self, record_stream: Iterator[Any], tag_keys: set[str], columns: List[str] | None = None
+    ) -> Iterator[bytes]:
+        """
+        Like _row_generator, for pivoted records (one per timestamp and series, a column per field).
+        The columns are time, the tags and then the fields, each sorted; tag_keys tells tags from fields.
+        They are those of the first record, or the given tag and field columns. Fields a series doesn't
+        have stay empty.
+        """
+        local_time = _LocalTimeFormatter(timezone.get_current_timezone())
+        csv_field = _CsvFieldFormatter()
+        lines: list[str] = []
+        size = 0
+        row_cells = None
 
         for record in record_stream:
-            # convert time from UTC → project/user zone
-            local_time = timezone.localtime(record.get_time(), local_tz)
-            # flatten a single FluxRecord to a simple dict
-            row: Dict[str, Any] = {
-                "time":      local_time.isoformat(),
-                "field":     record["_field"],
-                "value":     record["_value"],
-            }
-            for key, value in record.values.items():
-                if key in {"result", "table"} or key.startswith("_"):
-                    continue
-                row[key] = value
-
-            # initialize writer & header on first row
-            if header_fields is None:
-                header_fields = sorted(row.keys())
-                csv_writer = csv.DictWriter(buffer, fieldnames=header_fields)
-                # build a mapping of field → header label, adding " (tag)" for non-core fields
-                header_labels = {
-                    key: key if key in ("time", "field", "value")
-                         else f"{key} (tag)"
-                    for key in header_fields
-                }
-                # write Excel separator hint
-                buffer.write("sep=,\n")
-                # write custom header rows
-                csv_writer.writerow(header_labels)
-                yield buffer.getvalue().encode("utf-8")
-                buffer.seek(0)
-                buffer.truncate(0)
-
-            # write the current row and yield bytes
-            csv_writer.writerow(row)
-            yield buffer.getvalue().encode("utf-8")
-            buffer.seek(0)
-            buffer.truncate(0)
-
-        # no records at all?
-        if header_fields is None:
-            raise ValueError("No matching points")
+            values = record.values
+            if row_cells is None:
+                if columns is None:
+                    columns = [key for key in values if key not in {"result", "table"} and not key.startswith("_")]
+                tag_columns = sorted(key for key in columns if key in tag_keys)
+                field_columns = sorted(key for key in columns if key not in tag_keys)
+                if len(columns) == 1:  # itemgetter() with one key returns the value itself, not a tuple
+                    def row_cells(values, key=columns[0]):
+                        return (values[key],)
+                else:
+                    row_cells = operator.itemgetter(*tag_columns, *field_columns)
+                header = ",".join([
+                    "time",
+                    *[csv_field(f"{key} (tag)") for key in tag_columns],
+                    *[csv_field(key) for key in field_columns],
+                ])
+                lines.append(f"sep=,\n{header}\r\n")
+
+            try:
+                row = row_cells(values)
+            except KeyError:  # a column this record's window doesn't have (parallel export)
+                row = [values.get(key) for key in (*tag_columns, *field_columns)]
+            cells = ",".join([
+                csv_field(cell) if cell.__class__ is str else "" if cell is None else str(cell)
+                for cell in row
+            ])
+            line = f"{local_time(values['_time'])},{cells}\r\n"
+            lines.append(line)
+            size += len(line)
+
+            if size >= EXPORT_CHUNK_BYTES:
+                yield "".join(lines).encode("utf-8")
+                lines.clear()
+                size = 0
+
+        if row_cells is None:
+            raise NoDataError("No matching points")
+        yield "".join(lines).encode("utf-8")
 
 
     # ─────────────────────────── Public API ─────────────────────────────────
     def list_measurements(self) -> List[str]:
-        """Return all distinct measurement names in this bucket."""
+        """Return all distinct measurement names in this bucket (cached)."""
+        return self._cached("measurements", self._query_measurements)
 
+    def _query_measurements(self) -> List[str]:
         flux_query = f'''
 import "influxdata/influxdb/schema"
 schema.measurements(
@@ -143,8 +552,7 @@ start: -inf
 )
 '''
 
-        with self._client() as client:
-            tables = client.query_api().query(flux_query)
+        tables = self._client().query_api().query(flux_query)
 
         measurements: List[str] = []
         for table in tables:
@@ -191,7 +599,7 @@ start: -inf
             "predicate": predicate,
         }
         endpoint = f"{self.url}/api/v2/delete?org={self.org_id}&bucket={self.bucket}"
-        response = requests.post(
+        response = get_influx_session().post(
             endpoint,
             headers={
                 "Authorization": f"Token {self.token}",
@@ -200,7 +608,11 @@ start: -inf
             json=delete_payload,
         )
 
-        return response.status_code == 204
+        if response.status_code != 204:
+            return False
+        # measurements or tag values may be gone now
+        self.invalidate_metadata_cache()
+        return True
 
     def export_stream(
         self,
@@ -208,10 +620,29 @@ start: -inf
         tags: Dict[str, str],
         start_iso: str,
         stop_iso: str,
-        ) -> Tuple[Iterator[bytes], str]:
+        fields: List[str] | None = None,
+        wide: bool = False,
+        export_format: str = "csv",
+        compression: str = "none",
+        parallel: bool = False,
+        ) -> Tuple[ExportStream, str]:
         """
-        Stream query results as CSV lines. Returns (csv_byte_iterator, filename).
+        Stream query results as CSV lines. Returns (ExportStream, filename); close the stream if it
+        isn't read to the end, that stops the queries.
+
+        Only the given fields are exported, all if fields is empty. With wide=True, InfluxDB pivots
+        the data into one row per timestamp (and series) with a column per field, instead of one row
+        per timestamp and field with the tags repeated.
+
+        export_format "parquet", "arrow" or "npz" streams that file instead of CSV (always wide, the
+        columns are typed), see export_formats. compression "gzip", "zstd" or "zip" compresses the
+        stream on the fly and extends the filename accordingly (e.g. ".csv.gz").
+
+        With parallel=True, the time range is split into windows that are queried concurrently (see
+        _parallel_record_stream), so long ranges don't depend on one long-running query.
         """
+        if export_format != "csv":
+            wide = True
         # build Flux filter predicate
         filter_clauses = [
             f'r["{tag_name}"]=="{tag_value}"'
@@ -219,26 +650,131 @@ start: -inf
         ]
         measurement_predicate = f'r["_measurement"]=="{measurement}"'
         full_predicate = " and ".join([measurement_predicate] + filter_clauses)
+        if fields:
+            field_predicate = " or ".join(f'r["_field"]=={_flux_string(field)}' for field in fields)
+            full_predicate = f"{full_predicate} and ({field_predicate})"
 
-        flux = f"""
+        def export_flux(start: str, stop: str, pivot: bool = wide) -> str:
+            flux = f"""
 from(bucket:"{self.bucket}")
-  |> range(start:{start_iso}, stop:{stop_iso})
+  |> range(start:{start}, stop:{stop})
   |> filter(fn:(r) => {full_predicate})
 """
-
-        client = self._client()
-        record_stream = client.query_api().query_stream(flux)
-
+            if pivot:
+                # keep() drops _start, _stop and _measurement; group() merges the series into one table,
+                # so every record has all field columns (null where a series lacks the field)
+                flux += """\
+  |> pivot(rowKey:["_time"], columnKey:["_field"], valueColumn:"_value")
+  |> keep(fn:(column) => column == "_time" or column !~ /^_/)
+  |> group()
+"""
+            return flux
+
+        columns = None
+        field_kinds = None
+        if parallel or export_format != "csv":
+            first_time, series_tags, field_kinds = self._selection_schema(
+                export_flux(start_iso, stop_iso, pivot=False)
+            )
+        if parallel:
+            # in wide exports the windows must share the columns
+            tag_keys = set(series_tags)
+            columns = [*series_tags, *field_kinds]
+            windows = _export_windows(start_iso, stop_iso, first_time)
+            record_stream = self._parallel_record_stream([export_flux(start, stop) for start, stop in windows])
+        else:
+            tag_keys = set(self.list_tag_keys(measurement)) if wide else set()
+            record_stream = self._client().query_api().query_stream(export_flux(start_iso, stop_iso))
+
+        stream, filename = self._export_writer(
+            measurement, record_stream, export_format, wide, tag_keys, field_kinds, columns
+        )
+        generators = [stream, record_stream]
+        if compression != "none":
+            stream = export_formats.compress_chunks(stream, compression, filename)
+            filename = f"{filename}.{export_formats.EXPORT_COMPRESSIONS[compression][1]}"
+            generators.insert(0, stream)
+        return ExportStream(stream, generators, filename), filename
+
+    def _export_writer(
+        self,
+        measurement: str,
+        record_stream: Iterator[Any],
+        export_format: str,
+        wide: bool,
+        tag_keys: set[str],
+        field_kinds: Dict[str, str] | None,
+        columns: List[str] | None,
+    ) -> Tuple[Iterator[bytes], str]:
+        """Return the (uncompressed) file generator of an export and its filename."""
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename = f"measurement_{measurement}_{timestamp}.csv"
+        if export_format != "csv":
+            extension = export_formats.EXPORT_FORMATS[export_format][1]
+            writer = export_formats.EXPORT_WRITERS[export_format]
+            return (
+                writer(record_stream, tag_keys, field_kinds, columns),
+                f"measurement_{measurement}_{timestamp}.{extension}",
+            )
+        if wide:
+            return (
+                self._wide_row_generator(record_stream, tag_keys, columns),
+                f"measurement_{measurement}_wide_{timestamp}.csv",
+            )
+        return self._row_generator(record_stream), f"measurement_{measurement}_{timestamp}.csv"
+
+    def _selection_schema(self, export_flux: str) -> Tuple[datetime | None, List[str], Dict[str, str]]:
+        """
+        Read the first point of each series the export selects (cheap, first() is pushed down).
 
-        return self._row_generator(record_stream), filename
+        :param export_flux: The export query (long format, without pivot).
+        :return: (time of the earliest point or None, sorted tag keys of the series, field -> column
+            kind, see export_formats.column_kind; sorted by field)
+        """
+        flux = export_flux + """\
+  |> first()
+  |> drop(columns: ["_start", "_stop", "_measurement"])
+"""
+        first_time = None
+        tag_keys: set[str] = set()
+        values: dict[str, list] = {}
+        for table in self._client().query_api().query(flux):
+            for record in table.records:
+                if first_time is None or record.get_time() < first_time:
+                    first_time = record.get_time()
+                tag_keys.update(key for key in record.values if key not in {"result", "table"} and key[0] != "_")
+                values.setdefault(record.get_field(), []).append(record.get_value())
+        field_kinds = {field: export_formats.column_kind(values[field]) for field in sorted(values)}
+        return first_time, sorted(tag_keys), field_kinds
+
+    def _parallel_record_stream(self, window_fluxes: List[str]) -> Iterator[Any]:
+        """
+        Yield the records of the window queries in window order (so in time order, and within a window
+        as a single query would), running up to EXPORT_PARALLEL_QUERIES queries at a time. Windows
+        ahead of the one being yielded buffer a bounded number of records; when the consumer stops,
+        the remaining queries are closed.
+        """
+        if not window_fluxes:
+            return
+        stop = threading.Event()
+        buffers = [queue.Queue(maxsize=EXPORT_PREFETCH_BATCHES) for _ in window_fluxes]
+        # windows are started in order, so the one being consumed is always running or done
+        executor = ThreadPoolExecutor(max_workers=EXPORT_PARALLEL_QUERIES, thread_name_prefix="export")
+        try:
+            for flux, buffer in zip(window_fluxes, buffers):
+                executor.submit(_fetch_window, self._client, flux, buffer, stop)
+            yield from _ordered_records(buffers)
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
 
     def list_tag_keys(self, measurement: str) -> list[str]:
         """
         Return all tag _keys_ for this measurement, across all time,
-        but exclude any Flux metadata columns (those that begin with "_").
+        but exclude any Flux metadata columns (those that begin with "_"). Cached.
         """
+        return self._cached(f"tag-keys:{measurement}", lambda: self._query_tag_keys(measurement))
+
+    def _query_tag_keys(self, measurement: str) -> list[str]:
         flux = f'''
 import "influxdata/influxdb/schema"
 
@@ -260,9 +796,13 @@ schema.tagKeys(
 
     def list_tag_values(self, measurement: str, tag_key: str) -> list[str]:
         """
-        Return all tag _values_ for one tag key in this measurement, across all time.
-        (No change needed here.)
+        Return all tag _values_ for one tag key in this measurement, across all time. Cached.
         """
+        return self._cached(
+            f"tag-values:{measurement}:{tag_key}", lambda: self._query_tag_values(measurement, tag_key)
+        )
+
+    def _query_tag_values(self, measurement: str, tag_key: str) -> list[str]:
         flux = f'''
 import "influxdata/influxdb/schema"
 
@@ -279,12 +819,57 @@ schema.tagValues(
 
 
 
-    def list_tag_pairs(self, measurement: str) -> list[str]:
+    def list_tag_pairs(self, measurement: str, start: str | None = None) -> list[str]:
+        """
+        Return all distinct key=value strings for this measurement, sorted, in one query.
+
+        `last()` directly after range/filter is pushed down to the storage engine, so only the newest
+        point of every series is read; each returned row carries the series' tags. `start` may be
+        an RFC-3339 time or a negative duration like "-30d" to only look at recently written series;
+        by default it is settings.INFLUX_TAG_PAIRS_WINDOW, or all data if that is None. Cached.
+        """
+        if start is None:
+            window = settings.INFLUX_TAG_PAIRS_WINDOW
+            start = f"-{window}" if window else "1970-01-01T00:00:00Z"
+        return self._cached(
+            f"tag-pairs:{measurement}:{start}", lambda: self._query_tag_pairs(measurement, start)
+        )
+
+    def _query_tag_pairs(self, measurement: str, start: str) -> list[str]:
+        flux = f"""
+from(bucket:"{self.bucket}")
+  |> range(start:{start})
+  |> filter(fn:(r) => r._measurement == "{measurement}")
+  |> last()
+  |> drop(columns: ["_start", "_stop", "_time", "_value", "_field", "_measurement"])
+  |> group()
+"""
+        tables = self._client().query_api().query(flux)
+        pairs: set[str] = set()
+        for table in tables:
+            for record in table:
+                for key, value in record.values.items():
+                    if key in {"result", "table"} or key.startswith("_") or value is None:
+                        continue
+                    pairs.add(f"{key}={value}")
+        return sorted(pairs)
+
+    def search_tag_pairs(
+        self,
+        measurement: str,
+        prefix: str = "",
+        limit: int = 50,
+        offset: int = 0,
+        start: str | None = None,
+        ) -> Tuple[List[str], int]:
         """
-        Return all key=value strings for this measurement.
+        Return one page of the key=value pairs starting with `prefix` (e.g. "patient=12") and the
+        total number of matches. The cached list_tag_pairs() result is sorted, so the matches are one
+        contiguous slice found by binary search, no matter how many values a tag has. `start` is
+        passed on to list_tag_pairs().
         """
-        pairs: list[str] = []
-        for key in self.list_tag_keys(measurement):
-            for val in self.list_tag_values(measurement, key):
-                pairs.append(f"{key}={val}")
-        return pairs
+        pairs = self.list_tag_pairs(measurement, start)
+        low = bisect.bisect_left(pairs, prefix)
+        high = bisect.bisect_left(pairs, prefix + chr(0x10FFFF), lo=low)
+        start = min(low + offset, high)
+        return pairs[start:min(start + limit, high)], high - low
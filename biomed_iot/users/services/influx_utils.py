@@ -1,10 +1,10 @@
 import json
-import requests  # For HTTP requests to the v1 compatibility endpoint
 import logging
 import users.models as user_models
 from biomed_iot.config_loader import config
 from influxdb_client import InfluxDBClient, Point
 from influxdb_client.client.write_api import SYNCHRONOUS
+from .influx_clients import get_influx_client, get_influx_session
 
 
 logger = logging.getLogger(__name__)
@@ -19,6 +19,8 @@ class InfluxUserManager:
 
     Attributes:
         user: Django user instance associated with InfluxDB resources.
+        bucket_id, bucket_token_id: IDs of what create_new_influx_user_resources() created, also if saving them
+            failed afterwards (None until then).
     """
 
     def __init__(self, user):
@@ -34,7 +36,9 @@ class InfluxUserManager:
         self.port = config.influxdb.INFLUX_PORT
         self.url = f'http://{self.host}:{self.port}'
         self.auth_url = f'{self.url}/api/v2/authorizations'
-        self.client = InfluxDBClient(url=self.url, token=INFLUX_ALL_ACCESS_TOKEN, org=self.org_id)
+        self.client = get_influx_client(self.url, INFLUX_ALL_ACCESS_TOKEN, self.org_id)
+        self.bucket_id = None
+        self.bucket_token_id = None
 
     def _create_bucket(self):
         """
@@ -73,7 +77,7 @@ class InfluxUserManager:
             ],
         }
 
-        response = requests.post(self.auth_url, headers=headers, data=json.dumps(payload))
+        response = get_influx_session().post(self.auth_url, headers=headers, data=json.dumps(payload))
         if response.status_code in [200, 201]:
             response_json = response.json()
             return (response_json.get('token'), response_json.get('id'))
@@ -81,9 +85,10 @@ class InfluxUserManager:
             raise Exception(f'Failed to create token: {response.text}')
 
     def _write_initial_test_data(self, bucket_name, bucket_token):
-        write_client = InfluxDBClient(url=self.url, token=bucket_token, org=self.org_id).write_api(write_options=SYNCHRONOUS)  # noqa
         point = Point('UltimateQuestion').tag('Computer', 'DeepThought').field('Answer', 42)  # Just a sample
-        write_client.write(bucket=bucket_name, org=self.org_id, record=point)
+        # one-off client (not from the registry), closed right away
+        with InfluxDBClient(url=self.url, token=bucket_token, org=self.org_id) as client:
+            client.write_api(write_options=SYNCHRONOUS).write(bucket=bucket_name, org=self.org_id, record=point)
 
 
     def create_new_influx_user_resources(self) -> bool:
@@ -95,8 +100,10 @@ class InfluxUserManager:
         """
         logger.info('in create_new_influx_user_resources() function')
         bucket = self._create_bucket()
+        self.bucket_id = bucket.id
         logger.info(f'bucket: {bucket.name}; id: {bucket.id}')
         bucket_token, bucket_token_id = self._create_bucket_token(bucket)
+        self.bucket_token_id = bucket_token_id
         logger.info(f'bucket_token: {bucket_token}; id: {bucket_token_id}')
         # Assuming self.user is the Django user instance associated with these resources
         influx_user_data, created = user_models.InfluxUserData.objects.update_or_create(
@@ -123,8 +130,6 @@ class InfluxUserManager:
         Returns:
             True if all resources were successfully deleted; False otherwise.
         """
-        token_deleted = False
-        bucket_deleted = False
         model_instance_deleted = False
 
         try:
@@ -136,12 +141,38 @@ class InfluxUserManager:
             print('Influx user data not found.')
             return False  # No resources to delete if the user data is not found.
 
+        resources_deleted = self.delete_bucket_and_token(bucket_id, bucket_token_id)
+
+        if resources_deleted:
+            try:
+                # Delete the user_models.InfluxUserData model instance
+                influx_user_data.delete()
+                model_instance_deleted = True
+            except Exception as e:
+                print(f'Exception occurred while deleting user_models.InfluxUserData model instance: {e}')
+
+        return all([resources_deleted, model_instance_deleted])
+
+    def delete_bucket_and_token(self, bucket_id, bucket_token_id) -> bool:
+        """
+        Deletes a bucket and its token by ID. Resources that are already gone count as deleted.
+
+        Parameters:
+            bucket_id: ID of the bucket.
+            bucket_token_id: ID of the bucket's read-write token.
+
+        Returns:
+            True if both are gone; False otherwise.
+        """
+        token_deleted = False
+        bucket_deleted = False
+
         # Delete the Token in InfluxDB
         delete_token_url = f'{self.auth_url}/{bucket_token_id}'
-        delete_token_response = requests.delete(
+        delete_token_response = get_influx_session().delete(
             delete_token_url, headers={'Authorization': f'Token {INFLUX_ALL_ACCESS_TOKEN}'}
         )
-        if delete_token_response.status_code in [204, 200]:
+        if delete_token_response.status_code in [204, 200, 404]:
             print(f"Bucket-token with ID '{bucket_token_id}' deleted.")
             token_deleted = True
         else:
@@ -154,19 +185,11 @@ class InfluxUserManager:
             print(f"Bucket with ID '{bucket_id}' deleted.")
             bucket_deleted = True
         except Exception as e:
-            if e.status == 404:  # Bucket not found
+            if getattr(e, 'status', None) == 404:  # Bucket not found
                 print("Bucket already deleted or not found.")
                 bucket_deleted = True
             else:
                 print(f"Failed to delete bucket: {e}")
                 bucket_deleted = False
 
-        if bucket_deleted:
-            try:
-                # Delete the user_models.InfluxUserData model instance
-                influx_user_data.delete()
-                model_instance_deleted = True
-            except Exception as e:
-                print(f'Exception occurred while deleting user_models.InfluxUserData model instance: {e}')
-
-        return all([token_deleted, bucket_deleted, model_instance_deleted])
+        return token_deleted and bucket_deleted
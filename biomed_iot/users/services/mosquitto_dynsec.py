@@ -1,9 +1,25 @@
+import time
+import asyncio
+import uuid
 import threading
 import json
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import paho.mqtt.client as mqtt
 from paho.mqtt.client import MQTT_ERR_SUCCESS
 
 
+class DynSecUnavailableError(ConnectionError):
+	"""Raised instead of waiting for timeouts while the broker is unreachable or the circuit breaker is open."""
+
+
+# Replies to these grow with the number of entries on the broker
+LISTING_COMMANDS = frozenset({'listClients', 'listRoles', 'listGroups'})
+
+
+def _has_listing(command):
+	return any(entry['command'] in LISTING_COMMANDS for entry in command['commands'])
+
+
 class MosquittoDynSec:
 	"""
 	Based on commands at https://github.com/eclipse/mosquitto/blob/master/plugins/dynamic-security/README.md
@@ -24,6 +40,18 @@ class MosquittoDynSec:
 	GETTER functions similarly return a tuple of (success, response, send_code) where 'response' in this case
 	contains the requested configuration data.
 
+	Every command is tagged with a unique 'correlationData' value that the plugin echoes back in its response.
+	Responses are matched to the waiting caller by that value, so many threads can send commands over one
+	instance (and one connection) at the same time.
+
+	While the broker is unreachable, commands fail fast with DynSecUnavailableError instead of waiting for
+	the full timeouts: the connection is given sub_event_timeout_seconds to come back, commands in flight fail
+	as soon as the connection drops, and after failure_threshold failed commands in a row a circuit breaker
+	rejects all commands for circuit_reset_seconds before letting one through to probe the broker again.
+	The response timeout adapts to a moving average of the measured round-trip time (scaled by the number of
+	commands in the payload, at least min_response_timeout_seconds), capped by msg_received_timeout_seconds.
+	Listings always get msg_received_timeout_seconds.
+
 	Example usage:
 	    mosquitto_dyn_sec = MosquittoDynSec(dynsec_user, dynsec_user_password)
 	    success, response, send_code = mosquitto_dyn_sec.set_default_acl_access(False, True, False, True)
@@ -49,6 +77,14 @@ class MosquittoDynSec:
 		    host (str): The hostname or IP address of the MQTT broker.
 		    port (int): The network port of the MQTT server.
 		"""
+		self._setup_client(username, password, host, port)
+
+		# Connect and start MQTT client
+		self.client.connect(self.host, self.port, 60)
+		self.client.loop_start()
+
+	def _setup_client(self, username, password, host, port):
+		# Everything but the network activity, shared with AsyncMosquittoDynSec
 		self.username = username
 		self.password = password
 		self.host = host
@@ -57,7 +93,13 @@ class MosquittoDynSec:
 		# MQTT topics
 		self.send_command_topic = '$CONTROL/dynamic-security/v1'
 		self.response_topic = '$CONTROL/dynamic-security/v1/response'
-		self.response_msg = None
+
+		# Futures of commands waiting for their response, keyed by correlationData
+		self.pending_responses = {}
+		self.pending_responses_lock = threading.Lock()
+
+		# Optional DynSecMirror (see mosquitto_dynsec_mirror.py) that is kept current by successful writes
+		self.mirror = None
 
 		# Create MQTT client instance
 		# Changes since paho-mqtt 2.0: https://eclipse.dev/paho/files/paho.mqtt.python/html/migrations.html
@@ -68,28 +110,41 @@ class MosquittoDynSec:
 		# Set username and password
 		self.client.username_pw_set(self.username, self.password)
 		self.client.reconnect_delay_set(min_delay=1, max_delay=2)
+		self.client.connect_timeout = 2
 
 		# Events and timeouts
 		self.subscription_event = threading.Event()
-		self.message_received_event = threading.Event()
-		self.sub_event_timeout_seconds = 5
+		self.sub_event_timeout_seconds = 2  # paho retries the connection after at most 2 s (reconnect_delay_set)
 		self.msg_received_timeout_seconds = 10
+		# Not lower: a burst of fast replies must not make a slow but healthy broker look down
+		self.min_response_timeout_seconds = 3
+
+		# Moving average and deviation of the round-trip time per command (see _response_timeout)
+		self.rtt_average = None
+		self.rtt_deviation = None
+
+		# Circuit breaker (see _check_circuit)
+		self.failure_threshold = 3
+		self.circuit_reset_seconds = 15
+		self.consecutive_failures = 0
+		self.circuit_open_until = 0
+		self.circuit_lock = threading.Lock()
 
 		# Assign callback functions
 		self.client.on_connect = self.on_connect
+		self.client.on_disconnect = self.on_disconnect
 		self.client.on_subscribe = self.on_subscribe
 		self.client.on_message = self.on_message
 		self.client.on_publish = self.on_publish
 
-		# Connect and start MQTT client
-		self.client.connect(self.host, self.port, 60)
-		self.client.loop_start()
-
 	def disconnect(self):
 		self.client.loop_stop()
 		self.client.disconnect()
 		# print("Disconnected MQTT client.")
 
+	def is_connected(self):
+		return self.client.is_connected()
+
 	"""
     Internal-use functions and callbacks (only used by the class itself)
     """
@@ -100,9 +155,16 @@ class MosquittoDynSec:
 
 	def on_message(self, client, userdata, msg):
 		# print(f"Topic: `{msg.topic}`\nPayload: `{json.loads(msg.payload.decode('utf-8'))}`")
-		self.response_msg = json.loads(msg.payload.decode('utf-8'))
-		# print(f"on_message: self.response_msg = {self.response_msg}")
-		self.message_received_event.set()  # must be last line to make sure, the message is stored in self.response_msg
+		try:
+			responses = json.loads(msg.payload.decode('utf-8')).get('responses', [])
+		except (ValueError, AttributeError):
+			return
+		for response in responses:
+			with self.pending_responses_lock:
+				future = self.pending_responses.pop(response.get('correlationData'), None)
+			# Responses without a waiting future (e.g. late replies after a timeout) are dropped
+			if future is not None:
+				future.set_result(response)
 
 	def on_connect(self, client, userdata, flags, rc):
 		self.client.subscribe(self.response_topic, qos=2)
@@ -113,6 +175,13 @@ class MosquittoDynSec:
 			# print(f"Failed to connect, return code: {rc}\n")
 			pass
 
+	def on_disconnect(self, client, userdata, rc):
+		# The response topic is subscribed again in on_connect after paho reconnected automatically.
+		# Until then, commands wait in _send_command instead of publishing into the void.
+		self.subscription_event.clear()
+		# Replies to commands sent over the lost connection never arrive, so don't let them wait for the timeout
+		self._fail_pending(DynSecUnavailableError('Connection to the broker lost'))
+
 	def on_subscribe(self, client, userdata, mid, granted_qos):
 		# print("Subscribed to topic")
 		# Signal successful subscription
@@ -123,72 +192,185 @@ class MosquittoDynSec:
 		# Construct and send a command to the control topic
 		payload = json.dumps(command)
 		# Wait for the subscription to be successful
-		self.subscription_event.wait(self.sub_event_timeout_seconds)
+		if not self.subscription_event.wait(self.sub_event_timeout_seconds):
+			raise DynSecUnavailableError(f'Not connected to the MQTT broker at {self.host}:{self.port}')
 		# print("Now publishing after successful subscription")
 		send_code = self.client.publish(self.send_command_topic, payload, qos=2)
 		# print(f'in _send_command: published". send_code = {send_code}')
 
 		return send_code
 
-	def _get_response(self):
-		response = self.response_msg
-		# warte bis response message gekommen
-		event_set = self.message_received_event.wait(self.msg_received_timeout_seconds)
-		if event_set:
-			response = self.response_msg
-			# print(f"Message received: self.response_msg = {self.response_msg}")
-			# After processing the message, clear the event and reset self.reply_message
-			self.message_received_event.clear()
-			self.response_msg = None  # reset the variable for next request to the Dynamic Security Plugin
+	def _register_command(self, command):
+		# Tag each command with a unique correlationData and create a future that on_message resolves
+		pending = {}
+		with self.pending_responses_lock:
+			for entry in command['commands']:
+				correlation_id = uuid.uuid4().hex
+				entry['correlationData'] = correlation_id
+				pending[correlation_id] = self.pending_responses[correlation_id] = self._create_future()
+		return pending
+
+	def _create_future(self):
+		return Future()
+
+	def _discard_pending(self, pending):
+		with self.pending_responses_lock:
+			for correlation_id in pending:
+				self.pending_responses.pop(correlation_id, None)
+
+	def _fail_pending(self, exception):
+		with self.pending_responses_lock:
+			futures = list(self.pending_responses.values())
+			self.pending_responses.clear()
+		for future in futures:
+			if not future.done():
+				future.set_exception(exception)
+
+	def _get_response(self, pending, command):
+		deadline = time.monotonic() + self._response_timeout(command)
+		responses = []
+		try:
+			for future in pending.values():
+				# wait until the response for this command arrived
+				responses.append(future.result(max(0, deadline - time.monotonic())))
+		except FutureTimeoutError:
+			return None
+		finally:
+			self._discard_pending(pending)
+
+		return {'responses': responses}
+
+	def _response_timeout(self, command):
+		# Like TCP's retransmission timeout: average plus four deviations, per command of the payload.
+		# Listings grow with the broker's data (a page of verbose clients), they always get the full timeout.
+		if self.rtt_average is None or _has_listing(command):
+			return self.msg_received_timeout_seconds
+		timeout = (self.rtt_average + 4 * self.rtt_deviation) * len(command['commands'])
+		return min(self.msg_received_timeout_seconds, max(self.min_response_timeout_seconds, timeout))
+
+	def _check_circuit(self):
+		# After failure_threshold failed commands in a row, commands fail immediately until circuit_open_until.
+		# Then a single command is let through to probe the broker (half-open), all others keep failing fast.
+		with self.circuit_lock:
+			if self.consecutive_failures < self.failure_threshold:
+				return
+			now = time.monotonic()
+			if now < self.circuit_open_until:
+				raise DynSecUnavailableError(
+					f'MQTT broker unavailable, {self.consecutive_failures} failed commands in a row'
+				)
+			self.circuit_open_until = now + self.circuit_reset_seconds
+
+	def _record_failure(self):
+		with self.circuit_lock:
+			self.consecutive_failures += 1
+			if self.consecutive_failures == self.failure_threshold:
+				self.circuit_open_until = time.monotonic() + self.circuit_reset_seconds
+
+	def _record_success(self, elapsed, command_count):
+		with self.circuit_lock:
+			self.consecutive_failures = 0
+			self.circuit_open_until = 0
+			if elapsed is None:
+				return
+			sample = elapsed / command_count
+			if self.rtt_average is None:
+				self.rtt_average, self.rtt_deviation = sample, sample / 2
+			else:
+				self.rtt_deviation = 0.75 * self.rtt_deviation + 0.25 * abs(sample - self.rtt_average)
+				self.rtt_average = 0.875 * self.rtt_average + 0.125 * sample
+
+	def _record_response(self, command, response, started):
+		if response is None:
+			self._record_failure()
+		elif _has_listing(command):
+			self._record_success(None, 0)  # no round-trip sample, see _response_timeout
 		else:
-			# print(f"No message received: self.response_msg = {self.response_msg}")
-			self.response_msg = None
-			response = self.response_msg
+			self._record_success(time.monotonic() - started, len(command['commands']))
 
-		return response
-
-	def _is_response_successful(self, command, response, send_code):
-		# print(f"In '_is_response_successful'. command: {command}, response: {response}")
+	@staticmethod
+	def _is_command_successful(command_entry, response_entry):
 		# Response codes for Mosquitto on GitHub:
 		# https://github.com/search?q=repo%3Aeclipse%2Fmosquitto++%7B%27responses%27&type=code
 		successful = False
-		if response is not None and send_code.rc == MQTT_ERR_SUCCESS:
-			# Get command name of the command sent and command in response
-			command_name = command['commands'][0]['command']  # only one command is expected per function call
-			response_command_name = response['responses'][0]['command']
-
-			if command_name == response_command_name:  # Check if the expected command is present in the response
-				successful = True
-			if 'error' in response['responses'][0]:
-				# print(f"In 'error' in response['responses'][0]'. Response: {response['responses'][0]}")
-				successful = False
-				if 'already' in response['responses'][0]['error']:
-					# print('"already" in response["responses"][0]["error"]')
-					# caveat: prone to minterpretation if response messages change in the future
-					# Known responses containing 'already' on April 16., 2024:
-					# 'Role already exists'
-					# 'Group already exists'
-					# 'Group is already in this role'
-					# 'Client is already in this group'
-					# 'ACL with this topic already exists'
-					successful = True  # since the DSP configuration already matches the desired state
-
+		# Check if the expected command is in the response
+		if command_entry['command'] == response_entry.get('command'):
+			successful = True
+		if 'error' in response_entry:
+			# print(f"In 'error' in response_entry. Response: {response_entry}")
+			successful = False
+			if 'already' in response_entry['error']:
+				# print('"already" in response_entry["error"]')
+				# caveat: prone to minterpretation if response messages change in the future
+				# Known responses containing 'already' on April 16., 2024:
+				# 'Role already exists'
+				# 'Group already exists'
+				# 'Group is already in this role'
+				# 'Client is already in this group'
+				# 'ACL with this topic already exists'
+				successful = True  # since the DSP configuration already matches the desired state
 		return successful
 
+	def _is_response_successful(self, command, response, send_code):
+		# print(f"In '_is_response_successful'. command: {command}, response: {response}")
+		if response is None or send_code.rc != MQTT_ERR_SUCCESS:
+			return False
+		# Responses are listed in the order of the commands (see _get_response)
+		return all(
+			self._is_command_successful(command_entry, response_entry)
+			for command_entry, response_entry in zip(command['commands'], response['responses'])
+		)
+
 	def _execute_command(self, command):
 		# print(f"In '_execute_command'. command: {command}")
-		send_code = self._send_command(command)  # send_code for debugging
-		# print(f"In '_execute_command'. send_code: {send_code}")
-		response = self._get_response()
-		# print(f"In '_execute_command'. response: {response}")
+		self._check_circuit()
+		pending = self._register_command(command)
+		started = time.monotonic()
+		try:
+			send_code = self._send_command(command)  # send_code for debugging
+			# print(f"In '_execute_command'. send_code: {send_code}")
+			response = self._get_response(pending, command)
+			# print(f"In '_execute_command'. response: {response}")
+		except DynSecUnavailableError:
+			self._discard_pending(pending)
+			self._record_failure()
+			raise
+		self._record_response(command, response, started)
 		success = self._is_response_successful(command, response, send_code)
 		# print(f"In '_execute_command'. success: {success}")
+		if self.mirror is not None and response is not None:
+			self.mirror.apply(command, response)
 		return success, response, send_code
 
+	def _iter_listing(self, list_function, key, verbose, page_size):
+		offset = 0
+		while True:
+			success, response, _ = list_function(verbose=verbose, count=page_size, offset=offset)
+			if not success:
+				raise ConnectionError(f'Could not list {key} at offset {offset}: {response}')
+			data = response['responses'][0]['data']
+			page = data.get(key, [])
+			yield from page
+			offset += len(page)
+			if not page or offset >= data.get('totalCount', 0):
+				return
+
 	"""
     External-use getter- and setter-functions (use these to interact with the Mosquitto Dynamic Security Plugin)
     """
 
+	def batch(self):
+		"""
+		Returns a DynSecBatch that collects commands and sends them to the plugin in a single publish.
+
+		Example:
+		    batch = mosquitto_dyn_sec.batch()
+		    batch.create_role("BasicSubscriber")
+		    batch.create_client("john_doe", "secret", roles=[{"rolename": "BasicSubscriber", "priority": -1}])
+		    results = batch.execute()  # [(success, response), (success, response)]
+		"""
+		return DynSecBatch(self)
+
 	def set_default_acl_access(
 		self,
 		publish_client_send_allow,
@@ -352,6 +534,24 @@ class MosquittoDynSec:
 
 		return self._execute_command(command)
 
+	def iter_clients(self, verbose=False, page_size=500):
+		"""
+		Iterates over all clients, fetching them page by page with listClients.
+
+		Keeps memory flat and every single response small, however many clients the broker holds.
+		The listing is not a snapshot: clients created or deleted while iterating may be missed or repeated.
+
+		:param verbose: If True, yields detailed information about each client. If False, yields only usernames.
+		:param page_size: The number of clients requested per listClients command.
+		:return: Generator of clients in the broker's order.
+		:raises ConnectionError: If a page could not be fetched.
+
+		Example:
+		    for client in iter_clients(verbose=True, page_size=200):
+		        ...
+		"""
+		return self._iter_listing(self.list_clients, 'clients', verbose, page_size)
+
 	def modify_client(
 		self,
 		username,
@@ -599,6 +799,24 @@ class MosquittoDynSec:
 
 		return self._execute_command(command)
 
+	def iter_groups(self, verbose=False, page_size=500):
+		"""
+		Iterates over all groups, fetching them page by page with listGroups.
+
+		Keeps memory flat and every single response small, however many groups the broker holds.
+		The listing is not a snapshot: groups created or deleted while iterating may be missed or repeated.
+
+		:param verbose: If True, yields detailed information about each group. If False, yields only group names.
+		:param page_size: The number of groups requested per listGroups command.
+		:return: Generator of groups in the broker's order.
+		:raises ConnectionError: If a page could not be fetched.
+
+		Example:
+		    for group in iter_groups(verbose=True, page_size=200):
+		        ...
+		"""
+		return self._iter_listing(self.list_groups, 'groups', verbose, page_size)
+
 	def modify_group(self, groupname, textname=None, textdescription=None, roles=None, clients=None):
 		"""
 		Modifies an existing group with new properties, roles, and clients.
@@ -793,6 +1011,24 @@ class MosquittoDynSec:
 
 		return self._execute_command(command)
 
+	def iter_roles(self, verbose=False, page_size=500):
+		"""
+		Iterates over all roles, fetching them page by page with listRoles.
+
+		Keeps memory flat and every single response small, however many roles the broker holds.
+		The listing is not a snapshot: roles created or deleted while iterating may be missed or repeated.
+
+		:param verbose: If True, yields detailed information about each role. If False, yields only role names.
+		:param page_size: The number of roles requested per listRoles command.
+		:return: Generator of roles in the broker's order.
+		:raises ConnectionError: If a page could not be fetched.
+
+		Example:
+		    for role in iter_roles(verbose=True, page_size=200):
+		        ...
+		"""
+		return self._iter_listing(self.list_roles, 'roles', verbose, page_size)
+
 	def modify_role(self, rolename, textname=None, textdescription=None, acls=None):
 		"""
 		Modifies an existing role with new properties and/or a set of ACLs.
@@ -885,3 +1121,248 @@ class MosquittoDynSec:
 		}
 
 		return self._execute_command(command)
+
+
+class DynSecBatch(MosquittoDynSec):
+	"""
+	Collects Dynamic Security Plugin commands and sends them as one '{"commands": [...]}' payload.
+
+	The batch offers the same setter and getter functions as MosquittoDynSec. Instead of sending each
+	command, they append it to the batch and return the batch itself, so calls can also be chained.
+	execute() publishes all collected commands at once and waits for the single reply of the plugin.
+
+	Attributes:
+	    dynsec (MosquittoDynSec): The connected instance used to send the batch.
+	    commands (list): The collected command entries in the order they were added.
+	"""
+
+	def __init__(self, dynsec):
+		self.dynsec = dynsec
+		self.commands = []
+
+	def __len__(self):
+		return len(self.commands)
+
+	def _execute_command(self, command):
+		self.commands.extend(command['commands'])
+		return self
+
+	def execute(self):
+		"""
+		Sends all collected commands in one publish and empties the batch.
+
+		:return: List with one tuple of (success, response) per command, in the order the commands were added.
+		         'response' is the plugin's response entry for that command, or None if no reply was received.
+		"""
+		if not self.commands:
+			return []
+		command = {'commands': self.commands}
+		self.commands = []
+
+		_, response, send_code = self.dynsec._execute_command(command)
+		return self._results(command, response, send_code)
+
+	def _results(self, command, response, send_code):
+		if response is None or send_code.rc != MQTT_ERR_SUCCESS:
+			return [(False, None) for _ in command['commands']]
+		return [
+			(self.dynsec._is_command_successful(command_entry, response_entry), response_entry)
+			for command_entry, response_entry in zip(command['commands'], response['responses'])
+		]
+
+
+class AsyncMosquittoDynSec(MosquittoDynSec):
+	"""
+	asyncio counterpart of MosquittoDynSec with the same setter and getter functions.
+
+	The MQTT socket is driven by the running event loop through paho's socket callbacks instead of a
+	loop_start() network thread, and callers wait on asyncio futures instead of blocking a thread each.
+	All setter and getter functions are coroutines returning the same (success, response, send_code) tuple,
+	so hundreds of commands can be in flight on one connection from a single thread.
+
+	An instance belongs to the event loop it was connected in and is not thread-safe.
+
+	Example usage:
+	    async with AsyncMosquittoDynSec(dynsec_user, dynsec_user_password) as mosquitto_dyn_sec:
+	        results = await asyncio.gather(*(mosquitto_dyn_sec.create_role(name) for name in rolenames))
+	"""
+
+	def __init__(self, username, password, host="localhost", port=1884):
+		"""
+		Initializes a new instance of the AsyncMosquittoDynSec class without connecting.
+
+		Call 'await connect()' (or use 'async with') inside the event loop before sending commands.
+
+		Parameters:
+		    username (str): The username of the client that writes to the '$CONTROL/dynamic-security/v1' topic.
+		    password (str): The password of the client that writes to the '$CONTROL/dynamic-security/v1' topic.
+		    host (str): The hostname or IP address of the MQTT broker.
+		    port (int): The network port of the MQTT server.
+		"""
+		self._setup_client(username, password, host, port)
+		self.loop = None
+		self.subscribed = None  # asyncio.Event, created in connect() since it belongs to the running loop
+		self._misc_task = None
+		self._closing = False
+
+		self.client.on_socket_open = self.on_socket_open
+		self.client.on_socket_close = self.on_socket_close
+		self.client.on_socket_register_write = self.on_socket_register_write
+		self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+	async def __aenter__(self):
+		await self.connect()
+		return self
+
+	async def __aexit__(self, exc_type, exc, tb):
+		await self.close()
+
+	async def connect(self):
+		"""Connects to the broker and waits (up to sub_event_timeout_seconds) until the response topic is subscribed."""
+		self.loop = asyncio.get_running_loop()
+		self.subscribed = asyncio.Event()
+		self._closing = False
+		# Only the TCP connect blocks (the broker listens on localhost), CONNACK and SUBACK arrive through the loop
+		self.client.connect(self.host, self.port, 60)
+		self._misc_task = self.loop.create_task(self._misc_loop())
+		try:
+			await asyncio.wait_for(self.subscribed.wait(), self.sub_event_timeout_seconds)
+		except TimeoutError:
+			pass
+
+	def disconnect(self):
+		self._closing = True
+		if self._misc_task is not None:
+			self._misc_task.cancel()
+			self._misc_task = None
+		self.client.disconnect()
+
+	async def close(self):
+		"""Disconnects and gives the event loop the chance to write the DISCONNECT packet."""
+		self.disconnect()
+		for _ in range(10):
+			if self.client.socket() is None:
+				break
+			await asyncio.sleep(0.01)
+
+	"""
+    Internal-use functions and callbacks (only used by the class itself)
+    """
+
+	def on_socket_open(self, client, userdata, sock):
+		self.loop.add_reader(sock, client.loop_read)
+
+	def on_socket_close(self, client, userdata, sock):
+		self.loop.remove_reader(sock)
+		self.loop.remove_writer(sock)
+
+	def on_socket_register_write(self, client, userdata, sock):
+		self.loop.add_writer(sock, client.loop_write)
+
+	def on_socket_unregister_write(self, client, userdata, sock):
+		self.loop.remove_writer(sock)
+
+	async def _misc_loop(self):
+		# Keepalive handling, and reconnecting after the broker went away (paho only does this in its own thread)
+		while not self._closing:
+			if self.client.socket() is None:
+				try:
+					self.client.reconnect()
+				except OSError:
+					pass
+			else:
+				self.client.loop_misc()
+			await asyncio.sleep(1)
+
+	def on_disconnect(self, client, userdata, rc):
+		self.subscribed.clear()
+		self._fail_pending(DynSecUnavailableError('Connection to the broker lost'))
+
+	def on_subscribe(self, client, userdata, mid, granted_qos):
+		self.subscribed.set()
+
+	def _create_future(self):
+		return self.loop.create_future()
+
+	async def _send_command(self, command):
+		payload = json.dumps(command)
+		# Wait for the subscription to be successful
+		try:
+			await asyncio.wait_for(self.subscribed.wait(), self.sub_event_timeout_seconds)
+		except TimeoutError:
+			raise DynSecUnavailableError(f'Not connected to the MQTT broker at {self.host}:{self.port}') from None
+		return self.client.publish(self.send_command_topic, payload, qos=2)
+
+	async def _get_response(self, pending, command):
+		try:
+			timeout = self._response_timeout(command)
+			responses = await asyncio.wait_for(asyncio.gather(*pending.values()), timeout)
+		except TimeoutError:
+			return None
+		finally:
+			self._discard_pending(pending)
+
+		return {'responses': responses}
+
+	async def _iter_listing(self, list_function, key, verbose, page_size):
+		# async generator, iterate with 'async for'
+		offset = 0
+		while True:
+			success, response, _ = await list_function(verbose=verbose, count=page_size, offset=offset)
+			if not success:
+				raise ConnectionError(f'Could not list {key} at offset {offset}: {response}')
+			data = response['responses'][0]['data']
+			page = data.get(key, [])
+			for entry in page:
+				yield entry
+			offset += len(page)
+			if not page or offset >= data.get('totalCount', 0):
+				return
+
+	async def _execute_command(self, command):
+		self._check_circuit()
+		pending = self._register_command(command)
+		started = time.monotonic()
+		try:
+			send_code = await self._send_command(command)
+			response = await self._get_response(pending, command)
+		except DynSecUnavailableError:
+			self._discard_pending(pending)
+			self._record_failure()
+			raise
+		self._record_response(command, response, started)
+		success = self._is_response_successful(command, response, send_code)
+		return success, response, send_code
+
+	"""
+    External-use getter- and setter-functions (inherited from MosquittoDynSec, awaitable here)
+    """
+
+	def batch(self):
+		"""
+		Returns an AsyncDynSecBatch, execute() has to be awaited.
+
+		Example:
+		    batch = mosquitto_dyn_sec.batch()
+		    batch.create_role("BasicSubscriber")
+		    results = await batch.execute()  # [(success, response)]
+		"""
+		return AsyncDynSecBatch(self)
+
+
+class AsyncDynSecBatch(DynSecBatch):
+	"""DynSecBatch for an AsyncMosquittoDynSec instance."""
+
+	async def execute(self):
+		"""
+		Sends all collected commands in one publish and empties the batch.
+
+		:return: see DynSecBatch.execute()
+		"""
+		if not self.commands:
+			return []
+		command = {'commands': self.commands}
+		self.commands = []
+
+		_, response, send_code = await self.dynsec._execute_command(command)
+		return self._results(command, response, send_code)
@@ -0,0 +1,310 @@
+import copy
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DynSecMirror:
+    """
+    In-process, read-through mirror of the clients, roles and groups of the Mosquitto Dynamic Security Plugin.
+
+    The mirror is filled from the verbose listClients/listRoles/listGroups replies (fetched page by page) and then
+    kept current by the successful writes of the MosquittoDynSec instance it is attached to. Once it is older
+    than ttl_seconds, the next read starts a reload in the background and is still served from the old state.
+    Changes made through other connections (e.g. another gunicorn worker) therefore show up shortly after one
+    TTL; pass force_refresh=True where that is not acceptable.
+
+    Entries have the format of the plugin's verbose listings (passwords are never part of them). All getters
+    return copies.
+
+    Example:
+        mirror = DynSecMirror(dynsec)
+        if mirror.get_role(rolename) is None:
+            dynsec.create_role(rolename)
+
+    Attributes:
+        dynsec (MosquittoDynSec): The connected instance used to load the mirror. Its writes update the mirror.
+        ttl_seconds (float): Age after which the mirror is reloaded from the broker.
+        page_size (int): Number of entries per listing request when (re)loading.
+        retry_seconds (float): Time after a failed reload during which the broker isn't asked again.
+    """
+
+    def __init__(self, dynsec, ttl_seconds=60, page_size=500, retry_seconds=10):
+        self.dynsec = dynsec
+        self.ttl_seconds = ttl_seconds
+        self.page_size = page_size
+        self.retry_seconds = retry_seconds
+        self.clients = {}
+        self.roles = {}
+        self.groups = {}
+        self.loaded_at = None  # time.monotonic() when the last successful reload started
+        self.failed_at = None  # time.monotonic() of the last failed reload, None after a success
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        # Writes applied while a reload is in flight, replayed onto the reloaded state
+        self._writes_during_refresh = None
+        dynsec.mirror = self
+
+    def refresh(self):
+        """Reload everything from the broker. Returns False and keeps the previous state if that failed."""
+        with self._refresh_lock:
+            return self._reload()
+
+    def _reload(self):
+        # the caller holds _refresh_lock
+        started = time.monotonic()
+        with self._lock:
+            self._writes_during_refresh = []
+        try:
+            try:
+                # paged, so no single listing reply grows with the number of device clients
+                clients = {c['username']: c for c in self.dynsec.iter_clients(True, self.page_size)}
+                roles = {r['rolename']: r for r in self.dynsec.iter_roles(True, self.page_size)}
+                groups = {g['groupname']: g for g in self.dynsec.iter_groups(True, self.page_size)}
+            except ConnectionError as e:
+                logger.error(f'Could not load the DynSec mirror from the broker: {e}')
+                self.failed_at = time.monotonic()
+                return False
+            with self._lock:
+                self.clients, self.roles, self.groups = clients, roles, groups
+                for command_entry in self._writes_during_refresh:
+                    self._apply(command_entry)
+                self.loaded_at = started
+                self.failed_at = None
+            return True
+        finally:
+            with self._lock:
+                self._writes_during_refresh = None
+
+    def _backing_off(self):
+        return self.failed_at is not None and time.monotonic() - self.failed_at < self.retry_seconds
+
+    def _reload_in_background(self):
+        try:
+            self._reload()
+        finally:
+            self._refresh_lock.release()
+
+    def _ensure_fresh(self, force_refresh):
+        """
+        Make sure there is a state to serve. The first load and forced refreshes block (concurrent callers wait
+        for the same reload instead of running their own). Once the state is older than ttl_seconds, it is
+        reloaded by a background thread and served as it is meanwhile. For retry_seconds after a failed reload,
+        the broker isn't asked again: the stale state is served, or ConnectionError raised if there is none.
+        """
+        if force_refresh or self.loaded_at is None:
+            requested = time.monotonic()
+            with self._refresh_lock:
+                # another thread may have reloaded while this one waited for the lock
+                if self.loaded_at is not None and (not force_refresh or self.loaded_at >= requested):
+                    return
+                if not self._backing_off():
+                    self._reload()
+            if self.loaded_at is None:
+                raise ConnectionError('Could not load the Dynamic Security configuration from the broker')
+            return
+        if time.monotonic() - self.loaded_at > self.ttl_seconds and not self._backing_off():
+            if self._refresh_lock.acquire(blocking=False):  # not already being reloaded
+                threading.Thread(target=self._reload_in_background, name='dynsec-mirror', daemon=True).start()
+
+    def get_client(self, username, force_refresh=False):
+        """Return the mirrored client entry, or None if the broker has no such client."""
+        self._ensure_fresh(force_refresh)
+        with self._lock:
+            return copy.deepcopy(self.clients.get(username))
+
+    def get_role(self, rolename, force_refresh=False):
+        """Return the mirrored role entry, or None if the broker has no such role."""
+        self._ensure_fresh(force_refresh)
+        with self._lock:
+            return copy.deepcopy(self.roles.get(rolename))
+
+    def get_group(self, groupname, force_refresh=False):
+        """Return the mirrored group entry, or None if the broker has no such group."""
+        self._ensure_fresh(force_refresh)
+        with self._lock:
+            return copy.deepcopy(self.groups.get(groupname))
+
+    def list_clients(self, force_refresh=False):
+        """Return the sorted usernames of all clients."""
+        self._ensure_fresh(force_refresh)
+        with self._lock:
+            return sorted(self.clients)
+
+    def list_roles(self, force_refresh=False):
+        """Return the sorted names of all roles."""
+        self._ensure_fresh(force_refresh)
+        with self._lock:
+            return sorted(self.roles)
+
+    def list_groups(self, force_refresh=False):
+        """Return the sorted names of all groups."""
+        self._ensure_fresh(force_refresh)
+        with self._lock:
+            return sorted(self.groups)
+
+    def apply(self, command, response):
+        """Apply the successful write commands of an executed '{"commands": [...]}' payload to the mirror."""
+        with self._lock:
+            if self.loaded_at is None and self._writes_during_refresh is None:
+                return  # nothing loaded yet, the first read loads the current state anyway
+            for command_entry, response_entry in zip(command['commands'], response['responses']):
+                # 'already exists' and similar errors leave the broker (and the mirror) unchanged
+                if 'error' in response_entry or command_entry['command'] != response_entry.get('command'):
+                    continue
+                if self._writes_during_refresh is not None:
+                    self._writes_during_refresh.append(command_entry)
+                self._apply(command_entry)
+
+    def _apply(self, command_entry):
+        handler = getattr(self, f'_apply_{command_entry["command"]}', None)
+        if handler is not None:  # getters and commands without mirrored state
+            handler(command_entry)
+
+    @staticmethod
+    def _role_list(roles):
+        return [{'rolename': role['rolename'], 'priority': role.get('priority', -1)} for role in roles or []]
+
+    @staticmethod
+    def _group_list(groups):
+        return [{'groupname': group['groupname'], 'priority': group.get('priority', -1)} for group in groups or []]
+
+    # Clients
+
+    def _apply_createClient(self, entry):
+        client = {key: entry[key] for key in ('username', 'clientid', 'textname', 'textdescription') if key in entry}
+        client['roles'] = self._role_list(entry.get('roles'))
+        client['groups'] = self._group_list(entry.get('groups'))
+        self.clients[entry['username']] = client
+        for group in client['groups']:
+            if group['groupname'] in self.groups:
+                self.groups[group['groupname']].setdefault('clients', []).append(
+                    {'username': entry['username'], 'priority': group['priority']}
+                )
+
+    def _apply_deleteClient(self, entry):
+        self.clients.pop(entry['username'], None)
+        for group in self.groups.values():
+            group['clients'] = [c for c in group.get('clients', []) if c['username'] != entry['username']]
+
+    def _apply_enableClient(self, entry):
+        if entry['username'] in self.clients:
+            self.clients[entry['username']].pop('disabled', None)
+
+    def _apply_disableClient(self, entry):
+        if entry['username'] in self.clients:
+            self.clients[entry['username']]['disabled'] = True
+
+    def _apply_modifyClient(self, entry):
+        client = self.clients.get(entry['username'])
+        if client is None:
+            return
+        client.update({key: entry[key] for key in ('clientid', 'textname', 'textdescription') if key in entry})
+        if 'roles' in entry:
+            client['roles'] = self._role_list(entry['roles'])
+        if 'groups' in entry:
+            client['groups'] = self._group_list(entry['groups'])
+
+    def _apply_setClientId(self, entry):
+        if entry['username'] in self.clients:
+            self.clients[entry['username']]['clientid'] = entry.get('clientid', '')
+
+    def _apply_addClientRole(self, entry):
+        client = self.clients.get(entry['username'])
+        if client is not None and all(role['rolename'] != entry['rolename'] for role in client['roles']):
+            client['roles'].append({'rolename': entry['rolename'], 'priority': entry.get('priority', -1)})
+
+    def _apply_removeClientRole(self, entry):
+        client = self.clients.get(entry['username'])
+        if client is not None:
+            client['roles'] = [role for role in client['roles'] if role['rolename'] != entry['rolename']]
+
+    # Groups
+
+    def _apply_createGroup(self, entry):
+        group = {key: entry[key] for key in ('groupname', 'textname', 'textdescription') if key in entry}
+        group['roles'] = self._role_list(entry.get('roles'))
+        group['clients'] = []
+        self.groups[entry['groupname']] = group
+
+    def _apply_deleteGroup(self, entry):
+        self.groups.pop(entry['groupname'], None)
+        for client in self.clients.values():
+            client['groups'] = [g for g in client.get('groups', []) if g['groupname'] != entry['groupname']]
+
+    def _apply_modifyGroup(self, entry):
+        group = self.groups.get(entry['groupname'])
+        if group is None:
+            return
+        group.update({key: entry[key] for key in ('textname', 'textdescription') if key in entry})
+        if 'roles' in entry:
+            group['roles'] = self._role_list(entry['roles'])
+        if 'clients' in entry:
+            group['clients'] = [
+                {'username': client['username'], 'priority': client.get('priority', -1)} for client in entry['clients']
+            ]
+
+    def _apply_addGroupClient(self, entry):
+        group = self.groups.get(entry['groupname'])
+        client = self.clients.get(entry['username'])
+        priority = entry.get('priority', -1)
+        if group is not None and all(c['username'] != entry['username'] for c in group.get('clients', [])):
+            group.setdefault('clients', []).append({'username': entry['username'], 'priority': priority})
+        if client is not None and all(g['groupname'] != entry['groupname'] for g in client.get('groups', [])):
+            client.setdefault('groups', []).append({'groupname': entry['groupname'], 'priority': priority})
+
+    def _apply_removeGroupClient(self, entry):
+        group = self.groups.get(entry['groupname'])
+        client = self.clients.get(entry['username'])
+        if group is not None:
+            group['clients'] = [c for c in group.get('clients', []) if c['username'] != entry['username']]
+        if client is not None:
+            client['groups'] = [g for g in client.get('groups', []) if g['groupname'] != entry['groupname']]
+
+    def _apply_addGroupRole(self, entry):
+        group = self.groups.get(entry['groupname'])
+        if group is not None and all(role['rolename'] != entry['rolename'] for role in group['roles']):
+            group['roles'].append({'rolename': entry['rolename'], 'priority': entry.get('priority', -1)})
+
+    def _apply_removeGroupRole(self, entry):
+        group = self.groups.get(entry['groupname'])
+        if group is not None:
+            group['roles'] = [role for role in group['roles'] if role['rolename'] != entry['rolename']]
+
+    # Roles
+
+    def _apply_createRole(self, entry):
+        role = {key: entry[key] for key in ('rolename', 'textname', 'textdescription') if key in entry}
+        role['acls'] = copy.deepcopy(entry.get('acls') or [])
+        self.roles[entry['rolename']] = role
+
+    def _apply_modifyRole(self, entry):
+        role = self.roles.get(entry['rolename'])
+        if role is None:
+            return
+        role.update({key: entry[key] for key in ('textname', 'textdescription') if key in entry})
+        if 'acls' in entry:
+            role['acls'] = copy.deepcopy(entry['acls'])
+
+    def _apply_deleteRole(self, entry):
+        self.roles.pop(entry['rolename'], None)
+        for owner in list(self.clients.values()) + list(self.groups.values()):
+            owner['roles'] = [role for role in owner.get('roles', []) if role['rolename'] != entry['rolename']]
+
+    def _apply_addRoleACL(self, entry):
+        role = self.roles.get(entry['rolename'])
+        if role is not None:
+            role.setdefault('acls', []).append(
+                {key: entry[key] for key in ('acltype', 'topic', 'priority', 'allow') if key in entry}
+            )
+
+    def _apply_removeRoleACL(self, entry):
+        role = self.roles.get(entry['rolename'])
+        if role is not None:
+            role['acls'] = [
+                acl
+                for acl in role.get('acls', [])
+                if not (acl['acltype'] == entry['acltype'] and acl['topic'] == entry['topic'])
+            ]
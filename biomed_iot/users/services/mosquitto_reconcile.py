@@ -0,0 +1,131 @@
+import users.models
+from .mosquitto_utils import get_shared_dynsec, MqttMetaDataManager, is_stale_control_client
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Roles created by MqttMetaDataManager. Other roles on the broker (e.g. 'admin') are never deleted as orphans.
+MANAGED_ROLE_PREFIXES = ('nodered-', 'device-', 'inout-')
+
+# Roles have to exist before clients are assigned to them
+ACTION_ORDER = (
+    'create_role',
+    'modify_role',
+    'create_client',
+    'add_client_role',
+    'modify_client',
+    'delete_client',
+    'delete_role',
+)
+
+
+def _acl_key(acls):
+    return sorted((acl['acltype'], acl['topic'], acl.get('allow', False), acl.get('priority', -1)) for acl in acls)
+
+
+class MqttReconciler:
+    """
+    Finds and fixes drift between the MqttMetaData/MqttClient tables and the Mosquitto Dynamic Security Plugin.
+
+    The database is the source of truth. plan() streams both sides, the broker listings page by page (keeping
+    only names, role assignments and ACLs) and the tables with QuerySet.iterator(), and returns the actions
+    that bring the broker in line. apply() sends them in batches of batch_size commands per publish.
+
+    Clients holding a Biomed IoT role (MANAGED_ROLE_PREFIXES) and Biomed IoT roles that only exist on the broker
+    are collected in orphan_clients and orphan_roles. They are only deleted with delete_orphans=True. The same
+    goes for control clients of processes that no longer run (stale_control_clients, see
+    is_stale_control_client). Other clients (the DynSec admin and its control clients, the system clients
+    MQTT_IN_TO_DB_USER and MQTT_OUT_TO_DB_USER, ...) and other roles are never touched. Passwords can't be read
+    from the broker, so they are not compared.
+
+    Example:
+        reconciler = MqttReconciler()
+        actions = reconciler.plan()
+        results = reconciler.apply(actions)  # [(action, success), ...]
+    """
+
+    def __init__(self, dynsec=None, delete_orphans=False, page_size=500, batch_size=200):
+        self.dynsec = dynsec or get_shared_dynsec()
+        self.delete_orphans = delete_orphans
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.orphan_clients = []
+        self.orphan_roles = []
+        self.stale_control_clients = []
+
+    def plan(self):
+        """
+        Compare database and broker.
+
+        :return: List of actions (kind, name, kwargs) in the order they have to be applied. 'kind' is the
+                 MosquittoDynSec function to call with kwargs, 'name' the client or role it concerns.
+        :raises ConnectionError: If the broker listing could not be read completely.
+        """
+        broker_roles = {
+            role['rolename']: _acl_key(role.get('acls', [])) for role in self.dynsec.iter_roles(True, self.page_size)
+        }
+        broker_clients = {
+            client['username']: (client.get('textname', ''), {role['rolename'] for role in client.get('roles', [])})
+            for client in self.dynsec.iter_clients(True, self.page_size)
+        }
+
+        actions = []
+        for metadata in users.models.MqttMetaData.objects.iterator(chunk_size=2000):
+            for rolename, acls in MqttMetaDataManager.role_acls_for(metadata).items():
+                broker_acls = broker_roles.pop(rolename, None)
+                if broker_acls is None:
+                    actions.append(('create_role', rolename, {'rolename': rolename, 'acls': acls}))
+                elif broker_acls != _acl_key(acls):
+                    actions.append(('modify_role', rolename, {'rolename': rolename, 'acls': acls}))
+
+        for client in users.models.MqttClient.objects.iterator(chunk_size=2000):
+            broker_client = broker_clients.pop(client.username, None)
+            if broker_client is None:
+                roles = [{'rolename': client.rolename, 'priority': -1}] if client.rolename else None
+                kwargs = {
+                    'username': client.username,
+                    'password': client.password,
+                    'textname': client.textname,
+                    'roles': roles,
+                }
+                actions.append(('create_client', client.username, kwargs))
+                continue
+            textname, rolenames = broker_client
+            if client.rolename and client.rolename not in rolenames:
+                kwargs = {'username': client.username, 'rolename': client.rolename}
+                actions.append(('add_client_role', client.username, kwargs))
+            if client.textname != textname:
+                kwargs = {'username': client.username, 'textname': client.textname}
+                actions.append(('modify_client', client.username, kwargs))
+
+        self.orphan_clients = sorted(
+            name
+            for name, (_, rolenames) in broker_clients.items()
+            if any(rolename.startswith(MANAGED_ROLE_PREFIXES) for rolename in rolenames)
+        )
+        self.orphan_roles = sorted(name for name in broker_roles if name.startswith(MANAGED_ROLE_PREFIXES))
+        self.stale_control_clients = sorted(name for name in broker_clients if is_stale_control_client(name))
+        if self.delete_orphans:
+            actions.extend(('delete_client', name, {'username': name}) for name in self.orphan_clients)
+            actions.extend(('delete_client', name, {'username': name}) for name in self.stale_control_clients)
+            actions.extend(('delete_role', name, {'rolename': name}) for name in self.orphan_roles)
+
+        return sorted(actions, key=lambda action: ACTION_ORDER.index(action[0]))
+
+    def apply(self, actions):
+        """
+        Send the actions to the broker, batch_size commands per publish.
+
+        :return: List of (action, success) tuples in the order of the actions.
+        """
+        results = []
+        for start in range(0, len(actions), self.batch_size):
+            chunk = actions[start:start + self.batch_size]
+            batch = self.dynsec.batch()
+            for kind, name, kwargs in chunk:
+                getattr(batch, kind)(**kwargs)
+            for action, (success, response) in zip(chunk, batch.execute()):
+                if not success:
+                    logger.error(f'Reconciliation action {action[0]} for {action[1]} failed: {response}')
+                results.append((action, success))
+        return results
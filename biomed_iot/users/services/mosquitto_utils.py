@@ -1,5 +1,13 @@
+import os
+import time
+import asyncio
+import atexit
+import contextlib
+import secrets
+import threading
 import users.models
-from .mosquitto_dynsec import MosquittoDynSec
+from .mosquitto_dynsec import MosquittoDynSec, AsyncMosquittoDynSec, DynSecUnavailableError
+from .mosquitto_dynsec_mirror import DynSecMirror
 from django.db import transaction, IntegrityError
 from enum import Enum, unique
 from biomed_iot.config_loader import config
@@ -7,6 +15,176 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+_shared_dynsec = None
+_shared_dynsec_pid = None
+_shared_dynsec_lock = threading.Lock()
+_shared_dynsec_failed_at = None
+SHARED_DYNSEC_RETRY_SECONDS = 10
+
+
+def get_shared_dynsec():
+    """
+    Return the process-wide MosquittoDynSec control connection, starting it on first use.
+
+    Each (gunicorn worker) process keeps one connection open for all request threads. paho reconnects it on
+    its own if the broker restarts. A forked child never reuses the connection of its parent.
+
+    If the connection can't be started, DynSecUnavailableError is raised, and for SHARED_DYNSEC_RETRY_SECONDS
+    all further calls raise it right away instead of trying again.
+    """
+    global _shared_dynsec, _shared_dynsec_pid, _shared_dynsec_failed_at
+    with _shared_dynsec_lock:
+        if _shared_dynsec is None or _shared_dynsec_pid != os.getpid():
+            if _shared_dynsec_failed_at and time.monotonic() - _shared_dynsec_failed_at < SHARED_DYNSEC_RETRY_SECONDS:
+                raise DynSecUnavailableError('MQTT broker unavailable, DynSec control connection could not be started')
+            try:
+                _shared_dynsec = _start_shared_dynsec()
+            except (ConnectionError, OSError) as e:
+                _shared_dynsec_failed_at = time.monotonic()
+                raise DynSecUnavailableError(f'Could not start the DynSec control connection: {e}') from e
+            _shared_dynsec_failed_at = None
+            _shared_dynsec_pid = os.getpid()
+        return _shared_dynsec
+
+
+def get_dynsec_mirror():
+    """Return the DynSecMirror of the shared control connection. Reads are served from memory (see DynSecMirror)."""
+    return get_shared_dynsec().mirror
+
+
+def _start_shared_dynsec():
+    control_username = f'{_control_client_prefix()}{os.getpid()}'
+    control_password = _create_control_client(control_username, delete_stale=True)
+    dynsec = MosquittoDynSec(control_username, control_password)
+    DynSecMirror(dynsec)
+    atexit.register(_stop_shared_dynsec, dynsec, control_username)
+    logger.info(f'Started shared DynSec control connection {control_username}')
+    return dynsec
+
+
+def _control_client_prefix():
+    return f'{config.mosquitto.DYNSEC_ADMIN_USER}-ctl-'
+
+
+def is_control_client(username):
+    """True for the control clients created by _create_control_client (named '<admin>-ctl-<pid>[-...]')."""
+    return username.startswith(_control_client_prefix())
+
+
+def is_stale_control_client(username):
+    """
+    True for control clients whose process no longer runs. Processes that are killed (SIGKILL, gunicorn
+    timeout, out of memory) never get to delete theirs. All processes creating control clients run on the
+    broker's host, so the PID in the name tells whether the owner is alive.
+    """
+    if not is_control_client(username):
+        return False
+    pid = username[len(_control_client_prefix()):].split('-', 1)[0]
+    if not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:  # alive, runs as another user
+        pass
+    return False
+
+
+def _delete_stale_control_clients(admin_dynsec, batch_size=200):
+    try:
+        stale = [name for name in admin_dynsec.iter_clients(False) if is_stale_control_client(name)]
+        for start in range(0, len(stale), batch_size):
+            batch = admin_dynsec.batch()
+            for name in stale[start:start + batch_size]:
+                batch.delete_client(name)
+            batch.execute()
+    except ConnectionError as e:
+        # not fatal, the next process start tries again
+        logger.error(f'Could not delete stale DynSec control clients: {e}')
+        return
+    if stale:
+        logger.warning(f'Deleted {len(stale)} DynSec control client(s) of processes that no longer run')
+
+
+def _create_control_client(control_username, delete_stale=False):
+    """
+    Create a control client with its own broker identity and return its (random) password.
+
+    The broker runs with 'use_username_as_clientid true', so two connections of the DynSec admin user would
+    keep kicking each other out. A short-lived admin connection therefore creates a control client that holds
+    the same roles as the admin user. Its owner deletes it again when it is done. With delete_stale=True,
+    control clients left behind by processes that died are deleted first (see is_stale_control_client).
+    """
+    admin_username = config.mosquitto.DYNSEC_ADMIN_USER
+    admin_password = config.mosquitto.DYNSEC_ADMIN_PW
+    control_password = secrets.token_urlsafe(32)
+
+    admin_dynsec = MosquittoDynSec(admin_username, admin_password)
+    try:
+        success, response, _ = admin_dynsec.get_client(admin_username)
+        if not success:
+            raise ConnectionError(f'Could not read roles of DynSec admin user: {response}')
+        admin_roles = [
+            {'rolename': role['rolename'], 'priority': role.get('priority', -1)}
+            for role in response['responses'][0]['data']['client'].get('roles', [])
+        ]
+        if delete_stale:
+            _delete_stale_control_clients(admin_dynsec)
+        # A control client left behind by an earlier process with the same PID is taken over
+        admin_dynsec.delete_client(control_username)
+        success, response, _ = admin_dynsec.create_client(
+            control_username,
+            control_password,
+            textname='Biomed IoT control connection',
+            roles=admin_roles,
+        )
+        if not success:
+            raise ConnectionError(f'Could not create DynSec control client: {response}')
+    finally:
+        admin_dynsec.disconnect()
+    return control_password
+
+
+@contextlib.asynccontextmanager
+async def async_dynsec():
+    """
+    Async context manager yielding a connected AsyncMosquittoDynSec for the running event loop.
+
+    It connects as its own control client (see _create_control_client), so it does not interfere with the
+    shared threaded connection of the same process. The control client is deleted again on exit.
+
+    Example:
+        async with async_dynsec() as dynsec:
+            results = await asyncio.gather(*(dynsec.get_client(name) for name in usernames))
+    """
+    control_username = f'{_control_client_prefix()}{os.getpid()}-async-{secrets.token_hex(4)}'
+    control_password = await asyncio.to_thread(_create_control_client, control_username)
+    dynsec = AsyncMosquittoDynSec(control_username, control_password)
+    try:
+        await dynsec.connect()
+        yield dynsec
+    finally:
+        # Deleting the client kicks this very connection, so the reply may never arrive
+        dynsec.msg_received_timeout_seconds = 1
+        try:
+            await dynsec.delete_client(control_username)
+        except Exception as e:
+            logger.error(f'Error deleting DynSec control client {control_username}: {e}')
+        finally:
+            await dynsec.close()
+
+
+def _stop_shared_dynsec(dynsec, control_username):
+    # Deleting the client kicks this very connection, so the reply may never arrive. Don't block the exit.
+    dynsec.msg_received_timeout_seconds = 1
+    try:
+        dynsec.delete_client(control_username)
+    except Exception as e:
+        logger.error(f'Error deleting DynSec control client {control_username}: {e}')
+    finally:
+        dynsec.disconnect()
+
 @unique
 class RoleType(Enum):
     DEVICE = 'device'
@@ -17,8 +195,6 @@ class MqttMetaDataManager:
     def __init__(self, user):
         self.user = user
         self.metadata = self._get_or_create_mqtt_meta_data()
-        self.dynsec_username = config.mosquitto.DYNSEC_ADMIN_USER
-        self.dynsec_password = config.mosquitto.DYNSEC_ADMIN_PW
 
     def _get_or_create_mqtt_meta_data(self):
         meta_data = None
@@ -40,125 +216,62 @@ class MqttMetaDataManager:
                 logger.error('IntegrityError while creating MqttMetaData. Check if it already exists.')
         return meta_data
 
-    def create_nodered_role(self):
+    def role_acls(self):
+        """Return the ACLs of this user's Node-RED, device and in/out role, keyed by role name."""
+        return self.role_acls_for(self.metadata)
+
+    @staticmethod
+    def role_acls_for(metadata):
+        """Same as role_acls() for any MqttMetaData row, without creating a manager for its user."""
+        topic_id = metadata.user_topic_id
+        return {
+            metadata.nodered_role_name: [
+                {'acltype': 'subscribePattern', 'topic': f'in/{topic_id}/#', 'priority': -1, 'allow': True},
+                {'acltype': 'publishClientSend', 'topic': f'out/{topic_id}/#', 'priority': -1, 'allow': True},
+            ],
+            metadata.device_role_name: [
+                {'acltype': 'subscribePattern', 'topic': f'out/{topic_id}/#', 'priority': -1, 'allow': True},
+                {'acltype': 'publishClientSend', 'topic': f'in/{topic_id}/#', 'priority': -1, 'allow': True},
+            ],
+            metadata.inout_role_name: [
+                {'acltype': 'publishClientSend', 'topic': f'inout/{topic_id}/#', 'priority': -1, 'allow': True},
+                {'acltype': 'subscribePattern', 'topic': f'inout/{topic_id}/#', 'priority': -1, 'allow': True},
+            ],
+        }
+
+    def _create_role(self, rolename, description):
         success = False
         if self.metadata:
-            nodered_sub_topic = f'in/{self.metadata.user_topic_id}/#'
-            nodered_pub_topic = f'out/{self.metadata.user_topic_id}/#'
             try:
-                dynsec = MosquittoDynSec(self.dynsec_username, self.dynsec_password)
-                try:
-                    success = dynsec.create_role(
-                        self.metadata.nodered_role_name,
-                        acls=[
-                            {
-                                'acltype': 'subscribePattern',
-                                'topic': nodered_sub_topic,
-                                'priority': -1,
-                                'allow': True,
-                            },
-                            {
-                                'acltype': 'publishClientSend',
-                                'topic': nodered_pub_topic,
-                                'priority': -1,
-                                'allow': True,
-                            },
-                        ],
-                    )
-                    if not success:
-                        logger.error(f"Failed to create Node-RED role: {self.metadata.nodered_role_name}")
-                except Exception as e:
-                    logger.error(f"Exception during Node-RED role creation: {e}")
-                finally:
-                    dynsec.disconnect()
+                success, _, _ = get_shared_dynsec().create_role(rolename, acls=self.role_acls()[rolename])
+                if not success:
+                    logger.error(f"Failed to create {description} role: {rolename}")
+            except DynSecUnavailableError:
+                raise
             except Exception as e:
-                logger.error(f"Error initializing MosquittoDynSec for Node-RED role creation: {e}")
+                logger.error(f"Exception during {description} role creation: {e}")
         return success
 
+    def create_nodered_role(self):
+        return self._create_role(self.metadata.nodered_role_name, 'Node-RED') if self.metadata else False
+
     def create_device_role(self):
-        success = False
-        if self.metadata:
-            device_sub_topic = f'out/{self.metadata.user_topic_id}/#'
-            device_pub_topic = f'in/{self.metadata.user_topic_id}/#'
-            try:
-                dynsec = MosquittoDynSec(self.dynsec_username, self.dynsec_password)
-                try:
-                    success = dynsec.create_role(
-                        self.metadata.device_role_name,
-                        acls=[
-                            {
-                                'acltype': 'subscribePattern',
-                                'topic': device_sub_topic,
-                                'priority': -1,
-                                'allow': True,
-                            },
-                            {
-                                'acltype': 'publishClientSend',
-                                'topic': device_pub_topic,
-                                'priority': -1,
-                                'allow': True,
-                            },
-                        ],
-                    )
-                    if not success:
-                        logger.error(f"Failed to create device role: {self.metadata.device_role_name}")
-                except Exception as e:
-                    logger.error(f"Exception during device role creation: {e}")
-                finally:
-                    dynsec.disconnect()
-            except Exception as e:
-                logger.error(f"Error initializing MosquittoDynSec for device role creation: {e}")
-        return success
+        return self._create_role(self.metadata.device_role_name, 'device') if self.metadata else False
 
     def create_inout_role(self):
-        success = False
-        if self.metadata:
-            inout_topic = f'inout/{self.metadata.user_topic_id}/#'
-            try:
-                dynsec = MosquittoDynSec(self.dynsec_username, self.dynsec_password)
-                try:
-                    success = dynsec.create_role(
-                        self.metadata.inout_role_name,
-                        acls=[
-                            {
-                                'acltype': 'publishClientSend',
-                                'topic': inout_topic,
-                                'priority': -1,
-                                'allow': True,
-                            },
-                            {
-                                'acltype': 'subscribePattern',
-                                'topic': inout_topic,
-                                'priority': -1,
-                                'allow': True,
-                            },
-                        ],
-                    )
-                    if not success:
-                        logger.error(f"Failed to create in/out role: {self.metadata.inout_role_name}")
-                except Exception as e:
-                    logger.error(f"Exception during in/out role creation: {e}")
-                finally:
-                    dynsec.disconnect()
-            except Exception as e:
-                logger.error(f"Error initializing MosquittoDynSec for in/out role creation: {e}")
-        return success
+        return self._create_role(self.metadata.inout_role_name, 'in/out') if self.metadata else False
 
     def delete_inout_role(self):
         success = False
         if self.metadata:
             try:
-                dynsec = MosquittoDynSec(self.dynsec_username, self.dynsec_password)
-                try:
-                    success = dynsec.delete_role(self.metadata.inout_role_name)
-                    if not success:
-                        logger.error(f"Failed to delete in/out role: {self.metadata.inout_role_name}")
-                except Exception as e:
-                    logger.error(f"Exception during delete_role for in/out: {e}")
-                finally:
-                    dynsec.disconnect()
+                success, _, _ = get_shared_dynsec().delete_role(self.metadata.inout_role_name)
+                if not success:
+                    logger.error(f"Failed to delete in/out role: {self.metadata.inout_role_name}")
+            except DynSecUnavailableError:
+                raise
             except Exception as e:
-                logger.error(f"Error initializing MosquittoDynSec for in/out role deletion: {e}")
+                logger.error(f"Exception during delete_role for in/out: {e}")
         return success
 
 
@@ -167,17 +280,13 @@ class MqttMetaDataManager:
         if self.metadata:
             nodered_role_name = self.metadata.nodered_role_name
             try:
-                dynsec = MosquittoDynSec(self.dynsec_username, self.dynsec_password)
-                try:
-                    success = dynsec.delete_role(nodered_role_name)
-                    if not success:
-                        logger.error(f"Failed to delete Node-RED role: {nodered_role_name}")
-                except Exception as e:
-                    logger.error(f"Exception during delete_role for Node-RED: {e}")
-                finally:
-                    dynsec.disconnect()
+                success, _, _ = get_shared_dynsec().delete_role(nodered_role_name)
+                if not success:
+                    logger.error(f"Failed to delete Node-RED role: {nodered_role_name}")
+            except DynSecUnavailableError:
+                raise
             except Exception as e:
-                logger.error(f"Error initializing MosquittoDynSec for Node-RED role deletion: {e}")
+                logger.error(f"Exception during delete_role for Node-RED: {e}")
         return success
 
     def delete_device_role(self):
@@ -185,71 +294,112 @@ class MqttMetaDataManager:
         if self.metadata:
             device_role_name = self.metadata.device_role_name
             try:
-                dynsec = MosquittoDynSec(self.dynsec_username, self.dynsec_password)
-                try:
-                    success = dynsec.delete_role(device_role_name)
-                    if not success:
-                        logger.error(f"Failed to delete device role: {device_role_name}")
-                except Exception as e:
-                    logger.error(f"Exception during delete_role for device: {e}")
-                finally:
-                    dynsec.disconnect()
+                success, _, _ = get_shared_dynsec().delete_role(device_role_name)
+                if not success:
+                    logger.error(f"Failed to delete device role: {device_role_name}")
+            except DynSecUnavailableError:
+                raise
             except Exception as e:
-                logger.error(f"Error initializing MosquittoDynSec for device role deletion: {e}")
+                logger.error(f"Exception during delete_role for device: {e}")
         return success
 
 class MqttClientManager:
     def __init__(self, user):
         self.user = user
-        self.dynsec_username = config.mosquitto.DYNSEC_ADMIN_USER
-        self.dynsec_password = config.mosquitto.DYNSEC_ADMIN_PW
+        # Names of the roles and clients the last _provision() sent to the broker, created or not
+        self.sent_rolenames = []
+        self.sent_client_usernames = []
 
     def create_client(self, textname='New Device', role_type=None):
-        new_username = users.models.MqttClient.generate_unique_username()
-        new_password = users.models.MqttClient.generate_password()
-        success = False
+        meta_manager = MqttMetaDataManager(self.user)
+        metadata = meta_manager.metadata
+        if not metadata:
+            logger.error('MqttMetaData does not exist for the user.')
+            return False
 
-        try:
-            mqtt_meta_data = users.models.MqttMetaData.objects.get(user=self.user)
-            meta_manager = MqttMetaDataManager(self.user)
-
-            if role_type == RoleType.INOUT.value:
-                meta_manager.create_inout_role()
-                rolename = mqtt_meta_data.inout_role_name
-            elif role_type == RoleType.DEVICE.value:
-                meta_manager.create_device_role()
-                rolename = mqtt_meta_data.device_role_name
-            else:
-                textname = 'Node-RED MQTT Credentials'
-                meta_manager.create_nodered_role()
-                rolename = mqtt_meta_data.nodered_role_name
+        if role_type == RoleType.INOUT.value:
+            rolename = metadata.inout_role_name
+        elif role_type == RoleType.DEVICE.value:
+            rolename = metadata.device_role_name
+        else:
+            textname = 'Node-RED MQTT Credentials'
+            rolename = metadata.nodered_role_name
 
-            dynsec = MosquittoDynSec(self.dynsec_username, self.dynsec_password)
-            try:
-                success = dynsec.create_client(
-                    new_username,
-                    new_password,
-                    textname=textname,
-                    roles=[{'rolename': rolename, 'priority': -1}]
-                )
-            except Exception as e:
-                logger.error(f"Exception during create_client in MosquittoDynSec: {e}")
-            finally:
-                dynsec.disconnect()
+        return self._provision(meta_manager, [rolename], [self._new_client(textname, rolename)])
 
-        except users.models.MqttMetaData.DoesNotExist:
+    def create_initial_roles_and_clients(self):
+        """
+        Create the Node-RED, device and in/out role plus the Node-RED client and an example device client
+        of a new user. Only what is missing is created, so running it again (e.g. after a failure) is safe.
+        """
+        meta_manager = MqttMetaDataManager(self.user)
+        metadata = meta_manager.metadata
+        if not metadata:
             logger.error('MqttMetaData does not exist for the user.')
-        except IntegrityError as e:
-            logger.error(f'Database error when creating MQTT client: {e}')
-
-        if success:
-            users.models.MqttClient.objects.create(
-                user=self.user,
-                username=new_username,
-                password=new_password,
-                textname=textname,
-                rolename=rolename,
+            return False
+
+        existing_rolenames = set(
+            users.models.MqttClient.objects.filter(user=self.user).values_list('rolename', flat=True)
+        )
+        new_clients = [
+            self._new_client(textname, rolename)
+            for textname, rolename in [
+                ('Node-RED MQTT Credentials', metadata.nodered_role_name),
+                ('Example Device', metadata.device_role_name),
+            ]
+            if rolename not in existing_rolenames
+        ]
+        return self._provision(meta_manager, list(meta_manager.role_acls()), new_clients)
+
+    @staticmethod
+    def _new_client(textname, rolename):
+        return {
+            'username': users.models.MqttClient.generate_unique_username(),
+            'password': users.models.MqttClient.generate_password(),
+            'textname': textname,
+            'rolename': rolename,
+        }
+
+    def _provision(self, meta_manager, rolenames, new_clients):
+        """
+        Execute a provisioning plan in one batch (one round trip to the broker): create the roles and the new
+        clients. A role the broker already has answers 'Role already exists', which counts as success.
+        MqttClient rows are saved for the clients that were created. Returns True if everything succeeded.
+        """
+        role_acls = meta_manager.role_acls()
+        batch = get_shared_dynsec().batch()
+        for rolename in rolenames:
+            batch.create_role(rolename, acls=role_acls[rolename])
+        for new_client in new_clients:
+            batch.create_client(
+                new_client['username'],
+                new_client['password'],
+                textname=new_client['textname'],
+                roles=[{'rolename': new_client['rolename'], 'priority': -1}],
             )
+        if not len(batch):
+            return True
+
+        self.sent_rolenames = list(rolenames)
+        self.sent_client_usernames = [new_client['username'] for new_client in new_clients]
+        results = batch.execute()
+        role_results, client_results = results[:len(rolenames)], results[len(rolenames):]
+        all_successful = True
+        for rolename, (success, response) in zip(rolenames, role_results):
+            if not success:
+                all_successful = False
+                logger.error(f"Failed to create role {rolename}: {response}")
+        for new_client, (success, response) in zip(new_clients, client_results):
+            if not success:
+                all_successful = False
+                logger.error(f"Failed to create MQTT client '{new_client['textname']}': {response}")
+                continue
+            try:
+                users.models.MqttClient.objects.create(user=self.user, **new_client)
+            except IntegrityError as e:
+                all_successful = False
+                logger.error(f'Database error when creating MQTT client: {e}')
+        return all_successful
 
     # def create_client(self, textname='New Device', role_type=None):
     #     new_username = users.models.MqttClient.generate_unique_username()
@@ -296,16 +446,11 @@ class MqttClientManager:
         try:
             mqtt_client = users.models.MqttClient.objects.get(username=client_username, user=self.user)
             try:
-                dynsec = MosquittoDynSec(self.dynsec_username, self.dynsec_password)
-                try:
-                    success = dynsec.modify_client(client_username, textname=textname)
-                except Exception as e:
-                    logger.error(f"Exception during modify_client in MosquittoDynSec: {e}")
-                    success = False
-                finally:
-                    dynsec.disconnect()
+                success, _, _ = get_shared_dynsec().modify_client(client_username, textname=textname)
+            except DynSecUnavailableError:
+                raise
             except Exception as e:
-                logger.error(f"Error initializing MosquittoDynSec for modifying client: {e}")
+                logger.error(f"Exception during modify_client in MosquittoDynSec: {e}")
                 success = False
 
             if success:
@@ -321,16 +466,11 @@ class MqttClientManager:
         try:
             mqtt_client = users.models.MqttClient.objects.get(username=client_username, user=self.user)
             try:
-                dynsec = MosquittoDynSec(self.dynsec_username, self.dynsec_password)
-                try:
-                    success = dynsec.delete_client(client_username)
-                except Exception as e:
-                    logger.error(f"Exception during delete_client in MosquittoDynSec: {e}")
-                    success = False
-                finally:
-                    dynsec.disconnect()
+                success, _, _ = get_shared_dynsec().delete_client(client_username)
+            except DynSecUnavailableError:
+                raise
             except Exception as e:
-                logger.error(f"Error initializing MosquittoDynSec for client deletion: {e}")
+                logger.error(f"Exception during delete_client in MosquittoDynSec: {e}")
                 success = False
 
             if success:
@@ -344,21 +484,41 @@ class MqttClientManager:
         return False
 
     def delete_all_clients_for_user(self):
-        all_clients = users.models.MqttClient.objects.filter(user=self.user)
+        all_clients = list(users.models.MqttClient.objects.filter(user=self.user))
         try:
-            dynsec = MosquittoDynSec(self.dynsec_username, self.dynsec_password)
+            batch = get_shared_dynsec().batch()
             for client in all_clients:
-                try:
-                    success = dynsec.delete_client(client.username)
-                    if success:
-                        logger.info(f'MQTT client {client.username} deleted from dynamic security system successfully.')
-                    else:
-                        logger.error(f'Failed to delete MQTT client {client.username} from dynamic security system.')
-                except Exception as e:
-                    logger.error(f"Exception during deletion of client {client.username}: {e}")
-            dynsec.disconnect()
+                batch.delete_client(client.username)
+            for client, (success, response) in zip(all_clients, batch.execute()):
+                if success:
+                    logger.info(f'MQTT client {client.username} deleted from dynamic security system successfully.')
+                else:
+                    logger.error(f'Failed to delete MQTT client {client.username} from dynamic security system.')
+        except DynSecUnavailableError:
+            raise
         except Exception as e:
-            logger.error(f"Error initializing MosquittoDynSec for deleting all clients: {e}")
+            logger.error(f"Error deleting all MQTT clients of user from dynamic security system: {e}")
+
+    @staticmethod
+    def delete_from_broker(client_usernames, rolenames):
+        """
+        Delete clients and roles by name in one batch, for users whose database rows are already gone.
+        Clients and roles the broker doesn't know count as deleted, so running it again is safe.
+        """
+        batch = get_shared_dynsec().batch()
+        for username in client_usernames:
+            batch.delete_client(username)
+        for rolename in rolenames:
+            batch.delete_role(rolename)
+        if not len(batch):
+            return True
+        all_successful = True
+        for success, response in batch.execute():
+            if success or (response and response.get('error') in ('Client not found', 'Role not found')):
+                continue
+            logger.error(f'DynSec deletion failed: {response}')
+            all_successful = False
+        return all_successful
 
     def get_device_clients(self):
         try:
@@ -14,6 +14,9 @@ import jwt
 
 logger = logging.getLogger(__name__)
 
+# Written by the SERVERBLOCK_CREATE_SCRIPT_PATH script, included by the Nginx site configuration
+NODERED_NGINX_CONF_DIR = "/etc/nginx/conf.d/nodered_locations"
+
 
 class NoderedContainer:
     def __init__(self, nodered_user_data):
@@ -266,17 +269,17 @@ def update_nodered_nginx_conf(nodered_user_data):
         logger.error('Error:', result.stderr.decode())
 
 
+def nodered_nginx_conf_path(container_name):
+    """Path of the Nginx location block of a Node-RED container (written by update_nodered_nginx_conf)."""
+    return os.path.join(NODERED_NGINX_CONF_DIR, f"{container_name}.conf")
+
+
 def del_nodered_nginx_conf(nodered_user_data):
     """
     Run this function when django user is deleted or if
     delete container is implemented on the nodered dashboard page
     """
-    container_name = nodered_user_data.container_name
-
-    # Path to the server block create script.
-    # Could be replaced by a python script
-    script_path = "/etc/nginx/conf.d/nodered_locations"  # config.nodered.SERVERBLOCK_CREATE_SCRIPT_PATH
-    config_file_path = os.path.join(script_path, f"{container_name}.conf")
+    config_file_path = nodered_nginx_conf_path(nodered_user_data.container_name)
 
     command = ['sudo', 'rm', config_file_path]
     result = subprocess.run(
@@ -0,0 +1,130 @@
+import os
+import csv
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+import users.models
+
+logger = logging.getLogger(__name__)
+
+CSV_FIELDS = ('username', 'email', 'password', 'first_name', 'last_name')
+
+
+def _validate_row(row):
+    """Apply the checks of the registration form that bulk_create skips. Raises ValidationError."""
+    if not row['username']:
+        raise ValidationError('username is empty')
+    for field in ('username', 'email', 'first_name', 'last_name'):
+        max_length = users.models.CustomUser._meta.get_field(field).max_length
+        if len(row[field]) > max_length:
+            raise ValidationError(f'{field} is longer than {max_length} characters')
+    users.models.CustomUser.username_validator(row['username'])
+    validate_email(row['email'])
+
+
+def read_user_rows(csv_file):
+    """
+    Read users from a CSV file with a header row. 'username' and 'email' are required, 'password',
+    'first_name' and 'last_name' optional. Rows without a password get a random one.
+
+    :return: List of dicts with all CSV_FIELDS, plus 'line' (line number in the file) and 'error' (None if valid).
+    """
+    reader = csv.DictReader(csv_file)
+    missing = {'username', 'email'} - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f'CSV header lacks the column(s): {", ".join(sorted(missing))}')
+
+    rows = []
+    seen_usernames, seen_emails = set(), set()
+    for record in reader:
+        row = {field: (record.get(field) or '').strip() for field in CSV_FIELDS}
+        row['line'] = reader.line_num
+        row['email'] = users.models.CustomUser.objects.normalize_email(row['email'])
+        row['error'] = None
+        if not row['password']:
+            row['password'] = users.models.generate_random_readable_string(length=16, secure=True)
+        try:
+            _validate_row(row)
+            if row['username'] in seen_usernames or row['email'].lower() in seen_emails:
+                raise ValidationError('duplicate in this file')
+        except ValidationError as e:
+            row['error'] = '; '.join(e.messages)
+        seen_usernames.add(row['username'])
+        seen_emails.add(row['email'].lower())
+        rows.append(row)
+    return rows
+
+
+def bulk_create_users(rows, email_confirmed=False, worker_id='onboarding'):
+    """
+    Create the Django accounts (with profile) of all valid rows in one transaction, skipping usernames and emails
+    that already exist (their row gets an 'error'). Bypasses the post_save signals: a provisioning job per user is
+    created right away, already claimed by worker_id, so the caller runs it (see ProvisioningWorker.run_jobs).
+
+    :return: List of (row, job) for the created users.
+    """
+    valid_rows = [row for row in rows if row['error'] is None]
+    existing_usernames = set(
+        users.models.CustomUser.objects.filter(username__in=[row['username'] for row in valid_rows])
+        .values_list('username', flat=True)
+    )
+    existing_emails = {
+        email.lower()
+        for email in users.models.CustomUser.objects.filter(
+            email__in=[row['email'] for row in valid_rows]
+        ).values_list('email', flat=True)
+    }
+    new_rows = []
+    for row in valid_rows:
+        if row['username'] in existing_usernames or row['email'].lower() in existing_emails:
+            row['error'] = 'user already exists'
+        else:
+            new_rows.append(row)
+    if not new_rows:
+        return []
+
+    # Password hashing is the expensive part; hashlib releases the GIL, so threads use all cores
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        password_hashes = list(executor.map(make_password, [row['password'] for row in new_rows]))
+
+    with transaction.atomic():
+        new_users = users.models.CustomUser.objects.bulk_create([
+            users.models.CustomUser(
+                username=row['username'],
+                email=row['email'],
+                first_name=row['first_name'],
+                last_name=row['last_name'],
+                password=password_hash,
+                email_confirmed=email_confirmed,
+            )
+            for row, password_hash in zip(new_rows, password_hashes)
+        ])
+        if any(user.pk is None for user in new_users):  # database without RETURNING support
+            by_username = users.models.CustomUser.objects.in_bulk(
+                [user.username for user in new_users], field_name='username'
+            )
+            new_users = [by_username[user.username] for user in new_users]
+        users.models.Profile.objects.bulk_create([users.models.Profile(user=user) for user in new_users])
+        now = timezone.now()
+        jobs = users.models.ProvisioningJob.objects.bulk_create([
+            users.models.ProvisioningJob(
+                kind=users.models.ProvisioningJob.KIND_PROVISION,
+                user=user,
+                status=users.models.ProvisioningJob.STATUS_RUNNING,
+                locked_by=worker_id,
+                locked_at=now,
+            )
+            for user in new_users
+        ])
+        if any(job.pk is None for job in jobs):
+            by_user = {
+                job.user_id: job
+                for job in users.models.ProvisioningJob.objects.filter(user__in=new_users, locked_by=worker_id)
+            }
+            jobs = [by_user[user.pk] for user in new_users]
+    logger.info(f'Bulk created {len(new_users)} user(s)')
+    return list(zip(new_rows, jobs))
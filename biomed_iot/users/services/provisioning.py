@@ -0,0 +1,388 @@
+import os
+import time
+import random
+import socket
+import logging
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from django.db import connection
+from django.utils import timezone
+import users.models
+from .mosquitto_utils import MqttClientManager
+from .influx_utils import InfluxUserManager
+from .grafana_utils import GrafanaUserManager
+from .nodered_utils import NoderedContainer, del_nodered_nginx_conf, nodered_nginx_conf_path
+
+logger = logging.getLogger(__name__)
+
+# Retry delays: BACKOFF_BASE_SECONDS * 2 ** (attempt - 1), capped, plus up to 25 % jitter
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 15 * 60
+# A job still 'running' after this long belongs to a worker that died; it is handed out again
+STALE_LOCK_SECONDS = 15 * 60
+
+
+class StepFailed(Exception):
+    """Raised by a step that did not succeed and should be retried."""
+
+
+class JobCancelled(Exception):
+    """Raised between the steps of a job that was cancelled while it ran (its user was deleted)."""
+
+
+# Provisioning steps record the names and IDs of what they create in job.payload, also when they fail halfway.
+# If the user is deleted while a step runs, the deprovisioning job queued by the deletion may miss these, so
+# a cancelled job queues another one for them (see ProvisioningWorker._enqueue_cleanup).
+
+
+def _record_created(job, mqtt_clients=(), mqtt_roles=(), **ids):
+    for key, names in (('mqtt_clients', mqtt_clients), ('mqtt_roles', mqtt_roles)):
+        recorded = job.payload.setdefault(key, [])
+        recorded.extend(name for name in names if name not in recorded)
+    job.payload.update({key: value for key, value in ids.items() if value is not None})
+
+
+def _provision_mqtt(job):
+    mqtt_client_manager = MqttClientManager(job.user)
+    try:
+        created = mqtt_client_manager.create_initial_roles_and_clients()
+    finally:
+        _record_created(
+            job,
+            mqtt_clients=mqtt_client_manager.sent_client_usernames,
+            mqtt_roles=mqtt_client_manager.sent_rolenames,
+        )
+    if not created:
+        raise StepFailed('MQTT roles and clients could not be created')
+
+
+def _provision_influxdb(job):
+    if users.models.InfluxUserData.objects.filter(user=job.user).exists():
+        return  # created by an earlier attempt
+    influx_user_manager = InfluxUserManager(user=job.user)
+    try:
+        created = influx_user_manager.create_new_influx_user_resources()
+    finally:
+        _record_created(
+            job,
+            influx_bucket_id=influx_user_manager.bucket_id,
+            influx_bucket_token_id=influx_user_manager.bucket_token_id,
+        )
+    if not created:
+        raise StepFailed('InfluxDB bucket and token could not be created')
+
+
+def _provision_grafana(job):
+    _record_created(job, username=job.user.username)
+    # needs the InfluxDB token for the data sources, so it runs after the influxdb step
+    if not GrafanaUserManager(user=job.user).create_user():
+        raise StepFailed('Grafana user could not be created')
+
+
+# Deprovisioning steps only use the identifiers saved in job.payload, the user's rows are gone by then
+
+
+def _deprovision_mqtt(job):
+    if not MqttClientManager.delete_from_broker(job.payload['mqtt_clients'], job.payload['mqtt_roles']):
+        raise StepFailed('MQTT clients and roles could not be deleted')
+
+
+def _deprovision_influxdb(job):
+    if job.payload['influx_bucket_id'] is None:
+        return
+    influx_user_manager = InfluxUserManager(user=None)
+    if not influx_user_manager.delete_bucket_and_token(
+        job.payload['influx_bucket_id'], job.payload['influx_bucket_token_id']
+    ):
+        raise StepFailed('InfluxDB bucket and token could not be deleted')
+
+
+def _deprovision_grafana(job):
+    if job.payload['username'] is None:
+        return
+    if not GrafanaUserManager.for_username(job.payload['username']).delete_user():
+        raise StepFailed('Grafana user could not be deleted')
+
+
+def _deprovision_nodered(job):
+    if job.payload['nodered_container_name'] is None:
+        return
+    # unsaved stand-in, both helpers only read container_name (and the container's own state)
+    nodered_user_data = users.models.NodeRedUserData(container_name=job.payload['nodered_container_name'])
+    # both helpers only log their errors, so check the outcome
+    NoderedContainer(nodered_user_data).delete_container()
+    if NoderedContainer(nodered_user_data).container is not None:
+        raise StepFailed(f'Node-RED container {nodered_user_data.container_name} could not be deleted')
+    del_nodered_nginx_conf(nodered_user_data)
+    if os.path.exists(nodered_nginx_conf_path(nodered_user_data.container_name)):
+        raise StepFailed(f'Nginx configuration of {nodered_user_data.container_name} could not be deleted')
+
+
+# Steps per job kind. Every step must be safe to run again after a partial failure.
+JOB_STEPS = {
+    # run in this order (Grafana needs the InfluxDB token)
+    users.models.ProvisioningJob.KIND_PROVISION: [
+        ('mqtt', _provision_mqtt),
+        ('influxdb', _provision_influxdb),
+        ('grafana', _provision_grafana),
+    ],
+    # independent of each other, run concurrently (see CONCURRENT_KINDS)
+    users.models.ProvisioningJob.KIND_DEPROVISION: [
+        ('mqtt', _deprovision_mqtt),
+        ('influxdb', _deprovision_influxdb),
+        ('grafana', _deprovision_grafana),
+        ('nodered', _deprovision_nodered),
+    ],
+}
+CONCURRENT_KINDS = {users.models.ProvisioningJob.KIND_DEPROVISION}
+
+
+def enqueue_user_provisioning(user):
+    """Queue the creation of the MQTT, InfluxDB and Grafana accounts of a new user. Returns the job."""
+    return users.models.ProvisioningJob.objects.create(kind=users.models.ProvisioningJob.KIND_PROVISION, user=user)
+
+
+def enqueue_user_deprovisioning(user):
+    """
+    Queue the deletion of the MQTT, InfluxDB, Grafana and Node-RED resources of a user that is about to be deleted.
+    Call it before the user's rows are deleted: the identifiers of all resources are copied into the job.
+    Returns the job.
+    """
+    mqtt_metadata = users.models.MqttMetaData.objects.filter(user=user).first()
+    influx_user_data = users.models.InfluxUserData.objects.filter(user=user).first()
+    nodered_user_data = users.models.NodeRedUserData.objects.filter(user=user).first()
+    payload = {
+        'username': user.username,
+        'mqtt_clients': list(users.models.MqttClient.objects.filter(user=user).values_list('username', flat=True)),
+        'mqtt_roles': [
+            mqtt_metadata.nodered_role_name,
+            mqtt_metadata.device_role_name,
+            mqtt_metadata.inout_role_name,
+        ] if mqtt_metadata else [],
+        'influx_bucket_id': influx_user_data.bucket_id if influx_user_data else None,
+        'influx_bucket_token_id': influx_user_data.bucket_token_id if influx_user_data else None,
+        'nodered_container_name': nodered_user_data.container_name if nodered_user_data else None,
+    }
+    # A provisioning job that hasn't finished yet would recreate some of the accounts. Running ones stop before
+    # their next step and queue the deletion of what they created in the meantime (see ProvisioningWorker.run_job).
+    users.models.ProvisioningJob.objects.filter(
+        user=user,
+        kind=users.models.ProvisioningJob.KIND_PROVISION,
+        status__in=[users.models.ProvisioningJob.STATUS_PENDING, users.models.ProvisioningJob.STATUS_RUNNING],
+    ).update(status=users.models.ProvisioningJob.STATUS_CANCELLED, last_error='user was deleted')
+    return users.models.ProvisioningJob.objects.create(
+        kind=users.models.ProvisioningJob.KIND_DEPROVISION, payload=payload
+    )
+
+
+def get_provisioning_status(user):
+    """Return the status of the user's latest provisioning job, or None if there is none."""
+    job = (
+        users.models.ProvisioningJob.objects.filter(user=user, kind=users.models.ProvisioningJob.KIND_PROVISION)
+        .order_by('-created_at')
+        .first()
+    )
+    return job.status if job else None
+
+
+def backoff_seconds(attempts):
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return delay * (1 + random.uniform(0, 0.25))
+
+
+class ProvisioningWorker:
+    """
+    Claims due ProvisioningJobs from the database and runs their steps.
+
+    Any number of workers (processes or hosts) can run at the same time: a job is claimed with a conditional
+    UPDATE, so exactly one worker gets it. Failed jobs are retried with exponential backoff until max_attempts
+    is reached; steps in completed_steps are skipped on every retry. The steps of CONCURRENT_KINDS run in
+    parallel threads, so a job takes as long as its slowest step.
+
+    step_limits caps how many steps of a name (e.g. {'grafana': 4}) run at the same time across all threads
+    of this worker; see run_jobs().
+    """
+
+    def __init__(self, worker_id=None, step_limits=None):
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        self._step_slots = {name: threading.BoundedSemaphore(limit) for name, limit in (step_limits or {}).items()}
+
+    def requeue_stale_jobs(self):
+        stale_before = timezone.now() - timedelta(seconds=STALE_LOCK_SECONDS)
+        count = users.models.ProvisioningJob.objects.filter(
+            status=users.models.ProvisioningJob.STATUS_RUNNING, locked_at__lt=stale_before
+        ).update(status=users.models.ProvisioningJob.STATUS_PENDING, locked_by='', locked_at=None)
+        if count:
+            logger.warning(f'Requeued {count} provisioning job(s) of workers that stopped responding')
+
+    def claim_job(self):
+        """Claim the next due job. Returns it, or None if no job is due."""
+        due = users.models.ProvisioningJob.objects.filter(
+            status=users.models.ProvisioningJob.STATUS_PENDING, run_after__lte=timezone.now()
+        ).order_by('run_after', 'pk')
+        for job_id in due.values_list('pk', flat=True)[:10]:
+            claimed = users.models.ProvisioningJob.objects.filter(
+                pk=job_id, status=users.models.ProvisioningJob.STATUS_PENDING
+            ).update(
+                status=users.models.ProvisioningJob.STATUS_RUNNING, locked_by=self.worker_id, locked_at=timezone.now()
+            )
+            if claimed:
+                return users.models.ProvisioningJob.objects.get(pk=job_id)
+        return None  # nothing due, or other workers were faster
+
+    def run_job(self, job):
+        job.attempts += 1
+        user_gone = job.kind == users.models.ProvisioningJob.KIND_PROVISION and job.user is None
+        try:
+            if user_gone:
+                raise StepFailed('user was deleted before provisioning finished')
+            steps = [(name, step) for name, step in JOB_STEPS[job.kind] if name not in job.completed_steps]
+            if job.kind in CONCURRENT_KINDS:
+                self._run_steps_concurrently(job, steps)
+            else:
+                for step_name, step in steps:
+                    self._raise_if_cancelled(job)
+                    with self._step_slots.get(step_name, contextlib.nullcontext()):
+                        step(job)
+                    self._complete_step(job, step_name)
+        except Exception as e:
+            job.last_error = f'{type(e).__name__}: {e}'
+            if isinstance(e, JobCancelled) or self._is_cancelled(job):
+                # a step may also have failed because the user's rows disappeared underneath it
+                job.status = users.models.ProvisioningJob.STATUS_CANCELLED
+                logger.info(f'Provisioning job {job.pk} was cancelled after {job.attempts} attempt(s)')
+            elif user_gone or job.attempts >= job.max_attempts:
+                job.status = users.models.ProvisioningJob.STATUS_FAILED
+                logger.error(f'Provisioning job {job.pk} failed for good after {job.attempts} attempt(s): {e}')
+            else:
+                job.status = users.models.ProvisioningJob.STATUS_PENDING
+                job.run_after = timezone.now() + timedelta(seconds=backoff_seconds(job.attempts))
+                logger.warning(f'Provisioning job {job.pk} attempt {job.attempts} failed, retrying later: {e}')
+        else:
+            job.status = users.models.ProvisioningJob.STATUS_DONE
+            job.last_error = ''
+        return self._finish_job(job)
+
+    def _finish_job(self, job):
+        job.locked_by = ''
+        job.locked_at = None
+        # not 'user': it may have been deleted (and set to NULL in the database) while the job ran
+        fields = [
+            'status', 'attempts', 'run_after', 'payload', 'completed_steps', 'last_error', 'locked_by', 'locked_at',
+            'updated_at',
+        ]
+        if job.status != users.models.ProvisioningJob.STATUS_CANCELLED and not self._save_unless_cancelled(job, fields):
+            # cancelled while the last step ran, which may have created accounts after the user's rows were read
+            job.status = users.models.ProvisioningJob.STATUS_CANCELLED
+            logger.info(f'Provisioning job {job.pk} was cancelled after {job.attempts} attempt(s)')
+        elif job.status == users.models.ProvisioningJob.STATUS_DONE:
+            logger.info(f'Provisioning job {job.pk} done after {job.attempts} attempt(s)')
+        if job.status == users.models.ProvisioningJob.STATUS_CANCELLED:
+            job.save(update_fields=fields)
+            self._enqueue_cleanup(job)
+        return job.status
+
+    def run_jobs(self, jobs, max_workers):
+        """
+        Run jobs the caller already holds (status 'running', locked_by this worker) in max_workers threads,
+        e.g. right after creating them in bulk. Per backend, step_limits bounds the concurrency, so a fast
+        backend isn't held up by a slow one beyond that. Jobs that fail are left to the background workers.
+
+        :return: List of (job, status) in the order of jobs.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='provisioning') as executor:
+            return list(zip(jobs, executor.map(self._run_job_in_thread, jobs)))
+
+    def _run_job_in_thread(self, job):
+        try:
+            return self.run_job(job)
+        finally:
+            connection.close()  # every thread has its own database connection
+
+    @staticmethod
+    def _run_step_in_thread(step, job):
+        try:
+            step(job)
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _is_cancelled(job):
+        return users.models.ProvisioningJob.objects.filter(
+            pk=job.pk, status=users.models.ProvisioningJob.STATUS_CANCELLED
+        ).exists()
+
+    def _raise_if_cancelled(self, job):
+        if self._is_cancelled(job):
+            raise JobCancelled('user was deleted')
+
+    @staticmethod
+    def _save_unless_cancelled(job, fields):
+        """Save fields of job unless it was cancelled in the meantime. Returns True if it was saved."""
+        values = {field: getattr(job, field) for field in fields if field != 'updated_at'}
+        return bool(
+            users.models.ProvisioningJob.objects.filter(pk=job.pk)
+            .exclude(status=users.models.ProvisioningJob.STATUS_CANCELLED)
+            .update(updated_at=timezone.now(), **values)
+        )
+
+    @staticmethod
+    def _enqueue_cleanup(job):
+        """Queue the deletion of what a cancelled provisioning job recorded in its payload. Returns the job or None."""
+        created = job.payload
+        if job.kind != users.models.ProvisioningJob.KIND_PROVISION or not any(created.values()):
+            return None
+        payload = {
+            'username': created.get('username'),
+            'mqtt_clients': created.get('mqtt_clients', []),
+            'mqtt_roles': created.get('mqtt_roles', []),
+            'influx_bucket_id': created.get('influx_bucket_id'),
+            'influx_bucket_token_id': created.get('influx_bucket_token_id'),
+            'nodered_container_name': None,  # only created later, from the Node-RED page
+        }
+        logger.info(f'Provisioning job {job.pk} was cancelled, queueing the deletion of what it created')
+        return users.models.ProvisioningJob.objects.create(
+            kind=users.models.ProvisioningJob.KIND_DEPROVISION, payload=payload
+        )
+
+    @staticmethod
+    def _complete_step(job, step_name):
+        job.completed_steps.append(step_name)
+        job.save(update_fields=['payload', 'completed_steps', 'updated_at'])
+
+    def _run_steps_concurrently(self, job, steps):
+        # Every step runs in a thread of its own (and gets its own database connection there, if it uses one)
+        if not steps:
+            return
+        errors = []
+        with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix=f'job-{job.pk}') as executor:
+            futures = {executor.submit(self._run_step_in_thread, step, job): step_name for step_name, step in steps}
+            for future in as_completed(futures):
+                step_name = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(f'{step_name}: {e}')
+                else:
+                    self._complete_step(job, step_name)  # checkpoint as soon as it is done
+        if errors:
+            raise StepFailed('; '.join(sorted(errors)))
+
+    def run(self, once=False, poll_interval=1.0):
+        """Process jobs until stopped. With once=True, return as soon as no job is due."""
+        logger.info(f'Provisioning worker {self.worker_id} started')
+        self.requeue_stale_jobs()
+        last_requeue = time.monotonic()
+        while True:
+            job = self.claim_job()
+            if job is not None:
+                self.run_job(job)
+                continue
+            if once:
+                return
+            if time.monotonic() - last_requeue > 60:
+                self.requeue_stale_jobs()
+                last_requeue = time.monotonic()
+            time.sleep(poll_interval)
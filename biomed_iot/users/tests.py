@@ -1,3 +1,108 @@
-from django.test import TestCase  # noqa
+import sys
+from pathlib import Path
+from unittest import mock
+from django.test import TestCase, TransactionTestCase
+from biomed_iot.config_loader import config
+from .models import CustomUser, MqttClient, ProvisioningJob
+from .services import provisioning
+from .services.mosquitto_dynsec import MosquittoDynSec
+from .services.mosquitto_reconcile import MqttReconciler
+from .services.mosquitto_utils import MqttClientManager, MqttMetaDataManager
 
-# Create your tests here.
+# The DynSec stand-in lives in the repository's tests/ directory
+sys.path.append(str(Path(__file__).resolve().parents[2] / 'tests'))
+from dynsec_fake_broker import FakeDynSecBroker  # noqa: E402
+
+
+class MqttReconcilerTests(TestCase):
+    def setUp(self):
+        admin_username = config.mosquitto.DYNSEC_ADMIN_USER
+        self.broker = FakeDynSecBroker(admin_username, 'admin-pw')
+        host, port = self.broker.start()
+        self.addCleanup(self.broker.stop)
+        self.dynsec = MosquittoDynSec(admin_username, 'admin-pw', host, port)
+        self.addCleanup(self.dynsec.disconnect)
+
+        user = CustomUser.objects.create_user('reconcile', 'reconcile@example.com', 'pw12345!xyz')
+        self.metadata = MqttMetaDataManager(user).metadata
+        self.device = MqttClient.objects.create(
+            user=user, username='device-client', password='pw', textname='sensor',
+            rolename=self.metadata.device_role_name,
+        )
+        # the system clients created by setup_files/config/tmp.mosquitto-dynsec-commands.sh
+        self.dynsec.create_role('mqttInToDB')
+        self.dynsec.create_role('mqttOutToDB')
+        self.dynsec.create_client('mqtt-in-to-db', 'pw', roles=[{'rolename': 'mqttInToDB', 'priority': -1}])
+        self.dynsec.create_client('mqtt-out-to-db', 'pw', roles=[{'rolename': 'mqttOutToDB', 'priority': -1}])
+        self.dynsec.create_client(f'{admin_username}-ctl-1', 'pw', roles=[{'rolename': 'admin', 'priority': -1}])
+
+    def reconcile(self, delete_orphans=True):
+        reconciler = MqttReconciler(dynsec=self.dynsec, delete_orphans=delete_orphans)
+        results = reconciler.apply(reconciler.plan())
+        self.assertTrue(all(success for _, success in results))
+        return reconciler
+
+    def test_creates_missing_roles_and_clients(self):
+        self.reconcile()
+        self.assertIn(self.metadata.device_role_name, self.broker.state.roles)
+        self.assertEqual(
+            self.broker.state.clients['device-client']['roles'],
+            [{'rolename': self.metadata.device_role_name, 'priority': -1}],
+        )
+        self.assertEqual(MqttReconciler(dynsec=self.dynsec).plan(), [])
+
+    def test_deletes_only_biomed_iot_orphans(self):
+        self.reconcile()
+        self.dynsec.create_role('device-orphan')
+        self.dynsec.create_client('orphan-client', 'pw', roles=[{'rolename': 'device-orphan', 'priority': -1}])
+        self.dynsec.create_client('unmanaged', 'pw')
+
+        reconciler = self.reconcile()
+        self.assertEqual(reconciler.orphan_clients, ['orphan-client'])
+        self.assertEqual(reconciler.orphan_roles, ['device-orphan'])
+        for username in ('mqtt-in-to-db', 'mqtt-out-to-db', f'{config.mosquitto.DYNSEC_ADMIN_USER}-ctl-1', 'unmanaged'):
+            self.assertIn(username, self.broker.state.clients)
+        self.assertIn('mqttInToDB', self.broker.state.roles)
+        self.assertNotIn('orphan-client', self.broker.state.clients)
+        self.assertNotIn('device-orphan', self.broker.state.roles)
+
+
+# Not a TestCase: the MqttClient rows of the deleted user must fail on their own commit, like they do for the worker
+class ProvisioningCancellationTests(TransactionTestCase):
+    def setUp(self):
+        admin_username = config.mosquitto.DYNSEC_ADMIN_USER
+        self.broker = FakeDynSecBroker(admin_username, 'admin-pw')
+        host, port = self.broker.start()
+        self.addCleanup(self.broker.stop)
+        dynsec = MosquittoDynSec(admin_username, 'admin-pw', host, port)
+        self.addCleanup(dynsec.disconnect)
+        patcher = mock.patch('users.services.mosquitto_utils.get_shared_dynsec', return_value=dynsec)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_user_deleted_while_a_step_runs(self):
+        user = CustomUser.objects.create_user('cancelled', 'cancelled@example.com', 'pw12345!xyz')
+        provision = MqttClientManager._provision
+
+        def delete_user_then_provision(manager, *args):
+            # the deletion snapshots the roles but none of the clients this step is about to create
+            CustomUser.objects.get(pk=user.pk).delete()
+            return provision(manager, *args)
+
+        worker = provisioning.ProvisioningWorker()
+        job = worker.claim_job()
+        with mock.patch.object(MqttClientManager, '_provision', delete_user_then_provision):
+            status = worker.run_job(job)
+
+        self.assertEqual(status, ProvisioningJob.STATUS_CANCELLED)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ProvisioningJob.STATUS_CANCELLED)
+        created_clients = set(self.broker.state.clients) & set(job.payload['mqtt_clients'])
+        self.assertEqual(len(created_clients), 2)
+
+        deprovision_jobs = ProvisioningJob.objects.filter(kind=ProvisioningJob.KIND_DEPROVISION)
+        self.assertEqual(deprovision_jobs.count(), 2)  # one queued by the deletion, one by the cancelled job
+        for deprovision_job in deprovision_jobs:
+            provisioning._deprovision_mqtt(deprovision_job)
+        self.assertFalse(created_clients & set(self.broker.state.clients))
+        self.assertFalse(set(job.payload['mqtt_roles']) & set(self.broker.state.roles))
@@ -1,11 +1,12 @@
 import os
+import re
 import jwt
 import secrets
 import json
 import logging
 import mimetypes
+from functools import wraps
 from datetime import datetime, timedelta, timezone
-from itertools import chain
 from influxdb_client import InfluxDBClient
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
@@ -14,16 +15,22 @@ from django.contrib.auth import login
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, Http404, StreamingHttpResponse
+from django.http import FileResponse
+from django.utils.timezone import localtime
 from django.http import HttpResponseBadRequest
 from django.db import IntegrityError
 from django.db import transaction
-from .models import NodeRedUserData, CustomUser, Profile  # noqa: F401
+from .models import NodeRedUserData, CustomUser, Profile, ExportJob, ProvisioningJob  # noqa: F401
 from .forms import UserRegisterForm, UserUpdateForm, UserLoginForm, MqttClientForm, SelectDataForm
 from .services.mosquitto_utils import MqttMetaDataManager, MqttClientManager, RoleType
+from .services.mosquitto_dynsec import DynSecUnavailableError
 from .services.nodered_utils import NoderedContainer, update_nodered_nginx_conf
 from .services.code_loader import load_code_examples, load_nodered_flow_examples
 from .services.email_templates import registration_confirmation_email
 from .services.influx_data_utils import InfluxDataManager, to_rfc3339
+from .services.export_formats import EXPORT_FORMATS, EXPORT_COMPRESSIONS, NoDataError
+from .services.export_jobs import enqueue_export, export_file_path, ExportLimitReached
+from .services.provisioning import get_provisioning_status
 from biomed_iot.config_loader import config
 from revproxy.views import ProxyView
 # For classed based login view, remove comment after tests
@@ -126,6 +133,37 @@ class CustomLoginView(LoginView):
         return redirect(self.get_success_url())
 
 
+def account_ready_required(as_json=False):
+    """
+    Decorator for views that need the user's MQTT, InfluxDB and Grafana accounts. The provisioning worker
+    creates them after registration; until it is done (or if it failed), a notice page is shown instead of
+    the view (for ajax views a JSON error with status 503). Users without a provisioning job predate it.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not request.session.get('account_ready'):
+                status = get_provisioning_status(request.user)
+                if status not in (None, ProvisioningJob.STATUS_DONE):
+                    return _account_not_ready(request, status, as_json)
+                request.session['account_ready'] = True  # don't ask the database again
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _account_not_ready(request, status, as_json):
+    failed = status == ProvisioningJob.STATUS_FAILED
+    if failed:
+        message = 'Setting up your account failed. Please contact the admin of this website.'
+    else:
+        message = 'Your account is still being set up. Please try again in a minute.'
+    if as_json:
+        return JsonResponse({'error': message}, status=503)
+    context = {'title': 'Account Setup', 'thin_navbar': False, 'failed': failed, 'message': message}
+    return render(request, 'users/account_setup.html', context, status=503)
+
+
 @login_required
 def profile(request):
     context = {}
@@ -157,7 +195,45 @@ def profile(request):
     return render(request, 'users/profile.html', context)
 
 
+def _create_device(request, mqtt_client_manager, new_device_form):
+    new_textname = new_device_form.cleaned_data['textname']
+    same = new_device_form.cleaned_data.get('same_topic', False)
+    role = RoleType.INOUT.value if same else RoleType.DEVICE.value
+    if same:
+        new_textname = f"{new_textname} [inout/]"
+    try:
+        success = mqtt_client_manager.create_client(textname=new_textname, role_type=role)
+    except DynSecUnavailableError:
+        messages.error(request, 'The MQTT broker is currently not reachable. Please try again in a minute.')
+        return redirect('devices')
+
+    if success:
+        messages.success(request, f'Device with name "{new_textname}" successfully created.')
+    else:
+        messages.error(request, 'Failed to create the device. Please try again.')
+    return redirect('devices')
+
+
+def _delete_device(request, mqtt_client_manager, client_username):
+    logger.info(f'Deleting device {client_username} of user {request.user.username}')
+    try:
+        success = mqtt_client_manager.delete_client(client_username)
+    except DynSecUnavailableError:
+        messages.error(request, 'The MQTT broker is currently not reachable. Please try again in a minute.')
+        return redirect('devices')
+    if success:
+        messages.success(
+            request,
+            f'Device with username "{client_username}" successfully deleted.',
+        )
+    else:
+        logger.error(f'Could not delete device {client_username} of user {request.user.username}')
+        messages.error(request, 'Failed to delete the device. Please try again.')
+    return redirect('devices')
+
+
 @login_required
+@account_ready_required()
 def devices(request):
     """
     For inexperienced user, MQTT-Clients are called devices since each client is usually linked to a device
@@ -169,22 +245,8 @@ def devices(request):
     if request.method == 'POST':
         new_device_form = MqttClientForm(request.POST)
         if request.POST.get('action') == 'create':
-            print('in "create"')
             if new_device_form.is_valid():
-                # print('form is valid')
-                # new_textname = new_device_form.cleaned_data['textname']
-                # print(f'New Textname from form = {new_textname}')
-                # mqtt_client_manager.create_client(textname=new_textname, role_type=RoleType.DEVICE.value)
-                # print('after create client')
-                new_textname = new_device_form.cleaned_data['textname']
-                same = new_device_form.cleaned_data.get('same_topic', False)
-                role = RoleType.INOUT.value if same else RoleType.DEVICE.value
-                if same:
-                    new_textname = f"{new_textname} [inout/]"
-                mqtt_client_manager.create_client(textname=new_textname, role_type=role)
-
-                messages.success(request, f'Device with name "{new_textname}" successfully created.')
-                return redirect('devices')
+                return _create_device(request, mqtt_client_manager, new_device_form)
             else:
                 messages.error(request, 'Device name is not valid. Max. 30 characters!')
                 return redirect('devices')
@@ -194,19 +256,7 @@ def devices(request):
             pass
 
         elif request.POST.get('device_username'):  # TODO: ambiguous! --> could also be sth else than delete.
-            client_username = request.POST.get('device_username')
-            print(f'delete device ({client_username}) case')
-            success = mqtt_client_manager.delete_client(client_username)
-            print(success)
-            if success:
-                messages.success(
-                    request,
-                    f'Device with username "{client_username}" successfully deleted.',
-                )
-                return redirect('devices')
-            else:
-                messages.error(request, 'Failed to delete the device. Please try again.')
-                return redirect('devices')
+            return _delete_device(request, mqtt_client_manager, request.POST.get('device_username'))
 
     mqtt_meta_data_manager = MqttMetaDataManager(request.user)
     topic_id = mqtt_meta_data_manager.metadata.user_topic_id
@@ -231,6 +281,7 @@ def devices(request):
 
 
 @login_required
+@account_ready_required()
 def message_and_topic_structure(request):
     mqtt_meta_data_manager = MqttMetaDataManager(request.user)
     topic_id = mqtt_meta_data_manager.metadata.user_topic_id
@@ -343,6 +394,7 @@ def get_or_create_nodered_user_data(request):
 
 
 @login_required
+@account_ready_required()
 def nodered_manager(request):
     logger.info("In nodered_manager")
     nodered_data = get_or_create_nodered_user_data(request)
@@ -629,6 +681,7 @@ def access_nodered(request):
 
 
 @login_required
+@account_ready_required()
 def manage_data(request):
     # 1) build the InfluxDataManager for the current user
     idm = InfluxDataManager(request.user)
@@ -643,8 +696,15 @@ def manage_data(request):
     return render(request, "users/manage_data.html", {
         "title": "Manage Measurement Data",
         "form": form,
+        "export_jobs": _export_jobs_of(request.user),
+        "export_ttl_hours": settings.EXPORT_JOBS_TTL_HOURS,
     })
 
+
+def _export_jobs_of(user):
+    # the user's latest background exports, for the list on the manage-data page
+    return list(ExportJob.objects.filter(user=user).order_by("-created_at")[:10])
+
 # OLD Version of manage_data
 # @login_required
 # def manage_data(request):
@@ -667,6 +727,7 @@ def manage_data(request):
 
 
 @login_required
+@account_ready_required()
 def delete_data(request):
     """POST endpoint that deletes matching data, then redirects back."""
     if request.method != "POST":
@@ -690,6 +751,7 @@ def delete_data(request):
 
 
 @login_required
+@account_ready_required()
 def download_data(request):
     if request.method != "POST":
         return redirect("manage-data")
@@ -700,42 +762,132 @@ def download_data(request):
         messages.error(request, "Invalid parameters – please correct the form.")
         return redirect("manage-data")
 
-    measurement = form.cleaned_data["measurement"]
-    tags        = form.cleaned_data["tags"]
-    start_iso   = to_rfc3339(form.cleaned_data["start_time"])
-    stop_iso    = to_rfc3339(form.cleaned_data["end_time"])
+    export_params = {
+        "measurement": form.cleaned_data["measurement"],
+        "tags": form.cleaned_data["tags"],
+        "start_iso": to_rfc3339(form.cleaned_data["start_time"]),
+        "stop_iso": to_rfc3339(form.cleaned_data["end_time"]),
+        "fields": form.cleaned_data["field_names"],
+        "wide": form.cleaned_data["layout"] == "wide",
+        "export_format": form.cleaned_data["export_format"],
+        "compression": form.cleaned_data["compression"],
+        "parallel": form.cleaned_data["parallel"],
+    }
+
+    if form.cleaned_data["background"]:
+        # written by the export worker, the request returns right away
+        try:
+            enqueue_export(request.user, export_params)
+        except ExportLimitReached as e:
+            messages.warning(request, f"{e} Please wait until one is done.")
+        else:
+            messages.success(request, "Export started. It is listed below and can be downloaded when it is done.")
+        return redirect("manage-data")
 
     try:
-        csv_stream, filename = idm.export_stream(
-            measurement=measurement,
-            tags=tags,
-            start_iso=start_iso,
-            stop_iso=stop_iso,
-        )
+        csv_stream, filename = idm.export_stream(**export_params)
         # Peek at the first chunk so we can catch “no data” here
-        first_chunk = next(csv_stream)
-    except ValueError:
+        csv_stream.peek()
+    except NoDataError:
         messages.warning(request, "No data in this time range – nothing to download.")
         return redirect("manage-data")
 
-    # Re‐chain the first chunk back onto the rest of the stream
-    safe_stream = chain([first_chunk], csv_stream)
-
-    response = StreamingHttpResponse(safe_stream, content_type="text/csv")
+    content_type = (
+        EXPORT_COMPRESSIONS[form.cleaned_data["compression"]][0]
+        or EXPORT_FORMATS[form.cleaned_data["export_format"]][0]
+    )
+    # the response closes csv_stream when it ends, also if the client aborts the download
+    response = StreamingHttpResponse(csv_stream, content_type=content_type)
     response["Content-Disposition"] = f'attachment; filename="{filename}"'
     return response
 
 
 @login_required
+def download_export(request, job_id):
+    """Send the file of a finished background export. In production nginx sends it (X-Accel-Redirect)."""
+    job = ExportJob.objects.filter(pk=job_id, user=request.user, status=ExportJob.STATUS_DONE).first()
+    if job is None or job.expires_at <= datetime.now(timezone.utc):
+        raise Http404("Export does not exist or has expired")
+    if settings.EXPORT_JOBS_X_ACCEL:
+        response = HttpResponse(content_type=job.content_type)
+        response["X-Accel-Redirect"] = f"{settings.EXPORT_JOBS_INTERNAL_URL}{job.file_path}"
+    else:
+        path = export_file_path(job)
+        if not os.path.exists(path):
+            raise Http404("Export file is missing")
+        response = FileResponse(open(path, "rb"), content_type=job.content_type)
+    response["Content-Disposition"] = f'attachment; filename="{job.filename}"'
+    return response
+
+
+@login_required
+def ajax_export_jobs(request):
+    """Status and progress of the user's latest background exports (polled by the manage-data page)."""
+    jobs = [
+        {
+            "id": job.pk,
+            "status": job.status,
+            "status_display": job.get_status_display(),
+            "filename": job.filename,
+            "bytes_written": job.bytes_written,
+            "created_at": localtime(job.created_at).strftime("%Y-%m-%d %H:%M"),
+            "expires_at": job.expires_at.isoformat() if job.expires_at else None,
+            "error": job.last_error,
+            "download_url": reverse("download-export", args=[job.pk]) if job.status == ExportJob.STATUS_DONE else None,
+        }
+        for job in _export_jobs_of(request.user)
+    ]
+    return JsonResponse({"jobs": jobs})
+
+
+def _tag_pairs_start(request):
+    """The optional window parameter like "30d" (only tags of series written within it) as a Flux start."""
+    window = request.GET.get("window")
+    if not window:
+        return None  # settings.INFLUX_TAG_PAIRS_WINDOW
+    if not re.fullmatch(r"\d+[mhdw]", window):
+        raise ValueError(f"invalid window {window!r}")
+    return f"-{window}"
+
+
+@login_required
+@account_ready_required(as_json=True)
 def ajax_get_tags(request):
     measurement = request.GET.get("measurement")
     if not measurement:
         return HttpResponseBadRequest("Missing measurement parameter")
-    manager = InfluxDataManager(request.user)
-    pairs = manager.list_tag_pairs(measurement)
+    try:
+        start = _tag_pairs_start(request)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid window parameter")
+    pairs = InfluxDataManager(request.user).list_tag_pairs(measurement, start)
     return JsonResponse({"tags": pairs})
 
 
+@login_required
+@account_ready_required(as_json=True)
+def ajax_search_tags(request):
+    """Typeahead for the tag select: one page of the key=value pairs starting with 'q'."""
+    measurement = request.GET.get("measurement")
+    if not measurement:
+        return HttpResponseBadRequest("Missing measurement parameter")
+    try:
+        limit = min(max(int(request.GET.get("limit", 50)), 1), 200)
+        offset = max(int(request.GET.get("offset", 0)), 0)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid limit or offset parameter")
+    try:
+        start = _tag_pairs_start(request)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid window parameter")
+    manager = InfluxDataManager(request.user)
+    pairs, total = manager.search_tag_pairs(
+        measurement, request.GET.get("q", ""), limit=limit, offset=offset, start=start
+    )
+    next_offset = offset + len(pairs) if offset + len(pairs) < total else None
+    return JsonResponse({"tags": pairs, "total": total, "next_offset": next_offset})
+
+
 # @login_required
 # def download_data(request):
 #     """POST endpoint for exporting data as zipped CSV."""
@@ -765,12 +917,14 @@ def ajax_get_tags(request):
 
 
 @login_required
+@account_ready_required()
 def visualize(request):
     page_title = 'Visualize Data with Grafana'
     context = {'title': page_title, 'thin_navbar': True}
     return render(request, 'users/visualize.html', context)
 
 @login_required
+@account_ready_required()
 def get_grafana(request):
     return redirect('/grafana/')
 
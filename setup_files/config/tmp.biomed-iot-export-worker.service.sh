@@ -0,0 +1,23 @@
+#!/bin/sh
+
+# Get passed parameter
+USERNAME=$1
+SETUP_DIR=$2
+
+# Define biomed-iot-export-worker@.service template (one instance per worker, e.g. biomed-iot-export-worker@1)
+cat << EOF
+[Unit]
+Description=Biomed IoT data export worker %i
+After=network.target
+
+[Service]
+User=$USERNAME
+Group=www-data
+WorkingDirectory=$SETUP_DIR/biomed_iot
+ExecStart=$SETUP_DIR/biomed_iot/venv/bin/python manage.py export_worker --worker-id %H-%i
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+EOF
\ No newline at end of file
@@ -25,6 +25,12 @@ server {
         root /var/www/biomed-iot/media/;
     }
 
+    # background exports (EXPORT_JOBS_ROOT), only sent after Django checked the user (X-Accel-Redirect)
+    location /protected-exports/ {
+        internal;
+        alias /var/www/biomed-iot/media/exports/;
+    }
+
     location = /robots.txt {
         alias /var/www/biomed-iot/static/robots.txt;
     }
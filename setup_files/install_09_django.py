@@ -32,6 +32,11 @@ def install_django(django_admin_email, ):
     requirements_install_output = run_bash(requirements_command)
     log(requirements_install_output, DJANGO_INSTALL_LOG_FILE_NAME)
 
+    # Create the FileBasedCache directory (settings.CACHES) owned by the user gunicorn and the workers run as,
+    # before anything run as root (e.g. a management command) creates it
+    out = run_bash(f'runuser -u {linux_user} -- mkdir -p {setup_dir}/biomed_iot/cache')
+    log(out, DJANGO_INSTALL_LOG_FILE_NAME)
+
     # Prepare static files directory and deploy static files
     # see: https://docs.djangoproject.com/en/5.0/howto/static-files/
     # and https://forum.djangoproject.com/t/django-and-nginx-permission-issue-on-ubuntu/26804
@@ -46,6 +51,10 @@ def install_django(django_admin_email, ):
     out = run_bash('mkdir -p /var/www/biomed-iot/media/restricted_download_files')
     log(out, DJANGO_INSTALL_LOG_FILE_NAME)
 
+    # Create folder for the files of background data exports (EXPORT_JOBS_ROOT, sent by nginx)
+    out = run_bash('mkdir -p /var/www/biomed-iot/media/exports')
+    log(out, DJANGO_INSTALL_LOG_FILE_NAME)
+
     # Copy media files to folder for production server
     out = run_bash(f'cp {setup_dir}/biomed_iot/media/default.jpg /var/www/biomed-iot/media/')
     print(out)
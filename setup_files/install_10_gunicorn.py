@@ -6,7 +6,8 @@ GUNICORN_INSTALL_LOG_FILE_NAME = 'install_10_gunicorn.log'
 def install_gunicorn():
 	"""
 	Installs and configures Gunicorn with systemd for Django applications.
-	Generates and deploys Gunicorn socket and service configurations.
+	Generates and deploys Gunicorn socket and service configurations
+	and the provisioning worker service (two instances) and the export worker service.
 	"""
 	setup_dir = get_setup_dir()
 	conf_dir = get_conf_path()
@@ -20,6 +21,15 @@ def install_gunicorn():
 		f'cp {setup_dir}/setup_files/tmp/gunicorn.service /etc/systemd/system/gunicorn.service',
 		'systemctl start gunicorn.socket',
 		'systemctl enable gunicorn.socket',
+		# Background worker creating the MQTT, InfluxDB and Grafana accounts of new users
+		f'bash {conf_dir}/tmp.biomed-iot-worker.service.sh {linux_user} {setup_dir} > {setup_dir}/setup_files/tmp/biomed-iot-worker@.service',  # noqa: E501
+		f'cp {setup_dir}/setup_files/tmp/biomed-iot-worker@.service /etc/systemd/system/biomed-iot-worker@.service',
+		# Background worker writing large data exports to files (one instance: one big export at a time)
+		f'bash {conf_dir}/tmp.biomed-iot-export-worker.service.sh {linux_user} {setup_dir} > {setup_dir}/setup_files/tmp/biomed-iot-export-worker@.service',  # noqa: E501
+		f'cp {setup_dir}/setup_files/tmp/biomed-iot-export-worker@.service /etc/systemd/system/biomed-iot-export-worker@.service',  # noqa: E501
+		'systemctl daemon-reload',
+		'systemctl enable --now biomed-iot-worker@1 biomed-iot-worker@2',
+		'systemctl enable --now biomed-iot-export-worker@1',
 	]
 
 	for command in commands:
@@ -0,0 +1,122 @@
+# ruff: noqa: E402
+"""
+Microbenchmark for the CSV export of InfluxDataManager (users/services/influx_data_utils.py).
+
+Feeds synthetic FluxRecords (no InfluxDB needed) through the current _row_generator and through the
+previous per-row implementation (one DictWriter.writerow, localtime() and bytes chunk per row), checks
+that both produce the same CSV and reports rows/s, chunk count and the speed-up.
+
+Example
+-------
+python3 csv_export_benchmark.py --rows 500000 --tags 3 --tz Europe/Berlin
+"""
+
+import io
+import csv
+import sys
+import time
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+# Current script directory: biomed-iot/tests
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent / 'biomed_iot'))
+
+import django
+from django.conf import settings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the CSV export row generator.')
+    parser.add_argument('--rows', type=int, default=200_000, help='number of records')
+    parser.add_argument('--tags', type=int, default=3, help='tag columns per record')
+    parser.add_argument('--tz', default='Europe/Berlin', help='time zone the times are converted to')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per implementation, the best one counts')
+    return parser.parse_args()
+
+
+def make_records(count, tag_count):
+    from influxdb_client.client.flux_table import FluxRecord
+    start = datetime(2024, 3, 30, tzinfo=dt_timezone.utc)  # includes a DST change in Europe
+    records = []
+    for i in range(count):
+        values = {
+            'result': '_result',
+            'table': 0,
+            '_start': start,
+            '_stop': start,
+            '_time': start + timedelta(seconds=i, microseconds=(i % 7) * 1000),
+            '_value': i * 0.25,
+            '_field': 'temperature',
+            '_measurement': 'sensor',
+        }
+        for t in range(tag_count):
+            values[f'tag{t}'] = f'value-{t}-{i % 13}'
+        records.append(FluxRecord(0, values))
+    return records
+
+
+def legacy_row_generator(record_stream):
+    """The implementation before buffering, kept as the baseline."""
+    from django.utils import timezone
+    buffer = io.StringIO()
+    csv_writer = None
+    header_fields = None
+    local_tz = timezone.get_current_timezone()
+    for record in record_stream:
+        local_time = timezone.localtime(record.get_time(), local_tz)
+        row = {'time': local_time.isoformat(), 'field': record['_field'], 'value': record['_value']}
+        for key, value in record.values.items():
+            if key in {'result', 'table'} or key.startswith('_'):
+                continue
+            row[key] = value
+        if header_fields is None:
+            header_fields = sorted(row.keys())
+            csv_writer = csv.DictWriter(buffer, fieldnames=header_fields)
+            header_labels = {key: key if key in ('time', 'field', 'value') else f'{key} (tag)' for key in header_fields}
+            buffer.write('sep=,\n')
+            csv_writer.writerow(header_labels)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+        csv_writer.writerow(row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+    if header_fields is None:
+        raise ValueError('No matching points')
+
+
+def measure(name, generator_factory, records, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = list(generator_factory(iter(records)))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    size = sum(len(chunk) for chunk in chunks)
+    rate = len(records) / best
+    print(f'{name:>8}: {rate:12,.0f} rows/s  {len(chunks):9,} chunks  {size / 1e6:7.1f} MB  {best:.2f} s')
+    return best, b''.join(chunks)
+
+
+def main():
+    args = parse_args()
+    settings.configure(USE_TZ=True, TIME_ZONE=args.tz)
+    django.setup()
+    from users.services.influx_data_utils import InfluxDataManager
+
+    records = make_records(args.rows, args.tags)
+    print(f'{args.rows:,} records, {args.tags} tag(s), time zone {args.tz}')
+    manager = InfluxDataManager.__new__(InfluxDataManager)  # _row_generator needs no bucket or token
+    legacy_time, legacy_csv = measure('legacy', legacy_row_generator, records, args.repeat)
+    current_time, current_csv = measure('current', manager._row_generator, records, args.repeat)
+    if legacy_csv != current_csv:
+        print('ERROR: the outputs differ')
+        sys.exit(1)
+    print(f'identical output, speed-up {legacy_time / current_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
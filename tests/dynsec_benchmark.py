@@ -0,0 +1,340 @@
+# ruff: noqa: E402
+"""
+Throughput and latency benchmark for the Dynamic Security wrappers (MosquittoDynSec, AsyncMosquittoDynSec).
+
+Runs a mix of create/modify/delete/get client operations with a given concurrency against either the
+in-process stand-in (tests/dynsec_fake_broker.py) or a real broker, and reports ops/s, p50/p95/p99 latency,
+timeouts and errors per operation. Results can be written as JSON to compare runs before and after changes.
+
+Implementations:
+    threaded  one shared MosquittoDynSec, one thread per concurrent operation
+    async     one AsyncMosquittoDynSec, concurrent coroutines on one event loop
+    per-call  a new MosquittoDynSec connection per operation (the pattern used before the shared connection).
+              On a broker with 'use_username_as_clientid true', concurrent connections kick each other out.
+
+All clients created by the benchmark start with 'bench-' and are deleted again at the end.
+
+Examples
+--------
+# Stand-in broker with 2 ms latency, 50 concurrent operations, default mix
+python3 dynsec_benchmark.py --target fake --latency 0.002 --concurrency 50 --ops 5000
+
+# Real broker (credentials from /etc/biomed-iot/config.toml), async implementation, write results
+python3 dynsec_benchmark.py --target broker --impl async --mix get=8,create=1,delete=1 --json after.json
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import statistics
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Current script directory: biomed-iot/tests
+script_dir = Path(__file__).resolve().parent
+
+# Add biomed_iot/users/services (for mosquitto_dynsec) and this directory (for dynsec_fake_broker)
+sys.path.append(str(script_dir.parent / 'biomed_iot' / 'users' / 'services'))
+sys.path.append(str(script_dir))
+
+from mosquitto_dynsec import MosquittoDynSec, AsyncMosquittoDynSec
+from dynsec_fake_broker import FakeDynSecBroker
+
+OPERATIONS = ('create', 'modify', 'delete', 'get')
+
+
+def parse_mix(text):
+	mix = {}
+	for part in text.split(','):
+		name, _, weight = part.partition('=')
+		if name not in OPERATIONS:
+			raise argparse.ArgumentTypeError(f'unknown operation {name!r}, use {", ".join(OPERATIONS)}')
+		mix[name] = float(weight or 1)
+	return mix
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(description='Benchmark the Mosquitto Dynamic Security wrappers.')
+	parser.add_argument('--target', choices=('fake', 'broker'), default='fake', help='stand-in or real broker')
+	parser.add_argument('--impl', choices=('threaded', 'async', 'per-call'), default='threaded')
+	parser.add_argument('--mix', type=parse_mix, default='create=1,modify=1,delete=1,get=4',
+		help='weighted operation mix, e.g. get=8,create=1,delete=1')
+	parser.add_argument('--concurrency', type=int, default=20, help='operations in flight at the same time')
+	parser.add_argument('--clients', type=int, default=1000, help='clients created before the measurement')
+	parser.add_argument('--ops', type=int, default=2000, help='number of measured operations')
+	parser.add_argument('--host', default='localhost', help='broker host (target broker)')
+	parser.add_argument('--port', type=int, default=1884, help='broker port (target broker)')
+	parser.add_argument('--config', default='/etc/biomed-iot/config.toml', help='credentials (target broker)')
+	parser.add_argument('--latency', type=float, default=0.0, help='reply latency in seconds (target fake)')
+	parser.add_argument('--jitter', type=float, default=0.0, help='max. extra latency in seconds (target fake)')
+	parser.add_argument('--drop-rate', type=float, default=0.0, help='request drop probability (target fake)')
+	parser.add_argument('--error-rate', type=float, default=0.0, help='command error probability (target fake)')
+	parser.add_argument('--timeout', type=float, default=None, help='override msg_received_timeout_seconds')
+	parser.add_argument('--seed', type=int, default=None, help='random seed for the operation sequence')
+	parser.add_argument('--label', default='', help='free text stored in the JSON results')
+	parser.add_argument('--json', dest='json_path', help='write results as JSON to this file ("-" for stdout)')
+	args = parser.parse_args()
+	if isinstance(args.mix, str):
+		args.mix = parse_mix(args.mix)
+	return args
+
+
+class ClientPool:
+	"""Usernames of existing benchmark clients. Thread-safe, also used from the event loop."""
+
+	def __init__(self, prefix):
+		self.prefix = prefix
+		self.usernames = []
+		self.counter = 0
+		self.lock = threading.Lock()
+
+	def new_username(self):
+		with self.lock:
+			self.counter += 1
+			return f'{self.prefix}{self.counter:07d}'
+
+	def add(self, username):
+		with self.lock:
+			self.usernames.append(username)
+
+	def take(self):
+		# removes a random username, so no two deletes hit the same client
+		with self.lock:
+			if not self.usernames:
+				return None
+			index = random.randrange(len(self.usernames))
+			self.usernames[index], self.usernames[-1] = self.usernames[-1], self.usernames[index]
+			return self.usernames.pop()
+
+	def pick(self):
+		with self.lock:
+			return random.choice(self.usernames) if self.usernames else None
+
+
+def operation_command(operation, pool):
+	"""Return (function name, args, kwargs, username to add to the pool on success) for one operation."""
+	if operation == 'create' or not pool.usernames:
+		username = pool.new_username()
+		return 'create_client', (username, 'bench-password'), {'textname': 'Benchmark Client'}, username
+	if operation == 'delete':
+		return 'delete_client', (pool.take(),), {}, None
+	if operation == 'modify':
+		return 'modify_client', (pool.pick(),), {'textname': f'Benchmark {random.randrange(1000)}'}, None
+	return 'get_client', (pool.pick(),), {}, None
+
+
+def classify(result, error):
+	if error is not None:
+		return 'error'
+	success, response, _ = result
+	if response is None:
+		return 'timeout'
+	return 'ok' if success else 'error'
+
+
+def run_threaded(args, credentials, operations, pool, per_call=False):
+	samples = []
+	shared = None if per_call else MosquittoDynSec(*credentials)
+	if shared is not None and args.timeout:
+		shared.msg_received_timeout_seconds = args.timeout
+
+	def run_operation(operation):
+		function_name, call_args, call_kwargs, new_username = operation_command(operation, pool)
+		started = time.perf_counter()
+		dynsec = shared
+		result = error = None
+		try:
+			# per-call: connecting and disconnecting are part of the latency, as they were for every view request
+			dynsec = dynsec or MosquittoDynSec(*credentials)
+			result = getattr(dynsec, function_name)(*call_args, **call_kwargs)
+		except Exception as e:
+			error = e
+		finally:
+			if shared is None and dynsec is not None:
+				dynsec.disconnect()
+			elapsed = time.perf_counter() - started
+		outcome = classify(result, error)
+		if outcome == 'ok' and new_username:
+			pool.add(new_username)
+		samples.append((operation, elapsed, outcome))
+
+	started = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+		list(executor.map(run_operation, operations))
+	wall_time = time.perf_counter() - started
+	if shared is not None:
+		shared.disconnect()
+	return samples, wall_time
+
+
+def run_async(args, credentials, operations, pool):
+	samples = []
+
+	async def main():
+		async with AsyncMosquittoDynSec(*credentials) as dynsec:
+			if args.timeout:
+				dynsec.msg_received_timeout_seconds = args.timeout
+			semaphore = asyncio.Semaphore(args.concurrency)
+
+			async def run_operation(operation):
+				async with semaphore:
+					function_name, call_args, call_kwargs, new_username = operation_command(operation, pool)
+					started = time.perf_counter()
+					result = error = None
+					try:
+						result = await getattr(dynsec, function_name)(*call_args, **call_kwargs)
+					except Exception as e:
+						error = e
+					elapsed = time.perf_counter() - started
+					outcome = classify(result, error)
+					if outcome == 'ok' and new_username:
+						pool.add(new_username)
+					samples.append((operation, elapsed, outcome))
+
+			started = time.perf_counter()
+			await asyncio.gather(*(run_operation(operation) for operation in operations))
+			return time.perf_counter() - started
+
+	wall_time = asyncio.run(main())
+	return samples, wall_time
+
+
+def prefill(dynsec, pool, count, batch_size=500):
+	for start in range(0, count, batch_size):
+		batch = dynsec.batch()
+		usernames = [pool.new_username() for _ in range(min(batch_size, count - start))]
+		for username in usernames:
+			batch.create_client(username, 'bench-password', textname='Benchmark Client')
+		for username, (success, _) in zip(usernames, batch.execute()):
+			if success:
+				pool.add(username)
+
+
+def cleanup(dynsec, prefix, batch_size=500):
+	usernames = [name for name in dynsec.iter_clients(page_size=1000) if name.startswith(prefix)]
+	for start in range(0, len(usernames), batch_size):
+		batch = dynsec.batch()
+		for username in usernames[start:start + batch_size]:
+			batch.delete_client(username)
+		batch.execute()
+	return len(usernames)
+
+
+def percentile_ms(values, percent):
+	if not values:
+		return None
+	if len(values) == 1:
+		return round(values[0] * 1000, 3)
+	return round(statistics.quantiles(values, n=100, method='inclusive')[percent - 1] * 1000, 3)
+
+
+def summarize(samples, wall_time):
+	latencies = [elapsed for _, elapsed, _ in samples]
+	summary = {
+		'ops': len(samples),
+		'ops_per_s': round(len(samples) / wall_time, 1) if wall_time else None,
+		'p50_ms': percentile_ms(latencies, 50),
+		'p95_ms': percentile_ms(latencies, 95),
+		'p99_ms': percentile_ms(latencies, 99),
+		'timeouts': sum(1 for _, _, outcome in samples if outcome == 'timeout'),
+		'errors': sum(1 for _, _, outcome in samples if outcome == 'error'),
+	}
+	return summary
+
+
+def main():
+	args = parse_args()
+	if args.seed is not None:
+		random.seed(args.seed)
+
+	broker = None
+	if args.target == 'fake':
+		broker = FakeDynSecBroker(
+			'bench-admin',
+			'bench-admin',
+			latency=args.latency,
+			jitter=args.jitter,
+			drop_rate=args.drop_rate,
+			error_rate=args.error_rate,
+		)
+		host, port = broker.start()
+		credentials = ('bench-admin', 'bench-admin', host, port)
+	else:
+		import tomllib
+
+		with open(args.config, 'rb') as f:
+			config = tomllib.load(f)
+		credentials = (
+			config['mosquitto']['DYNSEC_ADMIN_USER'],
+			config['mosquitto']['DYNSEC_ADMIN_PW'],
+			args.host,
+			args.port,
+		)
+
+	prefix = f'bench-{int(time.time())}-'
+	pool = ClientPool(prefix)
+	names, weights = zip(*args.mix.items())
+	operations = random.choices(names, weights=weights, k=args.ops)
+
+	setup_dynsec = MosquittoDynSec(*credentials)
+	try:
+		prefill(setup_dynsec, pool, args.clients)
+	finally:
+		setup_dynsec.disconnect()
+	print(f'{len(pool.usernames)} clients created, running {args.ops} operations ({args.impl}, '
+		f'concurrency {args.concurrency}, target {args.target})')
+
+	try:
+		if args.impl == 'async':
+			samples, wall_time = run_async(args, credentials, operations, pool)
+		else:
+			samples, wall_time = run_threaded(args, credentials, operations, pool, per_call=args.impl == 'per-call')
+	finally:
+		cleanup_dynsec = MosquittoDynSec(*credentials)
+		try:
+			removed = cleanup(cleanup_dynsec, prefix)
+		finally:
+			cleanup_dynsec.disconnect()
+		if broker is not None:
+			broker.stop()
+
+	results = {
+		'label': args.label,
+		'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+		'host': platform.node(),
+		'python': platform.python_version(),
+		'params': {
+			key: value for key, value in vars(args).items() if key not in ('json_path', 'label', 'config')
+		},
+		'wall_time_s': round(wall_time, 3),
+		'total': summarize(samples, wall_time),
+		'per_operation': {
+			operation: summarize([s for s in samples if s[0] == operation], wall_time)
+			for operation in sorted(set(operations))
+		},
+	}
+
+	columns = ('ops', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms', 'timeouts')
+	print(f'{"operation":<10}' + ''.join(f'{column:>10}' for column in columns) + f'{"errors":>8}')
+	for name, summary in [*results['per_operation'].items(), ('total', results['total'])]:
+		print(
+			f'{name:<10}{summary["ops"]:>10}{summary["ops_per_s"] or 0:>10}{summary["p50_ms"] or 0:>10}'
+			f'{summary["p95_ms"] or 0:>10}{summary["p99_ms"] or 0:>10}{summary["timeouts"]:>10}{summary["errors"]:>8}'
+		)
+	print(f'{removed} benchmark clients removed')
+
+	if args.json_path == '-':
+		print(json.dumps(results, indent=2))
+	elif args.json_path:
+		with open(args.json_path, 'w') as f:
+			json.dump(results, f, indent=2)
+		print(f'Results written to {args.json_path}')
+
+
+if __name__ == '__main__':
+	main()
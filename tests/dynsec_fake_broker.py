@@ -0,0 +1,705 @@
+"""
+In-process stand-in for a Mosquitto broker running the Dynamic Security Plugin (DSP).
+
+Speaks just enough MQTT 3.1.1 (CONNECT, PUBLISH QoS 0-2, SUBSCRIBE, UNSUBSCRIBE, PINGREQ, DISCONNECT)
+for paho-mqtt clients like MosquittoDynSec to connect, send commands to '$CONTROL/dynamic-security/v1'
+and receive replies on '$CONTROL/dynamic-security/v1/response'. Clients, roles and groups are kept in memory.
+Like the Biomed IoT broker config ('use_username_as_clientid true'), a second connection with the same
+username takes over the first one.
+
+Latency and failures can be injected to benchmark and regression-test the DynSec wrappers on any Linux box
+without /etc/biomed-iot/config.toml or a real Mosquitto installation.
+
+Examples
+--------
+# Run standalone on port 1884 with 2 ms command latency
+python3 dynsec_fake_broker.py --port 1884 --admin-user admin --admin-password admin --latency 0.002
+
+# Use in a script
+broker = FakeDynSecBroker(admin_username='admin', admin_password='admin', latency=0.001)
+host, port = broker.start()
+dynsec = MosquittoDynSec('admin', 'admin', host, port)
+...
+broker.stop()
+
+# Django managers (MqttMetaDataManager, MqttClientManager) connect to localhost:1884 with DYNSEC_ADMIN_USER and
+# DYNSEC_ADMIN_PW from /etc/biomed-iot/config.toml, so start the stand-in there with the same credentials:
+broker = FakeDynSecBroker(admin_username=admin_user, admin_password=admin_pw, port=1884, error_rate=0.05)
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import random
+import struct
+import threading
+import time
+
+CONTROL_TOPIC = '$CONTROL/dynamic-security/v1'
+RESPONSE_TOPIC = '$CONTROL/dynamic-security/v1/response'
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+
+def topic_matches(subscription, topic):
+	"""Return True if 'topic' matches the MQTT subscription pattern (supports '+' and '#')."""
+	sub_levels = subscription.split('/')
+	topic_levels = topic.split('/')
+	for index, sub_level in enumerate(sub_levels):
+		if sub_level == '#':
+			return True
+		if index >= len(topic_levels):
+			return False
+		if sub_level != '+' and sub_level != topic_levels[index]:
+			return False
+	return len(sub_levels) == len(topic_levels)
+
+
+class DynSecState:
+	"""
+	In-memory model of the DSP configuration (what Mosquitto stores in dynamic-security.json)
+	and the command handlers operating on it. Error strings follow the real plugin where it matters
+	to the wrappers (e.g. '... already exists' is treated as success by MosquittoDynSec).
+	"""
+
+	def __init__(self, admin_username, admin_password):
+		self.lock = threading.Lock()
+		self.default_acl_access = [
+			{'acltype': 'publishClientSend', 'allow': False},
+			{'acltype': 'publishClientReceive', 'allow': True},
+			{'acltype': 'subscribe', 'allow': False},
+			{'acltype': 'unsubscribe', 'allow': True},
+		]
+		self.anonymous_group = None
+		self.roles = {
+			'admin': {
+				'rolename': 'admin',
+				'acls': [
+					{'acltype': acltype, 'topic': '$CONTROL/dynamic-security/#', 'priority': 0, 'allow': True}
+					for acltype in ('publishClientSend', 'publishClientReceive', 'subscribePattern')
+				],
+			}
+		}
+		self.groups = {}
+		self.clients = {
+			admin_username: {
+				'username': admin_username,
+				'password': admin_password,
+				'roles': [{'rolename': 'admin'}],
+				'groups': [],
+			}
+		}
+
+	# ─────────────────────────── Helpers ────────────────────────────
+	def authenticate(self, username, password):
+		with self.lock:
+			client = self.clients.get(username)
+			return client is not None and not client.get('disabled') and client.get('password') == password
+
+	def is_admin(self, username):
+		with self.lock:
+			client = self.clients.get(username)
+			return client is not None and any(role['rolename'] == 'admin' for role in client.get('roles', []))
+
+	@staticmethod
+	def _public_client(client):
+		return {key: value for key, value in client.items() if key != 'password'}
+
+	@staticmethod
+	def _role_list(roles):
+		return [{'rolename': role['rolename'], 'priority': role.get('priority', -1)} for role in roles or []]
+
+	@staticmethod
+	def _listing(items, command, key, public):
+		count = command.get('count', -1)
+		offset = command.get('offset', 0)
+		names = sorted(items)
+		page = names[offset:] if count is None or count < 0 else names[offset:offset + count]
+		if command.get('verbose'):
+			entries = [public(items[name]) for name in page]
+		else:
+			entries = page
+		return {'totalCount': len(names), key: entries}
+
+	# ─────────────────────────── Command dispatch ────────────────────────────
+	def execute(self, command):
+		"""Execute a single DSP command. Returns (data, error), either of which may be None."""
+		handler = getattr(self, f'cmd_{command.get("command")}', None)
+		if handler is None:
+			return None, 'Unknown command'
+		with self.lock:
+			return handler(command)
+
+	def cmd_setDefaultACLAccess(self, command):
+		for acl in command.get('acls', []):
+			for entry in self.default_acl_access:
+				if entry['acltype'] == acl.get('acltype'):
+					entry['allow'] = acl.get('allow', False)
+		return None, None
+
+	def cmd_getDefaultACLAccess(self, command):
+		return {'acls': copy.deepcopy(self.default_acl_access)}, None
+
+	def cmd_createClient(self, command):
+		username = command.get('username')
+		if not username:
+			return None, 'Invalid/missing username'
+		if username in self.clients:
+			return None, 'Client already exists'
+		for role in command.get('roles') or []:
+			if role['rolename'] not in self.roles:
+				return None, 'Role not found'
+		for group in command.get('groups') or []:
+			if group['groupname'] not in self.groups:
+				return None, 'Group not found'
+		client = {'username': username, 'password': command.get('password')}
+		for key in ('clientid', 'textname', 'textdescription'):
+			if key in command:
+				client[key] = command[key]
+		client['roles'] = self._role_list(command.get('roles'))
+		client['groups'] = [
+			{'groupname': group['groupname'], 'priority': group.get('priority', -1)}
+			for group in command.get('groups') or []
+		]
+		self.clients[username] = client
+		for group in client['groups']:
+			self.groups[group['groupname']]['clients'].append({'username': username, 'priority': group['priority']})
+		return None, None
+
+	def cmd_deleteClient(self, command):
+		client = self.clients.pop(command.get('username'), None)
+		if client is None:
+			return None, 'Client not found'
+		for group in self.groups.values():
+			group['clients'] = [entry for entry in group['clients'] if entry['username'] != client['username']]
+		return None, None
+
+	def cmd_enableClient(self, command):
+		client = self.clients.get(command.get('username'))
+		if client is None:
+			return None, 'Client not found'
+		client.pop('disabled', None)
+		return None, None
+
+	def cmd_disableClient(self, command):
+		client = self.clients.get(command.get('username'))
+		if client is None:
+			return None, 'Client not found'
+		client['disabled'] = True
+		return None, None
+
+	def cmd_getClient(self, command):
+		client = self.clients.get(command.get('username'))
+		if client is None:
+			return None, 'Client not found'
+		return {'client': copy.deepcopy(self._public_client(client))}, None
+
+	def cmd_listClients(self, command):
+		return self._listing(self.clients, command, 'clients', lambda c: copy.deepcopy(self._public_client(c))), None
+
+	def cmd_modifyClient(self, command):
+		client = self.clients.get(command.get('username'))
+		if client is None:
+			return None, 'Client not found'
+		for key in ('clientid', 'password', 'textname', 'textdescription'):
+			if key in command:
+				client[key] = command[key]
+		if 'roles' in command:
+			for role in command['roles']:
+				if role['rolename'] not in self.roles:
+					return None, 'Role not found'
+			client['roles'] = self._role_list(command['roles'])
+		if 'groups' in command:
+			client['groups'] = [
+				{'groupname': group['groupname'], 'priority': group.get('priority', -1)} for group in command['groups']
+			]
+		return None, None
+
+	def cmd_setClientId(self, command):
+		client = self.clients.get(command.get('username'))
+		if client is None:
+			return None, 'Client not found'
+		client['clientid'] = command.get('clientid', '')
+		return None, None
+
+	def cmd_setClientPassword(self, command):
+		client = self.clients.get(command.get('username'))
+		if client is None:
+			return None, 'Client not found'
+		client['password'] = command.get('password')
+		return None, None
+
+	def cmd_addClientRole(self, command):
+		client = self.clients.get(command.get('username'))
+		if client is None:
+			return None, 'Client not found'
+		if command.get('rolename') not in self.roles:
+			return None, 'Role not found'
+		if any(role['rolename'] == command['rolename'] for role in client['roles']):
+			return None, 'Client is already in this role'
+		client['roles'].append({'rolename': command['rolename'], 'priority': command.get('priority', -1)})
+		return None, None
+
+	def cmd_removeClientRole(self, command):
+		client = self.clients.get(command.get('username'))
+		if client is None:
+			return None, 'Client not found'
+		client['roles'] = [role for role in client['roles'] if role['rolename'] != command.get('rolename')]
+		return None, None
+
+	def cmd_createGroup(self, command):
+		groupname = command.get('groupname')
+		if groupname in self.groups:
+			return None, 'Group already exists'
+		self.groups[groupname] = {'groupname': groupname, 'roles': self._role_list(command.get('roles')), 'clients': []}
+		return None, None
+
+	def cmd_deleteGroup(self, command):
+		if self.groups.pop(command.get('groupname'), None) is None:
+			return None, 'Group not found'
+		return None, None
+
+	def cmd_getGroup(self, command):
+		group = self.groups.get(command.get('groupname'))
+		if group is None:
+			return None, 'Group not found'
+		return {'group': copy.deepcopy(group)}, None
+
+	def cmd_listGroups(self, command):
+		return self._listing(self.groups, command, 'groups', copy.deepcopy), None
+
+	def cmd_modifyGroup(self, command):
+		group = self.groups.get(command.get('groupname'))
+		if group is None:
+			return None, 'Group not found'
+		for key in ('textname', 'textdescription'):
+			if key in command:
+				group[key] = command[key]
+		if 'roles' in command:
+			group['roles'] = self._role_list(command['roles'])
+		if 'clients' in command:
+			group['clients'] = [
+				{'username': client['username'], 'priority': client.get('priority', -1)}
+				for client in command['clients']
+			]
+		return None, None
+
+	def cmd_addGroupClient(self, command):
+		group = self.groups.get(command.get('groupname'))
+		if group is None:
+			return None, 'Group not found'
+		if command.get('username') not in self.clients:
+			return None, 'Client not found'
+		if any(entry['username'] == command['username'] for entry in group['clients']):
+			return None, 'Client is already in this group'
+		group['clients'].append({'username': command['username'], 'priority': command.get('priority', -1)})
+		return None, None
+
+	def cmd_removeGroupClient(self, command):
+		group = self.groups.get(command.get('groupname'))
+		if group is None:
+			return None, 'Group not found'
+		group['clients'] = [entry for entry in group['clients'] if entry['username'] != command.get('username')]
+		return None, None
+
+	def cmd_addGroupRole(self, command):
+		group = self.groups.get(command.get('groupname'))
+		if group is None:
+			return None, 'Group not found'
+		if command.get('rolename') not in self.roles:
+			return None, 'Role not found'
+		if any(role['rolename'] == command['rolename'] for role in group['roles']):
+			return None, 'Group is already in this role'
+		group['roles'].append({'rolename': command['rolename'], 'priority': command.get('priority', -1)})
+		return None, None
+
+	def cmd_removeGroupRole(self, command):
+		group = self.groups.get(command.get('groupname'))
+		if group is None:
+			return None, 'Group not found'
+		group['roles'] = [role for role in group['roles'] if role['rolename'] != command.get('rolename')]
+		return None, None
+
+	def cmd_setAnonymousGroup(self, command):
+		if command.get('groupname') not in self.groups:
+			return None, 'Group not found'
+		self.anonymous_group = command['groupname']
+		return None, None
+
+	def cmd_getAnonymousGroup(self, command):
+		return {'group': {'groupname': self.anonymous_group}}, None
+
+	def cmd_createRole(self, command):
+		rolename = command.get('rolename')
+		if not rolename:
+			return None, 'Invalid/missing rolename'
+		if rolename in self.roles:
+			return None, 'Role already exists'
+		role = {'rolename': rolename, 'acls': copy.deepcopy(command.get('acls') or [])}
+		for key in ('textname', 'textdescription'):
+			if key in command:
+				role[key] = command[key]
+		self.roles[rolename] = role
+		return None, None
+
+	def cmd_getRole(self, command):
+		role = self.roles.get(command.get('rolename'))
+		if role is None:
+			return None, 'Role not found'
+		return {'role': copy.deepcopy(role)}, None
+
+	def cmd_listRoles(self, command):
+		return self._listing(self.roles, command, 'roles', copy.deepcopy), None
+
+	def cmd_modifyRole(self, command):
+		role = self.roles.get(command.get('rolename'))
+		if role is None:
+			return None, 'Role not found'
+		for key in ('textname', 'textdescription'):
+			if key in command:
+				role[key] = command[key]
+		if 'acls' in command:
+			role['acls'] = copy.deepcopy(command['acls'])
+		return None, None
+
+	def cmd_deleteRole(self, command):
+		if self.roles.pop(command.get('rolename'), None) is None:
+			return None, 'Role not found'
+		for owner in list(self.clients.values()) + list(self.groups.values()):
+			owner['roles'] = [role for role in owner['roles'] if role['rolename'] != command['rolename']]
+		return None, None
+
+	def cmd_addRoleACL(self, command):
+		role = self.roles.get(command.get('rolename'))
+		if role is None:
+			return None, 'Role not found'
+		acl_key = (command.get('acltype'), command.get('topic'))
+		if any((acl['acltype'], acl['topic']) == acl_key for acl in role['acls']):
+			return None, 'ACL with this topic already exists'
+		role['acls'].append({key: command.get(key) for key in ('acltype', 'topic', 'priority', 'allow')})
+		return None, None
+
+	def cmd_removeRoleACL(self, command):
+		role = self.roles.get(command.get('rolename'))
+		if role is None:
+			return None, 'Role not found'
+		role['acls'] = [
+			acl for acl in role['acls']
+			if not (acl['acltype'] == command.get('acltype') and acl['topic'] == command.get('topic'))
+		]
+		return None, None
+
+
+class _Session:
+	"""One MQTT connection on the fake broker."""
+
+	def __init__(self, reader, writer):
+		self.reader = reader
+		self.writer = writer
+		self.username = None
+		self.subscriptions = {}
+
+	def send(self, packet_type, flags, body):
+		length = len(body)
+		header = bytearray([(packet_type << 4) | flags])
+		while True:
+			byte = length % 128
+			length //= 128
+			header.append(byte | 0x80 if length else byte)
+			if not length:
+				break
+		if not self.writer.is_closing():
+			self.writer.write(bytes(header) + body)
+
+	def publish(self, topic, payload):
+		topic_bytes = topic.encode('utf-8')
+		self.send(PUBLISH, 0, struct.pack('!H', len(topic_bytes)) + topic_bytes + payload)
+
+	def close(self):
+		if not self.writer.is_closing():
+			self.writer.close()
+
+
+class FakeDynSecBroker:
+	"""
+	Minimal MQTT broker with an in-memory Dynamic Security Plugin, running its own asyncio loop in a thread.
+
+	Attributes:
+		latency (float): Seconds added before each DSP reply (per publish, not per command in a batch).
+		jitter (float): Uniformly distributed extra latency in seconds added on top of 'latency'.
+		drop_rate (float): Probability (0..1) that a DSP request is silently dropped (client runs into its timeout).
+		error_rate (float): Probability (0..1) that a single DSP command fails with 'Internal error'.
+		refuse_connections (bool): If True, new connections are rejected with CONNACK 'server unavailable'.
+		state (DynSecState): The in-memory DSP configuration (inspect or prefill it in tests).
+	"""
+
+	def __init__(
+		self,
+		admin_username='admin',
+		admin_password='admin',
+		host='127.0.0.1',
+		port=0,
+		latency=0.0,
+		jitter=0.0,
+		drop_rate=0.0,
+		error_rate=0.0,
+	):
+		self.host = host
+		self.port = port
+		self.latency = latency
+		self.jitter = jitter
+		self.drop_rate = drop_rate
+		self.error_rate = error_rate
+		self.refuse_connections = False
+		self.state = DynSecState(admin_username, admin_password)
+		self.sessions_by_username = {}
+		self.stats = {'connections': 0, 'takeovers': 0, 'requests': 0, 'commands': 0, 'dropped': 0}
+		self._loop = None
+		self._server = None
+		self._thread = None
+		self._started = threading.Event()
+
+	# ─────────────────────────── Lifecycle ────────────────────────────
+	def start(self):
+		"""Start the broker in a background thread. Returns (host, port) it listens on."""
+		self._thread = threading.Thread(target=self._run, name='fake-dynsec-broker', daemon=True)
+		self._thread.start()
+		self._started.wait(5)
+		return self.host, self.port
+
+	def stop(self):
+		if self._loop is None:
+			return
+		future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+		future.result(5)
+		self._loop.call_soon_threadsafe(self._loop.stop)
+		self._thread.join(5)
+		self._loop = None
+
+	def kick_all(self):
+		"""Drop every open connection (simulates a broker restart for reconnect tests)."""
+		if self._loop is not None:
+			self._loop.call_soon_threadsafe(self._close_all_sessions)
+
+	def _run(self):
+		self._loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self._loop)
+		server = asyncio.start_server(self._handle_connection, self.host, self.port)
+		self._server = self._loop.run_until_complete(server)
+		self.port = self._server.sockets[0].getsockname()[1]
+		self._started.set()
+		self._loop.run_forever()
+		self._loop.close()
+
+	async def _shutdown(self):
+		self._server.close()
+		self._close_all_sessions()
+		await self._server.wait_closed()
+
+	def _close_all_sessions(self):
+		for session in list(self.sessions_by_username.values()):
+			session.close()
+		self.sessions_by_username.clear()
+
+	# ─────────────────────────── MQTT protocol ────────────────────────────
+	@staticmethod
+	async def _read_packet(reader):
+		first = await reader.readexactly(1)
+		multiplier, length = 1, 0
+		while True:
+			byte = (await reader.readexactly(1))[0]
+			length += (byte & 0x7F) * multiplier
+			if not byte & 0x80:
+				break
+			multiplier *= 128
+		body = await reader.readexactly(length) if length else b''
+		return first[0] >> 4, first[0] & 0x0F, body
+
+	@staticmethod
+	def _read_string(body, offset):
+		(length,) = struct.unpack_from('!H', body, offset)
+		offset += 2
+		return body[offset:offset + length], offset + length
+
+	async def _handle_connection(self, reader, writer):
+		session = _Session(reader, writer)
+		try:
+			packet_type, _, body = await self._read_packet(reader)
+			if packet_type != CONNECT or not self._accept_connect(session, body):
+				return
+			while True:
+				packet_type, flags, body = await self._read_packet(reader)
+				if packet_type == DISCONNECT:
+					return
+				self._on_packet(session, packet_type, flags, body)
+				await writer.drain()
+		except (asyncio.IncompleteReadError, ConnectionError):
+			pass
+		finally:
+			if self.sessions_by_username.get(session.username) is session:
+				del self.sessions_by_username[session.username]
+			session.close()
+
+	def _on_packet(self, session, packet_type, flags, body):
+		if packet_type == PUBLISH:
+			self._on_publish(session, flags, body)
+		elif packet_type == PUBREL:
+			session.send(PUBCOMP, 0, body[:2])
+		elif packet_type == SUBSCRIBE:
+			self._on_subscribe(session, body)
+		elif packet_type == UNSUBSCRIBE:
+			self._on_unsubscribe(session, body)
+		elif packet_type == PINGREQ:
+			session.send(PINGRESP, 0, b'')
+
+	def _accept_connect(self, session, body):
+		_, offset = self._read_string(body, 0)  # protocol name
+		connect_flags = body[offset + 1]
+		offset += 4  # protocol level, connect flags, keep alive
+		_, offset = self._read_string(body, offset)  # client id
+		if connect_flags & 0x04:  # will flag: skip will topic and will message
+			_, offset = self._read_string(body, offset)
+			_, offset = self._read_string(body, offset)
+		username = password = None
+		if connect_flags & 0x80:
+			username, offset = self._read_string(body, offset)
+			username = username.decode('utf-8')
+		if connect_flags & 0x40:
+			password, offset = self._read_string(body, offset)
+			password = password.decode('utf-8')
+
+		if self.refuse_connections:
+			session.send(CONNACK, 0, bytes([0, 3]))  # server unavailable
+			return False
+		if not self.state.authenticate(username, password):
+			session.send(CONNACK, 0, bytes([0, 5]))  # not authorized
+			return False
+
+		# 'use_username_as_clientid true': a new connection with the same username kicks out the old one
+		previous = self.sessions_by_username.get(username)
+		if previous is not None:
+			self.stats['takeovers'] += 1
+			previous.close()
+		session.username = username
+		self.sessions_by_username[username] = session
+		self.stats['connections'] += 1
+		session.send(CONNACK, 0, bytes([0, 0]))
+		return True
+
+	def _on_subscribe(self, session, body):
+		packet_id = body[:2]
+		offset = 2
+		granted = bytearray()
+		while offset < len(body):
+			topic, offset = self._read_string(body, offset)
+			requested_qos = body[offset]
+			offset += 1
+			topic = topic.decode('utf-8')
+			if topic.startswith('$CONTROL/') and not self.state.is_admin(session.username):
+				granted.append(0x80)
+				continue
+			session.subscriptions[topic] = requested_qos
+			granted.append(0)  # all deliveries are QoS 0
+		session.send(SUBACK, 0, packet_id + bytes(granted))
+
+	def _on_unsubscribe(self, session, body):
+		packet_id = body[:2]
+		offset = 2
+		while offset < len(body):
+			topic, offset = self._read_string(body, offset)
+			session.subscriptions.pop(topic.decode('utf-8'), None)
+		session.send(UNSUBACK, 0, packet_id)
+
+	def _on_publish(self, session, flags, body):
+		qos = (flags >> 1) & 0x03
+		topic, offset = self._read_string(body, 0)
+		topic = topic.decode('utf-8')
+		if qos:
+			packet_id = body[offset:offset + 2]
+			offset += 2
+			session.send(PUBACK if qos == 1 else PUBREC, 0, packet_id)
+		payload = body[offset:]
+
+		if topic == CONTROL_TOPIC:
+			if self.state.is_admin(session.username):
+				self._on_control_request(session, payload)
+			return
+		for other in list(self.sessions_by_username.values()):
+			if any(topic_matches(subscription, topic) for subscription in other.subscriptions):
+				other.publish(topic, payload)
+
+	# ─────────────────────────── Dynamic Security Plugin ────────────────────────────
+	def _on_control_request(self, session, payload):
+		self.stats['requests'] += 1
+		if self.drop_rate and random.random() < self.drop_rate:
+			self.stats['dropped'] += 1
+			return
+		try:
+			commands = json.loads(payload.decode('utf-8'))['commands']
+		except (ValueError, KeyError, TypeError):
+			return
+
+		responses = []
+		for command in commands:
+			self.stats['commands'] += 1
+			if self.error_rate and random.random() < self.error_rate:
+				data, error = None, 'Internal error'
+			else:
+				data, error = self.state.execute(command)
+			response = {'command': command.get('command')}
+			if error:
+				response['error'] = error
+			if data is not None:
+				response['data'] = data
+			if 'correlationData' in command:
+				response['correlationData'] = command['correlationData']
+			responses.append(response)
+
+		reply = json.dumps({'responses': responses}).encode('utf-8')
+		delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+		if delay > 0:
+			self._loop.call_later(delay, self._reply, session, reply)
+		else:
+			self._reply(session, reply)
+
+	@staticmethod
+	def _reply(session, reply):
+		# The real plugin sends the reply only to the client that issued the command
+		if RESPONSE_TOPIC in session.subscriptions:
+			session.publish(RESPONSE_TOPIC, reply)
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(description='Run an in-memory Mosquitto Dynamic Security Plugin stand-in.')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=1884)
+	parser.add_argument('--admin-user', default='admin')
+	parser.add_argument('--admin-password', default='admin')
+	parser.add_argument('--latency', type=float, default=0.0, help='seconds added before each reply')
+	parser.add_argument('--jitter', type=float, default=0.0, help='max. random extra latency in seconds')
+	parser.add_argument('--drop-rate', type=float, default=0.0, help='probability to drop a request (0..1)')
+	parser.add_argument('--error-rate', type=float, default=0.0, help='probability to fail a command (0..1)')
+	return parser.parse_args()
+
+
+if __name__ == '__main__':
+	args = parse_args()
+	broker = FakeDynSecBroker(
+		admin_username=args.admin_user,
+		admin_password=args.admin_password,
+		host=args.host,
+		port=args.port,
+		latency=args.latency,
+		jitter=args.jitter,
+		drop_rate=args.drop_rate,
+		error_rate=args.error_rate,
+	)
+	host, port = broker.start()
+	print(f'Fake DynSec broker listening on {host}:{port} (admin user: {args.admin_user})')
+	try:
+		while True:
+			time.sleep(1)
+	except KeyboardInterrupt:
+		broker.stop()
@@ -0,0 +1,134 @@
+# ruff: noqa: E402
+"""
+Benchmark for the bulk onboarding of 'manage.py onboard_users' (users/services/onboarding.py).
+
+Generates a CSV with --users rows and runs it through read_user_rows, bulk_create_users and
+ProvisioningWorker.run_jobs against a temporary SQLite database. The MQTT, InfluxDB and Grafana steps are
+replaced by sleeps of the given per-account latency (no backends needed; the MQTT step still creates the
+user's MqttMetaData in a transaction like the real one), so the result shows what the command itself adds:
+password hashing, the bulk inserts, the per-step checkpoints of the concurrent jobs and the per-backend
+concurrency limits. Reports the time per phase and accounts/min.
+
+--sqlite-deferred opens transactions in SQLite's default DEFERRED mode with a 5 s busy timeout instead of the
+IMMEDIATE mode / 20 s timeout of settings.py, to compare how many jobs fail with 'database is locked'.
+--fast-hasher replaces PBKDF2 by MD5 to look at the provisioning phase alone.
+
+Example
+-------
+python3 onboarding_benchmark.py --users 500 --grafana-latency 0.4 --grafana-concurrency 4
+"""
+
+import io
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+# Current script directory: biomed-iot/tests
+script_dir = Path(__file__).resolve().parent
+sys.path.append(str(script_dir.parent / 'biomed_iot'))
+
+import django
+from django.conf import settings
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the bulk onboarding of users.')
+    parser.add_argument('--users', type=int, default=500, help='number of accounts')
+    parser.add_argument('--mqtt-latency', type=float, default=0.02, help='seconds per MQTT step')
+    parser.add_argument('--influxdb-latency', type=float, default=0.15, help='seconds per InfluxDB step')
+    parser.add_argument('--grafana-latency', type=float, default=0.4, help='seconds per Grafana step')
+    parser.add_argument('--mqtt-concurrency', type=int, default=8)
+    parser.add_argument('--influxdb-concurrency', type=int, default=4)
+    parser.add_argument('--grafana-concurrency', type=int, default=4)
+    parser.add_argument('--sqlite-deferred', action='store_true', help='SQLite default transaction mode')
+    parser.add_argument('--fast-hasher', action='store_true', help='MD5 instead of PBKDF2 (insecure, faster)')
+    return parser.parse_args()
+
+
+def configure(database_path, deferred, fast_hasher):
+    options = {'timeout': 5} if deferred else {'transaction_mode': 'IMMEDIATE', 'timeout': 20}
+    hashers = ['django.contrib.auth.hashers.MD5PasswordHasher'] if fast_hasher else None
+    settings.configure(
+        **({'PASSWORD_HASHERS': hashers} if hashers else {}),
+        INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes', 'users.apps.UsersConfig'],
+        AUTH_USER_MODEL='users.CustomUser',
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': database_path, 'OPTIONS': options}},
+        USE_TZ=True,
+    )
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def make_csv(count):
+    lines = ['username,email']
+    lines += [f'bench{i},bench{i}@example.com' for i in range(count)]
+    return io.StringIO('\n'.join(lines) + '\n')
+
+
+def sleeping_step(seconds, database_part=None):
+    def step(job):
+        if database_part is not None:
+            database_part(job)
+        time.sleep(seconds)
+    return step
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        configure(str(Path(tmp_dir) / 'db.sqlite3'), args.sqlite_deferred, args.fast_hasher)
+        from users.models import ProvisioningJob
+        from users.services import provisioning
+        from users.services.onboarding import read_user_rows, bulk_create_users
+        from users.services.mosquitto_utils import MqttMetaDataManager
+
+        steps = {
+            ProvisioningJob.KIND_PROVISION: [
+                # with the transaction of the real step (read, then insert the user's MqttMetaData)
+                ('mqtt', sleeping_step(args.mqtt_latency, lambda job: MqttMetaDataManager(job.user))),
+                ('influxdb', sleeping_step(args.influxdb_latency)),
+                ('grafana', sleeping_step(args.grafana_latency)),
+            ],
+        }
+        step_limits = {
+            'mqtt': args.mqtt_concurrency,
+            'influxdb': args.influxdb_concurrency,
+            'grafana': args.grafana_concurrency,
+        }
+        started = time.perf_counter()
+        rows = read_user_rows(make_csv(args.users))
+        read_at = time.perf_counter()
+        worker = provisioning.ProvisioningWorker(step_limits=step_limits)
+        created = bulk_create_users(rows, worker_id=worker.worker_id)
+        created_at = time.perf_counter()
+        with mock.patch.dict(provisioning.JOB_STEPS, steps):
+            results = worker.run_jobs([job for _, job in created], max_workers=sum(step_limits.values()))
+        done_at = time.perf_counter()
+
+    failed = [job for job, status in results if status != ProvisioningJob.STATUS_DONE]
+    # the slowest backend bounds the provisioning phase
+    bound = max(
+        args.users * latency / limit
+        for latency, limit in (
+            (args.mqtt_latency, args.mqtt_concurrency),
+            (args.influxdb_latency, args.influxdb_concurrency),
+            (args.grafana_latency, args.grafana_concurrency),
+        )
+    )
+    print(f'{args.users} accounts, SQLite {"DEFERRED" if args.sqlite_deferred else "IMMEDIATE"}')
+    print(f'  read and validate:  {read_at - started:7.2f} s')
+    print(f'  hash and insert:    {created_at - read_at:7.2f} s')
+    print(f'  provision:          {done_at - created_at:7.2f} s  (slowest backend alone: {bound:.2f} s)')
+    per_minute = len(created) / ((done_at - started) / 60)
+    print(f'  total:              {done_at - started:7.2f} s  ({per_minute:.0f} accounts/min)')
+    print(f'  failed jobs:        {len(failed)}')
+    for job in failed[:5]:
+        print(f'    {job.last_error}')
+
+
+if __name__ == '__main__':
+    main()